@@ -1,12 +1,17 @@
+import datetime
+from functools import partial
 from os.path import dirname
+from typing import Any
 
-from flask import Blueprint, make_response, render_template, request
+from flask import Blueprint, jsonify, make_response, render_template, request, url_for
 from markupsafe import Markup
 
 from . import comment_form
 
 
-def create_blog_blueprint(db, blog_prefix: str, locale_func):
+def create_blog_blueprint(
+    db, blog_prefix: str, locale_func, posts_per_page: int = 20, max_suggestions: int = 20
+):
     url_prefix = blog_prefix
     blog = Blueprint(
         "blog",
@@ -23,19 +28,78 @@ def create_blog_blueprint(db, blog_prefix: str, locale_func):
     def page_not_found(e):
         return render_template("404.html", title="404"), 404
 
+    def render_posts_page(fetch_posts, allow_empty=False, **template_args):
+        """Renders one page of posts listed by `fetch_posts(offset, limit)`,
+        selected by the `page` query parameter.
+        """
+        page = max(request.args.get("page", 1, type=int), 1)
+        offset = (page - 1) * posts_per_page
+        # one extra post tells whether there is a next page without counting all posts
+        posts = fetch_posts(offset, posts_per_page + 1)
+        if not posts and (page > 1 or not allow_empty):
+            return page_not_found(f"no posts on page {page}")
+
+        view_args = request.view_args or {}
+        query_args = {key: value for key, value in request.args.items() if key != "page"}
+        endpoint = request.endpoint or "blog.all_posts"
+
+        def page_url(page):
+            url_args: dict[str, Any] = {**view_args, **query_args, "page": page}
+            return url_for(endpoint, **url_args)
+
+        prev_url = page_url(page - 1) if page > 1 else None
+        next_url = page_url(page + 1) if len(posts) > posts_per_page else None
+        return render_template(
+            "blog.html",
+            posts=posts[:posts_per_page],
+            prev_url=prev_url,
+            next_url=next_url,
+            **template_args,
+        )
+
     @blog.route("/", methods=["GET"])
     def all_posts():
         lang = locale_func()
-        posts = db.get_all_posts(lang)
-        if not posts:
-            return page_not_found("no posts")
-        posts_sorted = sorted(posts, reverse=True)
-        return render_template("blog.html", posts=posts_sorted)
+        return render_posts_page(partial(db.get_post_summaries, lang))
+
+    @blog.route("/search", methods=["GET"])
+    def search():
+        lang = locale_func()
+        query = request.args.get("q", "").strip()
+        if not query:
+            return render_template("blog.html", posts=[], search_query="")
+        return render_posts_page(
+            partial(db.search_posts, lang, query),
+            allow_empty=True,
+            search_query=query,
+            subtitle=f" - search: {query}",
+        )
+
+    @blog.route("/search/suggestions", methods=["GET"])
+    def search_suggestions():
+        """Lists titles of posts and tags completing the `q` prefix, as JSON."""
+        lang = locale_func()
+        limit = min(max(request.args.get("limit", 10, type=int), 0), max_suggestions)
+        suggestions = db.get_search_suggestions(lang, request.args.get("q", ""), limit)
+        return jsonify(
+            [
+                {
+                    "type": suggestion.kind,
+                    "text": suggestion.text,
+                    "url": (
+                        url_for("blog.get_post", post_slug=suggestion.target)
+                        if suggestion.kind == "post"
+                        else url_for("blog.get_posts_from_tag", tag=suggestion.target)
+                    ),
+                }
+                for suggestion in suggestions
+            ]
+        )
 
     @blog.route("/feed", methods=["GET"])
     def get_feed():
         lang = locale_func()
-        response = make_response(render_template("feed.xml", posts=db.get_all_posts(lang)))
+        response = make_response(render_template("feed.xml", posts=db.get_post_summaries(lang)))
         response.headers["Content-Type"] = "application/xml"
         return response
 
@@ -58,6 +122,7 @@ def create_blog_blueprint(db, blog_prefix: str, locale_func):
                 "post.html",
                 post=post,
                 post_slug=post_slug,
+                related_posts=db.get_related_posts(post.language, post_slug),
                 form=comment_form.CommentForm(),
                 comment_sent=request.args.get("comment_sent"),
             )
@@ -85,7 +150,29 @@ def create_blog_blueprint(db, blog_prefix: str, locale_func):
     @blog.route("/tag/<path:tag>", methods=["GET"])
     def get_posts_from_tag(tag):
         lang = locale_func()
-        posts = db.get_posts_by_tag(tag, lang)
-        return render_template("blog.html", posts=posts, subtitle=f" - tag: {tag}")
+        return render_posts_page(
+            partial(db.get_post_summaries, lang, tag=tag),
+            allow_empty=True,
+            subtitle=f" - tag: {tag}",
+        )
+
+    @blog.route("/archive/<int:year>", methods=["GET"])
+    @blog.route("/archive/<int:year>/<int:month>", methods=["GET"])
+    def get_archive(year, month=None):
+        lang = locale_func()
+        if not datetime.MINYEAR <= year < datetime.MAXYEAR or month not in (None, *range(1, 13)):
+            return page_not_found(f"no archive for {year}/{month}")
+        if month is None:
+            start, end = datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+            period = str(year)
+        else:
+            start = datetime.date(year, month, 1)
+            end = datetime.date(year + month // 12, month % 12 + 1, 1)
+            period = f"{year}-{month:02}"
+        return render_posts_page(
+            partial(db.get_post_summaries_between, lang, start, end),
+            allow_empty=True,
+            subtitle=f" - archive: {period}",
+        )
 
     return blog
@@ -34,6 +34,7 @@ class Config(StrictBaseModel):
     use_www: bool = Field(default=True, alias="USE_WWW")
     seo_prefix: str = Field(default="/", alias="SEO_PREFIX")
     blog_prefix: str = Field(default="/", alias="BLOG_PREFIX")
+    blog_posts_per_page: int = Field(default=20, alias="BLOG_POSTS_PER_PAGE", gt=0)
     languages: Languages = Field(default_factory=dict, alias="LANGUAGES")
     domain_to_lang: dict[str, str] = Field(default_factory=dict, alias="DOMAIN_TO_LANG")
     translation_directories: list[str] = Field(
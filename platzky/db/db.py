@@ -1,16 +1,35 @@
+import datetime
+import threading
+import time
 from abc import ABC, abstractmethod
 from functools import partial
-from typing import Any, Callable
+from typing import Any, Callable, Dict, NamedTuple, Optional, cast
 
 from pydantic import BaseModel, Field
 
-from platzky.models import Color, MenuItem, Page, Post
+from platzky.models import Color, MenuItem, Page, Post, PostSummary, parse_post_date
+
+from .search_index import SearchDocument, SearchIndex
+from .typeahead import Suggestion, TypeaheadIndex
+
+
+class _SearchMirror(NamedTuple):
+    built_at: float
+    posts: Dict[str, PostSummary]
+    search: SearchIndex
+    typeahead: TypeaheadIndex
+
+
+# guards creating the lock of each DB's search mirrors, as DBs don't have to call DB.__init__
+_search_mirror_locks_lock = threading.Lock()
 
 
 class DB(ABC):
     db_name: str = "DB"
     module_name: str = "db"
     config_type: type
+    # how long posts mirrored into a search index by default `search_posts` are reused
+    search_mirror_max_age: float = 300.0
 
     def __init_subclass__(cls, *args, **kw):
         """Check that all methods defined in the subclass exist in the superclasses.
@@ -50,8 +69,111 @@ class DB(ABC):
 
     @abstractmethod
     def get_all_posts(self, lang) -> list[Post]:
+        """Returns all posts in given language, newest first."""
         pass
 
+    @abstractmethod
+    def get_post_summaries(self, lang, offset=0, limit=None, tag=None) -> list[PostSummary]:
+        """Returns summaries of posts in given language, newest first, skipping `offset` newer
+        ones and listing at most `limit` of them (all if None).
+        If `tag` is given, only posts with that tag are listed.
+        """
+        pass
+
+    def get_post_summaries_between(
+        self, lang, start: datetime.date, end: datetime.date, offset=0, limit=None
+    ) -> list[PostSummary]:
+        """Returns summaries of posts in given language published on or after `start` and
+        before `end`, newest first, skipping `offset` newer ones and listing at most `limit`.
+        Posts without an ISO date are never listed.
+
+        By default, all summaries in the language are filtered; DBs should replace it
+        with a lookup in an index of dates.
+        """
+        summaries = [
+            summary
+            for summary in self.get_post_summaries(lang)
+            if (published := parse_post_date(summary.date)) is not None
+            and start <= published.date() < end
+        ]
+        return summaries[offset : None if limit is None else offset + limit]
+
+    def search_posts(self, lang, query, offset=0, limit=None) -> list[PostSummary]:
+        """Returns summaries of posts in given language matching the query, best matches
+        first, skipping `offset` better ones and listing at most `limit` of them.
+
+        By default, posts from `get_all_posts` are mirrored into an in-memory search index,
+        rebuilt when it's older than `search_mirror_max_age` seconds. That's expensive,
+        as rebuilding fetches all posts in the language with their content, and only
+        eventually consistent: changes show up once the mirror is rebuilt, and while
+        one thread rebuilds it, others keep searching the stale one. DBs which keep
+        their content in memory maintain the index themselves instead.
+        """
+        mirror = self._search_mirror(lang)
+        end = None if limit is None else offset + limit
+        return [mirror.posts[slug] for slug in mirror.search.search(lang, query, end)[offset:]]
+
+    def get_search_suggestions(self, lang, prefix, limit=10) -> list[Suggestion]:
+        """Returns at most `limit` titles of posts and tags in given language with a word
+        starting with `prefix`, for completing search queries while they are typed.
+
+        By default, suggestions come from the same mirror of posts as `search_posts`.
+        """
+        return self._search_mirror(lang).typeahead.suggest(lang, prefix, limit)
+
+    def get_related_posts(self, lang, slug, limit=3) -> list[PostSummary]:
+        """Returns summaries of at most `limit` posts in given language most related
+        to the post with given slug by their tags and texts, most related first.
+
+        By default, there are none: comparing posts needs all of them at hand, so only DBs
+        which keep their content in memory find related posts.
+        """
+        return []
+
+    def _search_mirror(self, lang: str) -> "_SearchMirror":
+        with _search_mirror_locks_lock:
+            mirrors: Optional[Dict[str, _SearchMirror]] = getattr(self, "_search_mirrors", None)
+            if mirrors is None:
+                mirrors = self._search_mirrors = {}
+                self._search_mirror_lock = threading.Lock()
+        mirror = mirrors.get(lang)
+        if mirror is not None and time.monotonic() - mirror.built_at <= self.search_mirror_max_age:
+            return mirror
+        # only one thread rebuilds, others wait for the first mirror or use the stale one
+        if not self._search_mirror_lock.acquire(blocking=mirror is None):
+            return cast(_SearchMirror, mirror)
+        try:
+            mirror = mirrors.get(lang)
+            if mirror is None or time.monotonic() - mirror.built_at > self.search_mirror_max_age:
+                mirror = mirrors[lang] = self._build_search_mirror(lang)
+            return mirror
+        finally:
+            self._search_mirror_lock.release()
+
+    def _build_search_mirror(self, lang: str) -> "_SearchMirror":
+        posts: Dict[str, PostSummary] = {}
+        documents: list[SearchDocument] = []
+        for post in self.get_all_posts(lang):
+            posts[post.slug] = PostSummary.model_construct(
+                **{name: getattr(post, name) for name in PostSummary.model_fields}
+            )
+            documents.append(
+                SearchDocument(
+                    post.slug,
+                    lang,
+                    post.title,
+                    post.excerpt,
+                    tuple(post.tags),
+                    post.contentInMarkdown,
+                )
+            )
+        return _SearchMirror(
+            time.monotonic(),
+            posts,
+            SearchIndex.build(documents),
+            TypeaheadIndex.build(documents),
+        )
+
     @abstractmethod
     def get_menu_items_in_lang(self, lang) -> list[MenuItem]:
         pass
@@ -60,12 +182,28 @@ class DB(ABC):
     def get_post(self, slug) -> Post:
         pass
 
+    def get_posts_by_slugs(self, slugs) -> list[Post]:
+        """Returns posts with given slugs, in the order of `slugs`.
+        Slugs without a post are skipped.
+
+        By default, posts are fetched one by one with `get_post`; DBs should replace it
+        with a single lookup of all of them.
+        """
+        posts: list[Post] = []
+        for slug in slugs:
+            try:
+                posts.append(self.get_post(slug))
+            except ValueError:
+                continue
+        return posts
+
     @abstractmethod
     def get_page(self, slug) -> Page:
         pass
 
     @abstractmethod
     def get_posts_by_tag(self, tag, lang) -> Any:
+        """Returns posts with given tag in given language, newest first."""
         pass
 
     @abstractmethod
@@ -0,0 +1,107 @@
+import contextlib
+import gzip
+import io
+import os
+import stat
+import tempfile
+from typing import IO, Generator, Optional, Union
+
+try:
+    import zstandard  # pyright: ignore[reportMissingImports]
+except ImportError:  # optional, needed only for zstd compressed files
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+_COMPRESSION_BY_EXTENSION = {".gz": GZIP, ".gzip": GZIP, ".zst": ZSTD, ".zstd": ZSTD}
+_MAGIC_BYTES = {GZIP: b"\x1f\x8b", ZSTD: b"\x28\xb5\x2f\xfd"}
+
+# read once, as it can only be read by changing it, which isn't safe with threads running
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextlib.contextmanager
+def atomic_file(path: str) -> Generator[IO[bytes], None, None]:
+    """Yields a temporary file to be written, which is renamed over path once the block
+    exits without an error, so that readers and crashes never see a partially written file.
+
+    Like writing the file in place, it keeps the mode of an existing file (or creates it
+    with the default one) and writes to the target of a symlink instead of replacing it.
+    """
+    target = os.path.realpath(path)
+    directory, name = os.path.split(target)
+    try:
+        mode = stat.S_IMODE(os.stat(target).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            yield tmp_file
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def atomic_write(path: str, content: Union[str, bytes]) -> None:
+    """Replaces file at path with content atomically, see `atomic_file`."""
+    raw = content.encode("utf-8") if isinstance(content, str) else content
+    with atomic_file(path) as tmp_file:
+        tmp_file.write(raw)
+
+
+def compression_of(path: str) -> Optional[str]:
+    """Detects compression of a file by its extension or, if it has none of the known ones,
+    by its first bytes. Returns None for files which are not compressed.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in _COMPRESSION_BY_EXTENSION:
+        return _COMPRESSION_BY_EXTENSION[extension]
+    with open(path, "rb") as compressed_file:
+        head = compressed_file.read(4)
+    for compression, magic_bytes in _MAGIC_BYTES.items():
+        if head[: len(magic_bytes)] == magic_bytes:
+            return compression
+    return None
+
+
+def _zstandard():
+    if zstandard is None:
+        raise ValueError("zstd compressed files require the zstandard package")
+    return zstandard
+
+
+def open_text(path: str, compression: Optional[str]) -> IO[str]:
+    """Opens a file for reading text, decompressing it on the fly while it is read."""
+    if compression == GZIP:
+        return gzip.open(path, "rt", encoding="utf-8")
+    if compression == ZSTD:
+        decompressor = _zstandard().ZstdDecompressor()
+        return io.TextIOWrapper(decompressor.stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path)
+
+
+def read_bytes(path: str, compression: Optional[str]) -> bytes:
+    """Reads the whole decompressed content of a file."""
+    with open(path, "rb") as compressed_file:
+        raw = compressed_file.read()
+    if compression == GZIP:
+        return gzip.decompress(raw)
+    if compression == ZSTD:
+        # unlike ZstdDecompressor.decompress, works for frames without content size too
+        return _zstandard().ZstdDecompressor().decompressobj().decompress(raw)
+    return raw
+
+
+def compress(raw: bytes, compression: Optional[str]) -> bytes:
+    if compression == GZIP:
+        # fixed mtime keeps output the same for the same content
+        return gzip.compress(raw, mtime=0)
+    if compression == ZSTD:
+        return _zstandard().ZstdCompressor().compress(raw)
+    return raw
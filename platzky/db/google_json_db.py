@@ -1,10 +1,26 @@
+import atexit
+import io
 import json
+import logging
+import threading
+from typing import IO, Any, Dict, Iterable, Optional, cast
 
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud.storage import Client
 from pydantic import Field
 
 from .db import DBConfig
-from .json_db import Json
+from .files import atomic_file
+from .json_db import ContentIndex, Json
+from .json_stream import load_content_index
+
+logger = logging.getLogger(__name__)
+
+# uploads of comments retried when the blob keeps being changed by others in the meantime
+FLUSH_ATTEMPTS = 5
+# seconds before a failed flush is retried, doubled after each consecutive failure
+FLUSH_RETRY_DELAY = 1.0
+FLUSH_MAX_RETRY_DELAY = 300.0
 
 
 def db_config_type():
@@ -14,15 +30,30 @@ def db_config_type():
 class GoogleJsonDbConfig(DBConfig):
     bucket_name: str = Field(alias="BUCKET_NAME")
     source_blob_name: str = Field(alias="SOURCE_BLOB_NAME")
+    streaming_load: bool = Field(default=False, alias="STREAMING_LOAD")
+    refresh_interval: Optional[float] = Field(default=None, alias="REFRESH_INTERVAL", gt=0)
+    cache_path: Optional[str] = Field(default=None, alias="CACHE_PATH")
+    require_fresh: bool = Field(default=False, alias="REQUIRE_FRESH")
+    comments_flush_interval: Optional[float] = Field(
+        default=None, alias="COMMENTS_FLUSH_INTERVAL", ge=0
+    )
 
 
 def db_from_config(config: GoogleJsonDbConfig):
-    return GoogleJsonDb(config.bucket_name, config.source_blob_name)
+    return GoogleJsonDb(
+        config.bucket_name,
+        config.source_blob_name,
+        streaming_load=config.streaming_load,
+        refresh_interval=config.refresh_interval,
+        cache_path=config.cache_path,
+        require_fresh=config.require_fresh,
+        comments_flush_interval=config.comments_flush_interval,
+    )
 
 
 def get_db(config):
     google_json_db_config = GoogleJsonDbConfig.model_validate(config)
-    return GoogleJsonDb(google_json_db_config.bucket_name, google_json_db_config.source_blob_name)
+    return db_from_config(google_json_db_config)
 
 
 def get_blob(bucket_name, source_blob_name):
@@ -36,14 +67,307 @@ def get_data(blob):
     return json.loads(raw_data)
 
 
+def get_content_index(blob, previous: Optional[ContentIndex] = None):
+    """Downloads and indexes content incrementally, without holding the whole text in memory."""
+    with blob.open("rt", encoding="utf-8") as stream:
+        return load_content_index(stream, previous=previous)
+
+
+class _CopyingReader(io.TextIOBase):
+    """Reads text from a stream, writing everything read into a binary file as well."""
+
+    def __init__(self, stream: IO[str], copy: IO[bytes]):
+        super().__init__()
+        self._stream = stream
+        self._copy = copy
+
+    def read(self, size: Optional[int] = -1) -> str:
+        text = self._stream.read(-1 if size is None else size)
+        self._copy.write(text.encode("utf-8"))
+        return text
+
+
+def merge_comments(
+    data: Dict[str, Any], comments: Iterable[tuple[str, Dict[str, str]]]
+) -> Dict[str, Any]:
+    """Returns a copy of data with comments appended to posts with given slugs.
+    Comments to posts which are not in data (e.g. were deleted in the meantime) are dropped.
+    """
+    site_content = data.get("site_content") or {}
+    posts: list[Dict[str, Any]] = list(site_content.get("posts") or ())
+    positions: Dict[str, int] = {}
+    for position, post in enumerate(posts):
+        positions.setdefault(post["slug"], position)
+    for post_slug, comment in comments:
+        position = positions.get(post_slug)
+        if position is None:
+            logger.warning(f"Dropping comment to post {post_slug}, which no longer exists")
+            continue
+        post = posts[position]
+        posts[position] = {**post, "comments": [*(post.get("comments") or ()), comment]}
+    return {**data, "site_content": {**site_content, "posts": posts}}
+
+
+def blob_version(blob) -> Any:
+    """Identifies content of a blob: its generation, or its ETag when generation is unknown."""
+    return blob.generation if blob.generation is not None else blob.etag
+
+
 class GoogleJsonDb(Json):
-    def __init__(self, bucket_name, source_blob_name):
+    """Json DB stored in a blob in Google Cloud Storage.
+
+    With `refresh_interval` set, a background thread fetches metadata of the blob every that
+    many seconds and, only when its generation (or ETag) has changed, downloads and parses it
+    and swaps the whole content at once. Requests in flight keep using content they have
+    started with.
+
+    With `cache_path` set, every downloaded version of the blob is saved there along with
+    its generation. On startup, content is served from the cached copy right away, while
+    a background thread checks whether the blob has changed since (stale-while-revalidate).
+    With `require_fresh` enabled as well, startup waits for the generation of the blob
+    to be checked and uses the cached copy only if it's still current.
+
+    With `comments_flush_interval` set, comments are saved to the blob (write-behind).
+    Adding a comment only updates content in memory and queues the comment; a background
+    flush waits that many seconds to batch more comments, then reads the latest version
+    of the blob, merges queued comments into it and uploads it on condition that the blob
+    hasn't changed since it was read. If it has, the flush reads it again and retries.
+    A flush which fails is retried in the background, waiting longer after each failure.
+    Queued comments are flushed on exit as well. Otherwise, comments are kept in memory
+    only.
+    """
+
+    def __init__(
+        self,
+        bucket_name,
+        source_blob_name,
+        streaming_load=False,
+        refresh_interval: Optional[float] = None,
+        cache_path: Optional[str] = None,
+        require_fresh: bool = False,
+        comments_flush_interval: Optional[float] = None,
+    ):
         self.bucket_name = bucket_name
         self.source_blob_name = source_blob_name
+        self._streaming_load = streaming_load
+        self._cache_path = cache_path
 
         self.blob = get_blob(self.bucket_name, self.source_blob_name)
-        data = get_data(self.blob)
-        super().__init__(data)
+        revalidate = False
+        if cache_path is None:
+            if streaming_load:
+                index = get_content_index(self.blob)
+            else:
+                index = ContentIndex(get_data(self.blob))
+            # downloads fill in metadata of the blob, including generation of downloaded content
+            version = blob_version(self.blob)
+        else:
+            cached = self._read_cache()
+            if require_fresh or cached is None:
+                blob = self._fetch_blob()
+                if cached is None or cached[1] != blob_version(blob):
+                    cached = self._download(blob, previous=None)
+                self.blob = blob
+            else:
+                revalidate = True
+            index, version = cached
+        super().__init__(index.data, index=index)
+        self._blob_version = version
 
         self.module_name = "google_json_db"
         self.db_name = "GoogleJsonDb"
+
+        # serializes syncing with the blob, so a refresh and a flush never interleave
+        self._sync_lock = threading.Lock()
+        self._flush_interval = comments_flush_interval
+        self._pending_comments: list[tuple[str, Dict[str, str]]] = []
+        self._flush: Optional[threading.Timer] = None
+        self._flush_failures = 0
+        if comments_flush_interval is not None:
+            atexit.register(self._flush_comments)
+
+        self._refresh_interval = refresh_interval
+        self._stop_refreshing = threading.Event()
+        if refresh_interval is not None or revalidate:
+            self._refresher = threading.Thread(
+                target=self._watch_blob,
+                args=(revalidate,),
+                name=f"refresh {source_blob_name}",
+                daemon=True,
+            )
+            self._refresher.start()
+
+    def _fetch_blob(self):
+        """Fetches metadata of the blob, returning a blob bound to its current generation."""
+        blob = self.blob.bucket.get_blob(self.source_blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"{self.bucket_name}/{self.source_blob_name} is missing")
+        return blob
+
+    def _cache_header(self, version: Any) -> dict[str, Any]:
+        return {"bucket": self.bucket_name, "blob": self.source_blob_name, "version": version}
+
+    def _read_cache(self) -> Optional[tuple[ContentIndex, Any]]:
+        """Loads content from the cached copy of the blob, if there is a usable one."""
+        assert self._cache_path is not None
+        try:
+            with open(self._cache_path, encoding="utf-8") as cache_file:
+                header = json.loads(cache_file.readline())
+                if header != self._cache_header(header.get("version")):
+                    return None
+                if self._streaming_load:
+                    index = load_content_index(cache_file)
+                else:
+                    index = ContentIndex(json.load(cache_file))
+                return index, header["version"]
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception(f"Reading cached copy {self._cache_path} failed")
+            return None
+
+    def _download(self, blob, previous: Optional[ContentIndex]) -> tuple[ContentIndex, Any]:
+        """Downloads and indexes content of a blob fetched by `_fetch_blob`, saving it to
+        the cache if there is one. The cache is replaced only if content was indexed.
+        """
+        version = blob_version(blob)
+        if self._cache_path is None:
+            if self._streaming_load:
+                return get_content_index(blob, previous=previous), version
+            return ContentIndex(get_data(blob), previous=previous), version
+        header = json.dumps(self._cache_header(version)) + "\n"
+        if self._streaming_load:
+            with (
+                blob.open("rt", encoding="utf-8") as stream,
+                atomic_file(self._cache_path) as cache_file,
+            ):
+                cache_file.write(header.encode("utf-8"))
+                reader = cast(IO[str], _CopyingReader(stream, cache_file))
+                return load_content_index(reader, previous=previous), version
+        raw_data = blob.download_as_text(client=None)
+        index = ContentIndex(json.loads(raw_data), previous=previous)
+        self._save_cache(version, raw_data)
+        return index, version
+
+    def _save_cache(self, version: Any, raw_data: str) -> None:
+        if self._cache_path is None:
+            return
+        header = json.dumps(self._cache_header(version)) + "\n"
+        with atomic_file(self._cache_path) as cache_file:
+            cache_file.write((header + raw_data).encode("utf-8"))
+
+    def _watch_blob(self, revalidate: bool) -> None:
+        if revalidate:
+            self._refresh_logging_errors()
+        if self._refresh_interval is None:
+            return
+        while not self._stop_refreshing.wait(self._refresh_interval):
+            self._refresh_logging_errors()
+
+    def _refresh_logging_errors(self) -> None:
+        try:
+            self._refresh_if_changed()
+        except Exception:
+            logger.exception(f"Refreshing {self.bucket_name}/{self.source_blob_name} failed")
+
+    def _refresh_if_changed(self) -> bool:
+        """Reloads content if the blob has changed. Returns whether it was reloaded.
+
+        A blob fetched with its metadata is bound to its current generation, so content
+        downloaded from it is exactly the version which was checked, even if the blob
+        is replaced in the meantime. Parsing and indexing happen without the lock.
+        """
+        with self._sync_lock:
+            blob = self._fetch_blob()
+            if blob_version(blob) == self._blob_version:
+                return False
+            index, version = self._download(blob, previous=self._index)
+            with self._lock:
+                self._swap_index(self._with_pending_comments(index))
+                self.blob = blob
+                self._blob_version = version
+        logger.info(f"Reloaded {self.bucket_name}/{self.source_blob_name}")
+        return True
+
+    def _with_pending_comments(self, index: ContentIndex) -> ContentIndex:
+        """Applies comments not saved to the blob yet. Must be called with the lock held."""
+        return index.with_comments(
+            (post_slug, comment)
+            for post_slug, comment in self._pending_comments
+            if post_slug in index.raw_posts_by_slug
+        )
+
+    def _append_comment(self, post_slug, comment):
+        super()._append_comment(post_slug, comment)
+        if self._flush_interval is None:
+            return
+        self._pending_comments.append((post_slug, comment))
+        self._schedule_flush(self._flush_interval)
+
+    def _schedule_flush(self, delay: float) -> None:
+        """Plans a flush unless one is planned already. Must be called with the lock held."""
+        if self._flush is None:
+            self._flush = threading.Timer(delay, self._flush_in_background)
+            self._flush.daemon = True
+            self._flush.start()
+
+    def _flush_in_background(self) -> None:
+        with self._lock:
+            self._flush = None
+        try:
+            self._flush_comments()
+        except Exception:
+            with self._lock:
+                self._flush_failures += 1
+                delay = min(
+                    FLUSH_RETRY_DELAY * 2 ** (self._flush_failures - 1), FLUSH_MAX_RETRY_DELAY
+                )
+                self._schedule_flush(delay)
+            logger.exception(
+                f"Saving comments to {self.bucket_name}/{self.source_blob_name} failed, "
+                f"retrying in {delay} seconds"
+            )
+        else:
+            with self._lock:
+                self._flush_failures = 0
+
+    def _flush_comments(self) -> None:
+        """Merges queued comments into the latest version of the blob and uploads it.
+
+        The upload succeeds only if the blob's generation is still the one which was read,
+        so changes made by others in the meantime are never overwritten. Comments queued
+        while flushing stay queued for the next flush.
+        """
+        with self._sync_lock:
+            with self._lock:
+                batch = list(self._pending_comments)
+            if not batch:
+                return
+            for _ in range(FLUSH_ATTEMPTS):
+                blob = self._fetch_blob()
+                read_version = blob_version(blob)
+                raw_data = json.dumps(merge_comments(json.loads(blob.download_as_text()), batch))
+                try:
+                    blob.upload_from_string(
+                        raw_data,
+                        content_type="application/json",
+                        if_generation_match=blob.generation,
+                    )
+                    break
+                except PreconditionFailed:
+                    logger.info(f"{self.source_blob_name} changed while saving comments, retrying")
+            else:
+                raise RuntimeError(f"{self.source_blob_name} kept changing while saving comments")
+
+            # content got changed by others since it was loaded, it has to be indexed again
+            index = None
+            if read_version != self._blob_version:
+                index = ContentIndex(json.loads(raw_data), previous=self._index)
+            version = blob_version(blob)
+            self._save_cache(version, raw_data)
+            with self._lock:
+                del self._pending_comments[: len(batch)]
+                if index is not None:
+                    self._swap_index(self._with_pending_comments(index))
+                self.blob = blob
+                self._blob_version = version
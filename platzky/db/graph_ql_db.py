@@ -1,13 +1,21 @@
 # TODO rename file, extract it to another library, remove qgl and aiohttp from dependencies
 
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, cast
 
 from gql import Client, gql
+from gql.client import AsyncClientSession
 from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.exceptions import TransportQueryError
+from graphql import DocumentNode, ExecutionResult, print_ast
 from pydantic import Field
 
 from platzky.db.db import DB, DBConfig
-from platzky.models import Color, Post
+from platzky.models import Color, Post, PostSummary
 
 
 def db_config_type():
@@ -17,14 +25,93 @@ def db_config_type():
 class GraphQlDbConfig(DBConfig):
     endpoint: str = Field(alias="CMS_ENDPOINT")
     token: str = Field(alias="CMS_TOKEN")
+    persisted_queries: bool = Field(default=False, alias="PERSISTED_QUERIES")
+    max_concurrency: int = Field(default=10, alias="MAX_CONCURRENCY", gt=0)
+    timeout: float = Field(default=10.0, alias="TIMEOUT", gt=0)
 
 
 def get_db(config: GraphQlDbConfig):
-    return GraphQL(config.endpoint, config.token)
+    return db_from_config(config)
 
 
 def db_from_config(config: GraphQlDbConfig):
-    return GraphQL(config.endpoint, config.token)
+    return GraphQL(
+        config.endpoint,
+        config.token,
+        persisted_queries=config.persisted_queries,
+        max_concurrency=config.max_concurrency,
+        timeout=config.timeout,
+    )
+
+
+# text and its SHA-256 hash of every query parsed by `_query`, by its document; documents
+# compare and hash by their contents (the hash is cached), so equal copies match as well
+_persisted_queries: Dict[DocumentNode, tuple[str, str]] = {}
+
+
+def _query(source: str) -> DocumentNode:
+    """Parses a query once, when this module is imported, and prepares it for being sent
+    as a persisted query. Documents must not be modified afterwards.
+    """
+    document = gql(source)
+    text = print_ast(document)
+    _persisted_queries[document] = (text, hashlib.sha256(text.encode("utf-8")).hexdigest())
+    return document
+
+
+def _persisted_query_not_found(result: ExecutionResult) -> bool:
+    return any(
+        error.get("message") == "PersistedQueryNotFound"
+        or (error.get("extensions") or {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+        for error in result.errors or ()
+        if isinstance(error, dict)
+    )
+
+
+class PersistedQueryTransport(AIOHTTPTransport):
+    """Sends automatic persisted queries: only the SHA-256 hash of a query is sent,
+    and the full query text is sent along with it only when the server doesn't know it yet.
+    Servers without support for persisted queries keep getting full text after every miss.
+    Only documents parsed by `_query`, or equal to them, are sent that way.
+
+    It saves bandwidth and parsing on the server; the base transport still prints
+    the document on every call, so on the client only parsing is saved, by `_query`.
+    """
+
+    async def execute(
+        self,
+        document: DocumentNode,
+        variable_values: Optional[Dict[str, Any]] = None,
+        operation_name: Optional[str] = None,
+        extra_args: Optional[Dict[str, Any]] = None,
+        upload_files: bool = False,
+    ) -> ExecutionResult:
+        persisted = _persisted_queries.get(document)
+        if persisted is None or upload_files:
+            return await super().execute(
+                document, variable_values, operation_name, extra_args, upload_files
+            )
+        text, sha256_hash = persisted
+        payload: Dict[str, Any] = {
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+        }
+        if variable_values:
+            payload["variables"] = variable_values
+        if operation_name:
+            payload["operationName"] = operation_name
+
+        # json given in extra args replaces the payload which would carry the whole query
+        result = await super().execute(
+            document, variable_values, operation_name, {**(extra_args or {}), "json": payload}
+        )
+        if _persisted_query_not_found(result):
+            result = await super().execute(
+                document,
+                variable_values,
+                operation_name,
+                {**(extra_args or {}), "json": {**payload, "query": text}},
+            )
+        return result
 
 
 def _standarize_comment(
@@ -37,6 +124,20 @@ def _standarize_comment(
     }
 
 
+def _standarize_post_summary(post):
+    return {
+        "slug": post["slug"],
+        "title": post["title"],
+        "excerpt": post["excerpt"],
+        "tags": post["tags"],
+        "language": post["language"],
+        "coverImage": {
+            "url": post["coverImage"]["image"]["url"],
+        },
+        "date": post["date"],
+    }
+
+
 def _standarize_post(post):
     return {
         "author": post["author"]["name"],
@@ -54,181 +155,449 @@ def _standarize_post(post):
     }
 
 
+ALL_POSTS = _query(
+    """
+    query MyQuery($lang: Lang!) {
+      posts(where: {language: $lang},  orderBy: date_DESC, stage: PUBLISHED){
+        createdAt
+        author {
+            name
+        }
+        contentInRichText {
+            html
+            }
+        comments {
+          comment
+          author
+          createdAt
+          }
+        date
+        title
+        excerpt
+        slug
+        tags
+        language
+        coverImage {
+          alternateText
+          image {
+            url
+          }
+        }
+      }
+    }
+    """
+)
+
+POST_SUMMARIES = _query(
+    """
+    query MyQuery($where: PostWhereInput!, $first: Int, $skip: Int!) {
+      posts(
+        where: $where, orderBy: date_DESC, first: $first, skip: $skip, stage: PUBLISHED
+      ){
+        date
+        title
+        excerpt
+        slug
+        tags
+        language
+        coverImage {
+          alternateText
+          image {
+            url
+          }
+        }
+      }
+    }
+    """
+)
+
+MENU_ITEMS_WITH_LANG = _query(
+    """
+    query MyQuery($lang: Lang!) {
+      menuItems(where: {language: $lang}, stage: PUBLISHED){
+        name
+        url
+      }
+    }
+    """
+)
+
+MENU_ITEMS_WITHOUT_LANG = _query(
+    """
+    query MyQuery {
+      menuItems(stage: PUBLISHED){
+        name
+        url
+      }
+    }
+    """
+)
+
+POST = _query(
+    """
+    query MyQuery($slug: String!) {
+      post(where: {slug: $slug}, stage: PUBLISHED) {
+        date
+        language
+        title
+        slug
+        author {
+            name
+        }
+        contentInRichText {
+          markdown
+          html
+        }
+        excerpt
+        tags
+        coverImage {
+          alternateText
+          image {
+            url
+          }
+        }
+        comments {
+            author
+            comment
+            date: createdAt
+        }
+      }
+    }
+    """
+)
+
+POSTS_BY_SLUGS = _query(
+    """
+    query MyQuery($slugs: [String!]!, $first: Int!) {
+      posts(where: {slug_in: $slugs}, first: $first, stage: PUBLISHED) {
+        author {
+            name
+        }
+        contentInRichText {
+            html
+            }
+        comments {
+          comment
+          author
+          createdAt
+          }
+        date
+        title
+        excerpt
+        slug
+        tags
+        language
+        coverImage {
+          alternateText
+          image {
+            url
+          }
+        }
+      }
+    }
+    """
+)
+
+PAGE = _query(
+    """
+    query MyQuery ($slug: String!){
+      page(where: {slug: $slug}, stage: PUBLISHED) {
+        title
+        contentInMarkdown
+        coverImage
+        {
+            url
+        }
+      }
+    }
+    """
+)
+
+POSTS_BY_TAG = _query(
+    """
+    query MyQuery ($tag: String!, $lang: Lang!){
+      posts(
+        where: {tags_contains_some: [$tag], language: $lang},
+        orderBy: date_DESC,
+        stage: PUBLISHED
+      ) {
+            tags
+            title
+            slug
+            excerpt
+            date
+            coverImage {
+              alternateText
+              image {
+                url
+              }
+            }
+      }
+    }
+    """
+)
+
+ADD_COMMENT = _query(
+    """
+    mutation MyMutation($author: String!, $comment: String!, $slug: String!) {
+        createComment(
+            data: {
+                author: $author,
+                comment: $comment,
+                post: {connect: {slug: $slug}}
+            }
+        ) {
+            id
+        }
+    }
+    """
+)
+
+LOGO = _query(
+    """
+    query myquery {
+      logos(stage: PUBLISHED) {
+      logo {
+          alternateText
+          image {
+            url
+          }
+        }
+      }
+    }
+    """
+)
+
+APP_DESCRIPTION = _query(
+    """
+    query myquery($lang: Lang!) {
+      applicationSetups(where: {language: $lang}, stage: PUBLISHED) {
+        applicationDescription
+      }
+    }
+    """
+)
+
+FAVICON = _query(
+    """
+    query myquery {
+      favicons(stage: PUBLISHED) {
+      favicon {
+        url
+        }
+      }
+    }
+    """
+)
+
+PLUGINS_DATA = _query(
+    """
+    query MyQuery {
+      pluginConfigs(stage: PUBLISHED) {
+        name
+        config
+      }
+    }
+    """
+)
+
+
+# seconds a caller waits for the loop on top of the query's timeout, in case the loop
+# itself doesn't run and so can't time the query out
+LOOP_TIMEOUT_MARGIN = 1.0
+
+
+class PooledClient:
+    """Executes queries from any thread over one persistent session.
+
+    The session, along with its pool of keep-alive connections, lives on an event loop
+    running in a background thread; `execute` hands queries over to that loop and waits
+    for their results, so no thread ever creates its own loop or connection. At most
+    `max_concurrency` queries are sent at once, others wait for their turn. A query which
+    doesn't complete within its timeout, including time spent waiting, raises TimeoutError.
+
+    The loop and a client from `make_client` are created on first use in each process,
+    so a process forked from one which already used them (e.g. a gunicorn worker
+    of a preloaded app) gets its own instead of waiting for a thread it doesn't have.
+    """
+
+    def __init__(
+        self,
+        make_client: Callable[[], Client],
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+    ):
+        self.make_client = make_client
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._starting = threading.Lock()
+        self._pid: Optional[int] = None
+        self._client: Optional[Client] = None
+        self._session: Optional[AsyncClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _running_loop(self) -> asyncio.AbstractEventLoop:
+        """Returns the loop of this process, starting it on first use."""
+        with self._starting:
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._client = self.make_client()
+                self._session = None
+                self._loop = asyncio.new_event_loop()
+                # both are bound to the loop when first used on it
+                self._connecting = asyncio.Lock()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="GraphQL client", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def execute(
+        self,
+        document: DocumentNode,
+        variable_values: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Executes a query, waiting at most `timeout` seconds (the default one if None)."""
+        call_timeout = self.timeout if timeout is None else timeout
+        future = asyncio.run_coroutine_threadsafe(
+            self._execute(document, variable_values, call_timeout), self._running_loop()
+        )
+        try:
+            return future.result(call_timeout + LOOP_TIMEOUT_MARGIN)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError("GraphQL client's event loop doesn't respond") from None
+
+    async def _execute(
+        self, document: DocumentNode, variable_values: Optional[Dict[str, Any]], timeout: float
+    ) -> Dict[str, Any]:
+        try:
+            return await asyncio.wait_for(self._execute_limited(document, variable_values), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"GraphQL query didn't complete within {timeout} seconds") from None
+
+    async def _execute_limited(
+        self, document: DocumentNode, variable_values: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        async with self._semaphore:
+            session = await self._connected_session()
+            return await session.execute(document, variable_values=variable_values)
+
+    async def _connected_session(self) -> AsyncClientSession:
+        async with self._connecting:
+            if self._session is None:
+                assert self._client is not None
+                self._session = cast(AsyncClientSession, await self._client.connect_async())
+            return self._session
+
+    def close(self) -> None:
+        """Closes the session and stops the loop, if they were started in this process.
+        Using the client afterwards starts them again.
+        """
+        with self._starting:
+            loop, thread, client = self._loop, self._thread, self._client
+            if loop is None or thread is None or client is None or self._pid != os.getpid():
+                return
+            self._loop = None
+
+        async def close_session() -> None:
+            if self._session is not None:
+                await client.close_async()
+                self._session = None
+
+        try:
+            future = asyncio.run_coroutine_threadsafe(close_session(), loop)
+            future.result(self.timeout + LOOP_TIMEOUT_MARGIN)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(self.timeout + LOOP_TIMEOUT_MARGIN)
+            if not thread.is_alive():
+                loop.close()
+
+
 class GraphQL(DB):
-    def __init__(self, endpoint, token):
+    """DB backed by a GraphQL CMS.
+
+    All queries are parsed once, when this module is imported. With `persisted_queries`
+    enabled, they are sent as automatic persisted queries, see PersistedQueryTransport.
+    Queries are sent over a persistent session shared by all threads, at most
+    `max_concurrency` at once, each failing after `timeout` seconds, see PooledClient.
+    """
+
+    def __init__(self, endpoint, token, persisted_queries=False, max_concurrency=10, timeout=10.0):
         self.module_name = "graph_ql_db"
         self.db_name = "GraphQLDb"
         full_token = "bearer " + token
-        transport = AIOHTTPTransport(url=endpoint, headers={"Authorization": full_token})
-        self.client = Client(transport=transport)
+        transport_class = PersistedQueryTransport if persisted_queries else AIOHTTPTransport
+
+        def make_client() -> Client:
+            transport = transport_class(url=endpoint, headers={"Authorization": full_token})
+            # timeouts are applied by PooledClient, including time spent waiting for a turn
+            return Client(transport=transport, execute_timeout=None)
+
+        self.client = PooledClient(make_client, max_concurrency=max_concurrency, timeout=timeout)
         super().__init__()
 
     def get_all_posts(self, lang):
-        all_posts = gql(
-            """
-            query MyQuery($lang: Lang!) {
-              posts(where: {language: $lang},  orderBy: date_DESC, stage: PUBLISHED){
-                createdAt
-                author {
-                    name
-                }
-                contentInRichText {
-                    html
-                    }
-                comments {
-                  comment
-                  author
-                  createdAt
-                  }
-                date
-                title
-                excerpt
-                slug
-                tags
-                language
-                coverImage {
-                  alternateText
-                  image {
-                    url
-                  }
-                }
-              }
-            }
-            """
-        )
-        raw_ql_posts = self.client.execute(all_posts, variable_values={"lang": lang})["posts"]
+        raw_ql_posts = self.client.execute(ALL_POSTS, variable_values={"lang": lang})["posts"]
 
         return [Post.model_validate(_standarize_post(post)) for post in raw_ql_posts]
 
+    def get_post_summaries(self, lang, offset=0, limit=None, tag=None):
+        where = {"language": lang}
+        if tag is not None:
+            where["tags_contains_some"] = [tag]
+        raw_ql_posts = self.client.execute(
+            POST_SUMMARIES, variable_values={"where": where, "first": limit, "skip": offset}
+        )["posts"]
+
+        return [PostSummary.model_validate(_standarize_post_summary(post)) for post in raw_ql_posts]
+
     def get_menu_items_in_lang(self, lang):
         menu_items = []
         try:
-            menu_items_with_lang = gql(
-                """
-                query MyQuery($lang: Lang!) {
-                  menuItems(where: {language: $lang}, stage: PUBLISHED){
-                    name
-                    url
-                  }
-                }
-                """
-            )
             menu_items = self.client.execute(
-                menu_items_with_lang, variable_values={"language": lang}
+                MENU_ITEMS_WITH_LANG, variable_values={"language": lang}
             )
 
         # TODO remove try except block after bumping up version
         # now it's backwards compatible with older versions
         except TransportQueryError:
-            menu_items_without_lang = gql(
-                """
-                query MyQuery {
-                  menuItems(stage: PUBLISHED){
-                    name
-                    url
-                  }
-                }
-                """
-            )
-            menu_items = self.client.execute(menu_items_without_lang)
+            menu_items = self.client.execute(MENU_ITEMS_WITHOUT_LANG)
 
         return menu_items["menuItems"]
 
     def get_post(self, slug):
-        post = gql(
-            """
-            query MyQuery($slug: String!) {
-              post(where: {slug: $slug}, stage: PUBLISHED) {
-                date
-                language
-                title
-                slug
-                author {
-                    name
-                }
-                contentInRichText {
-                  markdown
-                  html
-                }
-                excerpt
-                tags
-                coverImage {
-                  alternateText
-                  image {
-                    url
-                  }
-                }
-                comments {
-                    author
-                    comment
-                    date: createdAt
-                }
-              }
-            }
-            """
-        )
-
-        post_raw = self.client.execute(post, variable_values={"slug": slug})["post"]
+        post_raw = self.client.execute(POST, variable_values={"slug": slug})["post"]
         return Post.model_validate(_standarize_post(post_raw))
 
+    def get_posts_by_slugs(self, slugs):
+        slugs = list(slugs)
+        if not slugs:
+            return []
+        raw_ql_posts = self.client.execute(
+            POSTS_BY_SLUGS, variable_values={"slugs": slugs, "first": len(slugs)}
+        )["posts"]
+        posts_by_slug = {
+            post["slug"]: Post.model_validate(_standarize_post(post)) for post in raw_ql_posts
+        }
+        return [posts_by_slug[slug] for slug in slugs if slug in posts_by_slug]
+
     # TODO Cleanup page logic of internationalization (now it depends on translation of slugs)
     def get_page(self, slug):
-        post = gql(
-            """
-            query MyQuery ($slug: String!){
-              page(where: {slug: $slug}, stage: PUBLISHED) {
-                title
-                contentInMarkdown
-                coverImage
-                {
-                    url
-                }
-              }
-            }
-            """
-        )
-        return self.client.execute(post, variable_values={"slug": slug})["page"]
+        return self.client.execute(PAGE, variable_values={"slug": slug})["page"]
 
     def get_posts_by_tag(self, tag, lang):
-        post = gql(
-            """
-            query MyQuery ($tag: String!, $lang: Lang!){
-              posts(where: {tags_contains_some: [$tag], language: $lang}, stage: PUBLISHED) {
-                    tags
-                    title
-                    slug
-                    excerpt
-                    date
-                    coverImage {
-                      alternateText
-                      image {
-                        url
-                      }
-                    }
-              }
-            }
-            """
-        )
-        return self.client.execute(post, variable_values={"tag": tag, "lang": lang})["posts"]
+        return self.client.execute(POSTS_BY_TAG, variable_values={"tag": tag, "lang": lang})[
+            "posts"
+        ]
 
     def add_comment(self, author_name, comment, post_slug):
-        add_comment = gql(
-            """
-            mutation MyMutation($author: String!, $comment: String!, $slug: String!) {
-                createComment(
-                    data: {
-                        author: $author,
-                        comment: $comment,
-                        post: {connect: {slug: $slug}}
-                    }
-                ) {
-                    id
-                }
-            }
-            """
-        )
         self.client.execute(
-            add_comment,
+            ADD_COMMENT,
             variable_values={
                 "author": author_name,
                 "comment": comment,
@@ -240,54 +609,18 @@ class GraphQL(DB):
         return str("")
 
     def get_logo_url(self):
-        logo = gql(
-            """
-            query myquery {
-              logos(stage: PUBLISHED) {
-              logo {
-                  alternateText
-                  image {
-                    url
-                  }
-                }
-              }
-            }
-            """
-        )
         try:
-            return self.client.execute(logo)["logos"][0]["logo"]["image"]["url"]
+            return self.client.execute(LOGO)["logos"][0]["logo"]["image"]["url"]
         except IndexError:
             return ""
 
     def get_app_description(self, lang):
-        description_query = gql(
-            """
-            query myquery($lang: Lang!) {
-              applicationSetups(where: {language: $lang}, stage: PUBLISHED) {
-                applicationDescription
-              }
-            }
-            """
-        )
-
-        return self.client.execute(description_query, variable_values={"lang": lang})[
+        return self.client.execute(APP_DESCRIPTION, variable_values={"lang": lang})[
             "applicationSetups"
         ][0].get("applicationDescription", None)
 
     def get_favicon_url(self):
-        favicon = gql(
-            """
-            query myquery {
-              favicons(stage: PUBLISHED) {
-              favicon {
-                url
-                }
-              }
-            }
-            """
-        )
-
-        return self.client.execute(favicon)["favicons"][0]["favicon"]["url"]
+        return self.client.execute(FAVICON)["favicons"][0]["favicon"]["url"]
 
     def get_primary_color(self) -> Color:
         return Color()
@@ -296,14 +629,4 @@ class GraphQL(DB):
         return Color()
 
     def get_plugins_data(self):
-        plugins_data = gql(
-            """
-            query MyQuery {
-              pluginConfigs(stage: PUBLISHED) {
-                name
-                config
-              }
-            }
-            """
-        )
-        return self.client.execute(plugins_data)["pluginConfigs"]
+        return self.client.execute(PLUGINS_DATA)["pluginConfigs"]
@@ -1,10 +1,16 @@
+import bisect
+import copy
 import datetime
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Union
 
 from pydantic import Field
 
-from ..models import MenuItem, Post
+from ..models import CompactPost, MenuItem, Page, Post, PostSummary
 from .db import DB, DBConfig
+from .related_posts import RelatedPosts
+from .search_index import SearchDocument, SearchIndex
+from .typeahead import TypeaheadIndex
 
 
 def db_config_type():
@@ -29,61 +35,296 @@ def db_from_config(config: JsonDbConfig):
 # there will be no need to pass it to the method or in db
 
 
+def sort_post_listings(
+    summaries: Iterable[Union[PostSummary, CompactPost]],
+) -> tuple[Dict[str, tuple[str, ...]], Dict[tuple[str, str], tuple[str, ...]]]:
+    """Builds slug listings per language and per (tag, language), sorted newest first."""
+    slugs_by_lang: Dict[str, list[Union[PostSummary, CompactPost]]] = {}
+    slugs_by_tag: Dict[tuple[str, str], list[Union[PostSummary, CompactPost]]] = {}
+    for summary in summaries:
+        slugs_by_lang.setdefault(summary.language, []).append(summary)
+        for tag in dict.fromkeys(summary.tags):
+            slugs_by_tag.setdefault((tag, summary.language), []).append(summary)
+
+    def newest_first(listing: list[Union[PostSummary, CompactPost]]) -> tuple[str, ...]:
+        return tuple(s.slug for s in sorted(listing, key=lambda s: s.date, reverse=True))
+
+    return (
+        {lang: newest_first(listing) for lang, listing in slugs_by_lang.items()},
+        {key: newest_first(listing) for key, listing in slugs_by_tag.items()},
+    )
+
+
+class PostArchive(NamedTuple):
+    """Slugs of posts in one language, newest first, with negated ordinals of days they
+    were published on, which are thus ascending and can be searched with bisect.
+    """
+
+    days: tuple[int, ...]
+    slugs: tuple[str, ...]
+
+    def between(self, start: datetime.date, end: datetime.date) -> tuple[str, ...]:
+        """Returns slugs of posts published on or after `start` and before `end`."""
+        first = bisect.bisect_right(self.days, -end.toordinal())
+        return self.slugs[first : bisect.bisect_right(self.days, -start.toordinal(), first)]
+
+
+def sort_post_archive(
+    slugs_by_lang: Dict[str, tuple[str, ...]],
+    published_by_slug: Dict[str, Optional[datetime.datetime]],
+) -> Dict[str, PostArchive]:
+    """Builds archives per language from listings made by `sort_post_listings`.
+    Posts with the same day of publication stay in the order of the listing.
+    """
+    archive_by_lang: Dict[str, PostArchive] = {}
+    for lang, slugs in slugs_by_lang.items():
+        days = {
+            slug: -published.date().toordinal()
+            for slug in slugs
+            if (published := published_by_slug[slug]) is not None
+        }
+        ordered = sorted(days, key=days.__getitem__)
+        archive_by_lang[lang] = PostArchive(tuple(days[slug] for slug in ordered), tuple(ordered))
+    return archive_by_lang
+
+
+def _search_document(post: CompactPost) -> SearchDocument:
+    return SearchDocument(
+        post.slug, post.language, post.title, post.excerpt, post.tags, post.content_in_markdown
+    )
+
+
+class ContentIndex:
+    """Immutable snapshot of site content with validated models and lookup tables.
+
+    Posts and menu items are validated when the index is built, so queries never validate
+    raw dicts. Posts are kept as CompactPost, which takes a fraction of memory of a model,
+    and queries build models from them without validation. Pages are often incomplete
+    in existing data files, so each page is validated on its first lookup and memoized.
+    Menu items and pages are shared between calls and must be treated as read-only.
+    Posts and pages are indexed by slug; the first entry with a given slug wins.
+    Per-language and per-tag post lists are kept sorted by date, newest first,
+    so listing queries never sort at request time, and per-language archives
+    find posts published within a period with a binary search. Posts are indexed for full-text
+    search and for completing titles and tags by prefix, and related posts of each post
+    are computed in batch by a background thread; comments are not searchable,
+    so adding them keeps all of those.
+
+    The index keeps the data it was built from and neither of them is modified after
+    they are built. Changes produce a new index (copy-on-write), so readers can use
+    a snapshot without locking while a writer prepares the next one.
+    """
+
+    def __init__(
+        self,
+        data: Dict[str, Any],
+        posts: Optional[Iterable[Dict[str, Any]]] = None,
+        previous: Optional["ContentIndex"] = None,
+    ):
+        """`posts` may be given to index posts while they are loaded into `data`, in which
+        case `data` has to be complete once they are all iterated over.
+        `previous` is an index of earlier content, whose search index gets updated only
+        with posts which have changed instead of being built from scratch, and whose
+        related posts are reused for languages without changed posts.
+        """
+        self.data = data
+        self.raw_posts_by_slug: Dict[str, Dict[str, Any]] = {}
+        self.post_positions: Dict[str, int] = {}
+        self.posts_by_slug: Dict[str, CompactPost] = {}
+        self.raw_pages_by_slug: Dict[str, Dict[str, Any]] = {}
+        self.pages_by_slug: Dict[str, Page] = {}
+        self.menu_items_by_lang: Dict[str, tuple[MenuItem, ...]] = {}
+
+        if posts is None:
+            raw_posts: Iterable[Dict[str, Any]] = (data.get("site_content") or {}).get(
+                "posts"
+            ) or ()
+        else:
+            raw_posts = posts
+        for position, raw_post in enumerate(raw_posts):
+            slug = raw_post["slug"]
+            if slug in self.posts_by_slug:
+                continue
+            post = CompactPost.from_post(Post.model_validate(raw_post))
+            self.raw_posts_by_slug[slug] = raw_post
+            self.post_positions[slug] = position
+            self.posts_by_slug[slug] = post
+        self.slugs_by_lang, self.slugs_by_tag = sort_post_listings(self.posts_by_slug.values())
+        self.archive_by_lang = sort_post_archive(
+            self.slugs_by_lang,
+            {slug: post.published for slug, post in self.posts_by_slug.items()},
+        )
+        documents = {slug: _search_document(post) for slug, post in self.posts_by_slug.items()}
+        self.search = self._build_search(documents, previous)
+        self.typeahead = TypeaheadIndex.build(documents.values())
+        # newest first, so tags relate posts published close to each other
+        self.related = RelatedPosts.build(
+            (documents[slug] for slugs in self.slugs_by_lang.values() for slug in slugs),
+            None if previous is None else previous.related,
+        )
+
+        site_content = data.get("site_content") or {}
+        for raw_page in site_content.get("pages") or ():
+            self.raw_pages_by_slug.setdefault(raw_page["slug"], raw_page)
+
+        for lang, raw_items in (site_content.get("menu_items") or {}).items():
+            self.menu_items_by_lang[lang] = tuple(MenuItem.model_validate(x) for x in raw_items)
+
+    def _build_search(
+        self, documents: Dict[str, SearchDocument], previous: Optional["ContentIndex"]
+    ) -> SearchIndex:
+        if previous is None:
+            return SearchIndex.build(documents.values())
+        removed: list[tuple[str, str]] = []
+        for slug, old_post in previous.posts_by_slug.items():
+            if documents.get(slug) != _search_document(old_post):
+                removed.append((old_post.language, slug))
+        added = [
+            document
+            for slug, document in documents.items()
+            if slug not in previous.posts_by_slug
+            or _search_document(previous.posts_by_slug[slug]) != document
+        ]
+        return previous.search.updated(added, removed)
+
+    def get_site_content(self) -> Dict[str, Any]:
+        content = self.data.get("site_content")
+        if content is None:
+            raise Exception("Content should not be None")
+        return content
+
+    def get_page(self, slug: str) -> Optional[Page]:
+        page = self.pages_by_slug.get(slug)
+        if page is None and (raw_page := self.raw_pages_by_slug.get(slug)) is not None:
+            # memoizing is safe to share between snapshots, pages never change within one
+            page = self.pages_by_slug[slug] = Page.model_validate(raw_page)
+        return page
+
+    def with_comments(self, comments: Iterable[tuple[str, Dict[str, str]]]) -> "ContentIndex":
+        """Returns a new index with comments appended to posts with given slugs.
+
+        Only commented posts are copied and validated again, everything else is shared
+        with this index, which stays intact.
+        """
+        comments_by_slug: Dict[str, list[Dict[str, str]]] = {}
+        for post_slug, comment in comments:
+            if post_slug not in self.raw_posts_by_slug:
+                raise StopIteration(f"Post with slug {post_slug} not found")
+            comments_by_slug.setdefault(post_slug, []).append(comment)
+        if not comments_by_slug:
+            return self
+
+        index = copy.copy(self)
+        index.raw_posts_by_slug = dict(self.raw_posts_by_slug)
+        index.posts_by_slug = dict(self.posts_by_slug)
+        raw_posts = list(self.get_site_content()["posts"])
+        for slug, new_comments in comments_by_slug.items():
+            raw_post = self.raw_posts_by_slug[slug]
+            raw_post = {**raw_post, "comments": [*raw_post["comments"], *new_comments]}
+            raw_posts[self.post_positions[slug]] = raw_post
+            index.raw_posts_by_slug[slug] = raw_post
+            index.posts_by_slug[slug] = CompactPost.from_post(Post.model_validate(raw_post))
+        index.data = {**self.data, "site_content": {**self.get_site_content(), "posts": raw_posts}}
+        return index
+
+
 class Json(DB):
-    def __init__(self, data: Dict[str, Any]):
+    def __init__(self, data: Dict[str, Any], index: Optional[ContentIndex] = None):
+        """`index` may be given when an index of `data` was already built elsewhere."""
         super().__init__()
+        self._index = ContentIndex(data) if index is None else index
+        self._lock = threading.Lock()
         self.data: Dict[str, Any] = data
         self.module_name = "json_db"
         self.db_name = "JsonDb"
 
+    def _current_index(self) -> ContentIndex:
+        """Returns index of current content. Every query reads it once, so content swapped
+        in the meantime (e.g. by reloading) can't mix with the one the query started with.
+        """
+        return self._index
+
+    def _swap_index(self, index: ContentIndex) -> None:
+        """Publishes a new snapshot. Writers must hold the lock, readers never take it."""
+        self._index = index
+        self.data = index.data
+
     def get_app_description(self, lang):
         description = self._get_site_content().get("app_description", {})
         return description.get(lang, None)
 
     def get_all_posts(self, lang):
-        return [
-            Post.model_validate(post)
-            for post in self._get_site_content().get("posts", ())
-            if post["language"] == lang
-        ]
+        index = self._current_index()
+        index.get_site_content()
+        return [index.posts_by_slug[slug].to_post() for slug in index.slugs_by_lang.get(lang, ())]
+
+    def get_post_summaries(self, lang, offset=0, limit=None, tag=None):
+        index = self._current_index()
+        index.get_site_content()
+        if tag is None:
+            slugs = index.slugs_by_lang.get(lang, ())
+        else:
+            slugs = index.slugs_by_tag.get((tag, lang), ())
+        end = None if limit is None else offset + limit
+        return [index.posts_by_slug[slug].to_summary() for slug in slugs[offset:end]]
+
+    def get_post_summaries_between(self, lang, start, end, offset=0, limit=None):
+        index = self._current_index()
+        archive = index.archive_by_lang.get(lang)
+        slugs = () if archive is None else archive.between(start, end)
+        end_position = None if limit is None else offset + limit
+        return [index.posts_by_slug[slug].to_summary() for slug in slugs[offset:end_position]]
+
+    def search_posts(self, lang, query, offset=0, limit=None):
+        index = self._current_index()
+        end = None if limit is None else offset + limit
+        slugs = index.search.search(lang, query, end)[offset:]
+        return [index.posts_by_slug[slug].to_summary() for slug in slugs]
+
+    def get_search_suggestions(self, lang, prefix, limit=10):
+        return self._current_index().typeahead.suggest(lang, prefix, limit)
+
+    def get_related_posts(self, lang, slug, limit=3):
+        index = self._current_index()
+        slugs = index.related.get(lang, slug, limit)
+        return [index.posts_by_slug[related].to_summary() for related in slugs]
 
     def get_post(self, slug: str) -> Post:
         """Returns a post matching the given slug."""
-        all_posts = self._get_site_content().get("posts")
-        if all_posts is None:
+        index = self._current_index()
+        if index.get_site_content().get("posts") is None:
             raise ValueError("Posts data is missing")
-        wanted_post = next((post for post in all_posts if post["slug"] == slug), None)
+        wanted_post = index.posts_by_slug.get(slug)
         if wanted_post is None:
             raise ValueError(f"Post with slug {slug} not found")
-        return Post.model_validate(wanted_post)
+        return wanted_post.to_post()
+
+    def get_posts_by_slugs(self, slugs):
+        index = self._current_index()
+        posts = (index.posts_by_slug.get(slug) for slug in slugs)
+        return [post.to_post() for post in posts if post is not None]
 
-    # TODO: add test for non-existing page
     def get_page(self, slug):
-        list_of_pages = (
-            page for page in self._get_site_content().get("pages") if page["slug"] == slug
-        )
-        page = Post.model_validate(next(list_of_pages))
+        index = self._current_index()
+        index.get_site_content()
+        page = index.get_page(slug)
+        if page is None:
+            raise StopIteration(f"Page with slug {slug} not found")
         return page
 
     def get_menu_items_in_lang(self, lang) -> list[MenuItem]:
-        menu_items_raw = self._get_site_content().get("menu_items", {})
-        items_in_lang = menu_items_raw.get(lang, {})
-
-        menu_items_list = [MenuItem.model_validate(x) for x in items_in_lang]
-        return menu_items_list
+        index = self._current_index()
+        index.get_site_content()
+        return list(index.menu_items_by_lang.get(lang, ()))
 
     def get_posts_by_tag(self, tag, lang):
-        return (
-            post
-            for post in self._get_site_content()["posts"]
-            if tag in post["tags"] and post["language"] == lang
-        )
+        index = self._current_index()
+        index.get_site_content()
+        slugs = index.slugs_by_tag.get((tag, lang), ())
+        return (index.raw_posts_by_slug[slug] for slug in slugs)
 
     def _get_site_content(self):
-        content = self.data.get("site_content")
-        if content is None:
-            raise Exception("Content should not be None")
-        return content
+        return self._current_index().get_site_content()
 
     def get_logo_url(self):
         return self._get_site_content().get("logo_url", "")
@@ -106,13 +347,16 @@ class Json(DB):
             "comment": str(comment),
             "date": datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
         }
+        with self._lock:
+            self._append_comment(post_slug, comment)
 
-        post_index = next(
-            i
-            for i in range(len(self._get_site_content()["posts"]))
-            if self._get_site_content()["posts"][i]["slug"] == post_slug
-        )
-        self._get_site_content()["posts"][post_index]["comments"].append(comment)
+    def _append_comment(self, post_slug: str, comment: Dict[str, str]) -> None:
+        """Appends an already formatted comment to the post with given slug.
+        Must be called with the lock held.
+        """
+        index = self._current_index()
+        index.get_site_content()
+        self._swap_index(index.with_comments([(post_slug, comment)]))
 
     def get_plugins_data(self):
-        return self.data.get("plugins", [])
+        return self._current_index().data.get("plugins", [])
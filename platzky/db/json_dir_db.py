@@ -0,0 +1,276 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+from urllib.parse import quote
+
+from pydantic import Field
+
+from platzky.models import MenuItem, Page, Post, PostSummary, parse_post_date
+
+from .db import DB, DBConfig
+from .files import atomic_write
+from .json_db import ContentIndex, sort_post_archive, sort_post_listings
+from .search_index import SearchDocument, SearchIndex
+from .typeahead import TypeaheadIndex
+
+MANIFEST_FILE = "manifest.json"
+POSTS_DIR = "posts"
+PAGES_DIR = "pages"
+
+logger = logging.getLogger(__name__)
+
+
+def db_config_type():
+    return JsonDirDbConfig
+
+
+class JsonDirDbConfig(DBConfig):
+    path: str = Field(alias="PATH")
+    cache_size: int = Field(default=256, alias="CACHE_SIZE", gt=0)
+
+
+def get_db(config):
+    json_dir_db_config = JsonDirDbConfig.model_validate(config)
+    return db_from_config(json_dir_db_config)
+
+
+def db_from_config(config: JsonDirDbConfig):
+    return JsonDir(config.path, cache_size=config.cache_size)
+
+
+def _item_path(path: str, directory: str, slug: str) -> str:
+    return os.path.join(path, directory, f"{quote(slug, safe='')}.json")
+
+
+def write_json_dir(data: Dict[str, Any], path: str) -> None:
+    """Splits data in the json_file format into a directory readable by JsonDir.
+
+    The manifest keeps everything from the original data except bodies of posts and pages:
+    posts are listed by their summaries and pages by their slugs. Every post and page
+    is written in full to its own file.
+    """
+    index = ContentIndex(data)
+    site_content = dict(index.get_site_content())
+    site_content["posts"] = [
+        post.to_summary().model_dump(mode="json") for post in index.posts_by_slug.values()
+    ]
+    site_content["pages"] = list(index.raw_pages_by_slug)
+    manifest = {**data, "site_content": site_content}
+
+    for directory in (POSTS_DIR, PAGES_DIR):
+        os.makedirs(os.path.join(path, directory), exist_ok=True)
+    for slug, raw_post in index.raw_posts_by_slug.items():
+        atomic_write(_item_path(path, POSTS_DIR, slug), json.dumps(raw_post))
+    for slug, raw_page in index.raw_pages_by_slug.items():
+        atomic_write(_item_path(path, PAGES_DIR, slug), json.dumps(raw_page))
+    atomic_write(os.path.join(path, MANIFEST_FILE), json.dumps(manifest))
+
+
+class JsonDir(DB):
+    """Content stored in a directory: a manifest plus one file per post and page.
+
+    Only the manifest, which holds settings, menu items and summaries of posts, is read
+    at startup. Full posts and pages are read on first access and kept in a cache of
+    at most `cache_size` items, dropping the least recently used one when it is full,
+    so memory use depends on the size of the manifest rather than of the whole content.
+
+    Search is the exception: the first search starts reading every post file in
+    a background thread, to build a full-text index of all posts which is then kept
+    in memory. Searches find nothing until it's built. Suggestions come from titles
+    and tags in the manifest, so they never read post files.
+    """
+
+    def __init__(self, path: str, cache_size: int = 256):
+        super().__init__()
+        self.path = path
+        self.cache_size = cache_size
+        self.module_name = "json_dir_db"
+        self.db_name = "JsonDirDb"
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str], Union[Post, Page]] = OrderedDict()
+        self._writes = 0
+
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            self.manifest: Dict[str, Any] = json.load(manifest_file)
+        site_content = self._get_site_content()
+        self._summaries_by_slug: Dict[str, PostSummary] = {}
+        for raw_summary in site_content.get("posts") or ():
+            summary = PostSummary.model_validate(raw_summary)
+            self._summaries_by_slug.setdefault(summary.slug, summary)
+        self._page_slugs = frozenset(site_content.get("pages") or ())
+        self._slugs_by_lang, self._slugs_by_tag = sort_post_listings(
+            self._summaries_by_slug.values()
+        )
+        self._archive_by_lang = sort_post_archive(
+            self._slugs_by_lang,
+            {slug: parse_post_date(s.date) for slug, s in self._summaries_by_slug.items()},
+        )
+        # titles and tags are all in the manifest, so suggestions never read post files
+        self._typeahead = TypeaheadIndex.build(
+            SearchDocument(
+                summary.slug, summary.language, summary.title, "", tuple(summary.tags), ""
+            )
+            for summary in self._summaries_by_slug.values()
+        )
+        self._search: Optional[SearchIndex] = None
+        self._search_build: Optional[threading.Thread] = None
+        self._menu_items_by_lang = {
+            lang: tuple(MenuItem.model_validate(x) for x in raw_items)
+            for lang, raw_items in (site_content.get("menu_items") or {}).items()
+        }
+
+    def _get_site_content(self) -> Dict[str, Any]:
+        content = self.manifest.get("site_content")
+        if content is None:
+            raise Exception("Content should not be None")
+        return content
+
+    def _cached(self, key: tuple[str, str]) -> Optional[Union[Post, Page]]:
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None:
+                self._cache.move_to_end(key)
+            return item
+
+    def _remember(self, key: tuple[str, str], item: Union[Post, Page], writes: int) -> None:
+        """Caches an item read when `writes` comments were written so far, unless some
+        comment was written since, as the item might have been read before it.
+        """
+        with self._lock:
+            if writes != self._writes:
+                return
+            self._cache[key] = item
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _read_item(self, directory: str, slug: str) -> Dict[str, Any]:
+        with open(_item_path(self.path, directory, slug)) as item_file:
+            return json.load(item_file)
+
+    def _load_post(self, slug: str) -> Post:
+        post = self._cached((POSTS_DIR, slug))
+        if post is None:
+            writes = self._writes
+            post = Post.model_validate(self._read_item(POSTS_DIR, slug))
+            self._remember((POSTS_DIR, slug), post, writes)
+        assert isinstance(post, Post)
+        return post
+
+    def get_app_description(self, lang):
+        description = self._get_site_content().get("app_description", {})
+        return description.get(lang, None)
+
+    def get_all_posts(self, lang):
+        return [self._load_post(slug) for slug in self._slugs_by_lang.get(lang, ())]
+
+    def get_post_summaries(self, lang, offset=0, limit=None, tag=None):
+        if tag is None:
+            slugs = self._slugs_by_lang.get(lang, ())
+        else:
+            slugs = self._slugs_by_tag.get((tag, lang), ())
+        end = None if limit is None else offset + limit
+        return [self._summaries_by_slug[slug] for slug in slugs[offset:end]]
+
+    def get_post_summaries_between(self, lang, start, end, offset=0, limit=None):
+        archive = self._archive_by_lang.get(lang)
+        slugs = () if archive is None else archive.between(start, end)
+        end_position = None if limit is None else offset + limit
+        return [self._summaries_by_slug[slug] for slug in slugs[offset:end_position]]
+
+    def search_posts(self, lang, query, offset=0, limit=None):
+        search = self._search
+        if search is None:
+            self._start_search_build()
+            return []
+        end = None if limit is None else offset + limit
+        return [self._summaries_by_slug[slug] for slug in search.search(lang, query, end)[offset:]]
+
+    def _start_search_build(self) -> None:
+        with self._lock:
+            if self._search_build is None:
+                self._search_build = threading.Thread(target=self._build_search, daemon=True)
+                self._search_build.start()
+
+    def _build_search(self) -> None:
+        # posts are read past the cache, so indexing them doesn't evict what's in use
+        def documents():
+            for slug, summary in self._summaries_by_slug.items():
+                post = Post.model_validate(self._read_item(POSTS_DIR, slug))
+                yield SearchDocument(
+                    slug,
+                    summary.language,
+                    post.title,
+                    post.excerpt,
+                    tuple(post.tags),
+                    post.contentInMarkdown,
+                )
+
+        try:
+            self._search = SearchIndex.build(documents())
+        except Exception:
+            logger.exception(f"Could not build search index of {self.path}")
+
+    def get_search_suggestions(self, lang, prefix, limit=10):
+        return self._typeahead.suggest(lang, prefix, limit)
+
+    def get_post(self, slug: str) -> Post:
+        """Returns a post matching the given slug."""
+        if slug not in self._summaries_by_slug:
+            raise ValueError(f"Post with slug {slug} not found")
+        return self._load_post(slug)
+
+    def get_page(self, slug):
+        if slug not in self._page_slugs:
+            raise StopIteration(f"Page with slug {slug} not found")
+        page = self._cached((PAGES_DIR, slug))
+        if page is None:
+            writes = self._writes
+            page = Page.model_validate(self._read_item(PAGES_DIR, slug))
+            self._remember((PAGES_DIR, slug), page, writes)
+        return page
+
+    def get_menu_items_in_lang(self, lang) -> list[MenuItem]:
+        return list(self._menu_items_by_lang.get(lang, ()))
+
+    def get_posts_by_tag(self, tag, lang):
+        slugs = self._slugs_by_tag.get((tag, lang), ())
+        return (self._load_post(slug).model_dump() for slug in slugs)
+
+    def get_logo_url(self):
+        return self._get_site_content().get("logo_url", "")
+
+    def get_favicon_url(self):
+        return self._get_site_content().get("favicon_url", "")
+
+    def get_font(self) -> str:
+        return self._get_site_content().get("font", "")
+
+    def get_primary_color(self):
+        return self._get_site_content().get("primary_color", "white")
+
+    def get_secondary_color(self):
+        return self._get_site_content().get("secondary_color", "navy")
+
+    def add_comment(self, author_name, comment, post_slug):
+        if post_slug not in self._summaries_by_slug:
+            raise StopIteration(f"Post with slug {post_slug} not found")
+        comment = {
+            "author": str(author_name),
+            "comment": str(comment),
+            "date": datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._lock:
+            raw_post = self._read_item(POSTS_DIR, post_slug)
+            raw_post["comments"] = [*(raw_post.get("comments") or []), comment]
+            atomic_write(_item_path(self.path, POSTS_DIR, post_slug), json.dumps(raw_post))
+            self._writes += 1
+            # next read loads the post together with the new comment
+            self._cache.pop((POSTS_DIR, post_slug), None)
+
+    def get_plugins_data(self):
+        return self.manifest.get("plugins", [])
@@ -1,9 +1,27 @@
+import contextlib
+import hashlib
 import json
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Any, Dict, Generator, Iterator, Optional
 
-from pydantic import Field
+import pydantic
+from pydantic import Field, ValidationError
 
 from .db import DBConfig
-from .json_db import Json
+from .files import atomic_write, compress, compression_of, open_text, read_bytes
+from .json_db import ContentIndex, Json
+from .json_stream import load_content_index
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 
 def db_config_type():
@@ -12,30 +30,481 @@ def db_config_type():
 
 class JsonFileDbConfig(DBConfig):
     path: str = Field(alias="PATH")
+    comments_journal: bool = Field(default=False, alias="COMMENTS_JOURNAL")
+    journal_max_size: int = Field(default=1024 * 1024, alias="JOURNAL_MAX_SIZE", gt=0)
+    journal_max_age: float = Field(default=300.0, alias="JOURNAL_MAX_AGE", ge=0)
+    reload_interval: Optional[float] = Field(default=None, alias="RELOAD_INTERVAL", gt=0)
+    multi_process: bool = Field(default=False, alias="MULTI_PROCESS")
+    multi_process_check_interval: float = Field(
+        default=1.0, alias="MULTI_PROCESS_CHECK_INTERVAL", ge=0
+    )
+    snapshot: bool = Field(default=False, alias="SNAPSHOT")
+    streaming_load: bool = Field(default=False, alias="STREAMING_LOAD")
 
 
 def get_db(config):
     json_file_db_config = JsonFileDbConfig.model_validate(config)
-    return JsonFile(json_file_db_config.path)
+    return db_from_config(json_file_db_config)
 
 
 def db_from_config(config: JsonFileDbConfig):
-    return JsonFile(config.path)
+    return JsonFile(
+        config.path,
+        comments_journal=config.comments_journal,
+        journal_max_size=config.journal_max_size,
+        journal_max_age=config.journal_max_age,
+        reload_interval=config.reload_interval,
+        multi_process=config.multi_process,
+        multi_process_check_interval=config.multi_process_check_interval,
+        snapshot=config.snapshot,
+        streaming_load=config.streaming_load,
+    )
 
 
-class JsonFile(Json):
+FileSignature = tuple[int, int, int]
+
+
+def _file_signature(path: str) -> FileSignature:
+    """Cheap fingerprint of a file which changes whenever the file is modified or replaced."""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# bump whenever ContentIndex changes in a way which makes older pickles unusable
+SNAPSHOT_FORMAT = 7
+
+
+def snapshot_path(path: str) -> str:
+    return f"{path}.snapshot"
+
+
+def _snapshot_header(data_hash: str) -> Dict[str, object]:
+    return {"format": SNAPSHOT_FORMAT, "pydantic": pydantic.VERSION, "source_sha256": data_hash}
+
+
+def build_snapshot(path: str) -> str:
+    """Builds a binary snapshot of the data file at path and returns the snapshot's path.
+
+    The snapshot is a pickled ContentIndex, with pages validated upfront as well,
+    preceded by a header with the SHA-256 of the data file it was built from.
+    Snapshots are trusted like code, only load ones built by yourself.
+    """
+    raw_data = read_bytes(path, compression_of(path))
+    index = ContentIndex(json.loads(raw_data))
+    for slug in index.raw_pages_by_slug:
+        with contextlib.suppress(ValidationError):
+            index.get_page(slug)
+    header = _snapshot_header(hashlib.sha256(raw_data).hexdigest())
+    atomic_write(
+        snapshot_path(path),
+        pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+        + pickle.dumps(index, pickle.HIGHEST_PROTOCOL),
+    )
+    return snapshot_path(path)
+
+
+def _load_snapshot(path: str, data_hash: str) -> Optional[ContentIndex]:
+    """Loads the snapshot of the data file at path if it was built from content with given hash
+    by a compatible version. Returns None if there is no such snapshot.
+    """
+    try:
+        with open(snapshot_path(path), "rb") as snapshot_file:
+            if pickle.load(snapshot_file) != _snapshot_header(data_hash):
+                logger.info(f"Snapshot of {path} is stale, parsing data file")
+                return None
+            index = pickle.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning(f"Snapshot of {path} is unreadable, parsing data file", exc_info=True)
+        return None
+    return index if isinstance(index, ContentIndex) else None
+
+
+class _CommentJournal:
+    """Append-only log of comments which are not compacted into the data file yet.
+
+    Every line is a JSON object with the slug of a post and a comment added to it.
+    `offset` is the position up to which entries were applied to content in memory.
+    """
+
     def __init__(self, path: str):
+        self.path = path
+        with open(self.path, "ab") as journal_file:
+            self.offset = journal_file.tell()
+        self.inode = os.stat(self.path).st_ino
+        self.started_at: Optional[float] = time.monotonic() if self.offset else None
+
+    def _read_from(self, offset: int) -> tuple[list[tuple[str, Dict[str, str]]], int]:
+        """Returns complete entries written after `offset` and the position after them.
+
+        A line without trailing newline is being written by someone else, so it's left
+        for the next read.
+        """
+        with open(self.path, "rb") as journal_file:
+            journal_file.seek(offset)
+            chunk = journal_file.read()
+        complete_size = chunk.rfind(b"\n") + 1
+        entries = []
+        for line in chunk[:complete_size].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping incomplete entry in comments journal {self.path}")
+                continue
+            entries.append((entry["post_slug"], entry["comment"]))
+        return entries, offset + complete_size
+
+    def close_incomplete_entry(self) -> None:
+        """Ends an entry cut short by a crash, so that the next one doesn't stick to it.
+        Must be called when nobody else is appending.
+        """
+        with open(self.path, "rb+") as journal_file:
+            if journal_file.seek(0, os.SEEK_END) == 0:
+                return
+            journal_file.seek(-1, os.SEEK_END)
+            if journal_file.read(1) != b"\n":
+                journal_file.write(b"\n")
+
+    def entries(self) -> Iterator[tuple[str, Dict[str, str]]]:
+        entries, _ = self._read_from(0)
+        return iter(entries)
+
+    def catch_up(self, index: ContentIndex, from_start: bool = False) -> ContentIndex:
+        """Returns index with entries which it doesn't contain yet, e.g. appended by other
+        processes. With `from_start`, the whole journal is checked.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return index
+        replaced = stat.st_ino != self.inode or stat.st_size < self.offset
+        if not (from_start or replaced) and stat.st_size == self.offset:
+            return index
+        entries, self.offset = self._read_from(0 if from_start or replaced else self.offset)
+        self.inode = stat.st_ino
+        if self.offset and self.started_at is None:
+            self.started_at = time.monotonic()
+
+        new_entries = []
+        for post_slug, comment in entries:
+            raw_post = index.raw_posts_by_slug.get(post_slug)
+            if raw_post is None:
+                logger.warning(f"Skipping journaled comment to unknown post {post_slug}")
+            elif comment not in raw_post["comments"]:
+                # comment may be already in the data file if compaction was interrupted
+                new_entries.append((post_slug, comment))
+        return index.with_comments(new_entries)
+
+    def append(self, post_slug: str, comment: Dict[str, str]) -> None:
+        entry = {"post_slug": post_slug, "comment": comment}
+        raw = json.dumps(entry).encode("utf-8") + b"\n"
+        with open(self.path, "ab") as journal_file:
+            journal_file.write(raw)
+        self.offset += len(raw)
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+    def drop_before(self, offset: int) -> None:
+        """Removes first `offset` bytes of the journal, keeping entries appended after them."""
+        with open(self.path, "rb") as journal_file:
+            journal_file.seek(offset)
+            rest = journal_file.read()
+        atomic_write(self.path, rest)
+        self.inode = os.stat(self.path).st_ino
+        self.offset = len(rest)
+        self.started_at = time.monotonic() if rest else None
+
+
+class JsonFile(Json):
+    """Json DB stored in a file.
+
+    By default every comment rewrites the whole file. With `comments_journal` enabled, comments
+    are appended to a journal next to the data file instead, which is replayed on startup
+    and compacted into the data file in the background once it grows over `journal_max_size`
+    bytes or gets older than `journal_max_age` seconds.
+
+    With `reload_interval` set, a background thread checks the data file every that many
+    seconds and, when its content has changed, parses it and swaps the whole content
+    at once. Requests in flight keep using content they have started with.
+
+    With `multi_process` enabled, many processes (e.g. gunicorn workers) can share the files.
+    Writes hold an advisory lock on `<path>.lock` and are applied on top of the latest
+    content on disk. Queries check at most every `multi_process_check_interval` seconds
+    whether other processes have changed the files. New journal entries are applied
+    incrementally, only a changed data file is parsed again, by a background thread,
+    while queries keep using current content. Enabling `comments_journal` as well means
+    comments of other processes never need the data file parsed again.
+
+    Data files compressed with gzip or zstd (the latter needs the zstandard package) are
+    detected by their extension or first bytes, decompressed while they are read and
+    compressed again when saved. Saving always replaces the whole file atomically.
+
+    With `snapshot` enabled, content is loaded from a snapshot made by `build_snapshot`
+    when it was built from the current data file, which skips parsing and validation.
+    Otherwise, the data file is parsed as usual.
+
+    With `streaming_load` enabled, the data file is parsed incrementally on startup and posts
+    are validated as they are parsed, so the whole text of the file is never held in memory
+    next to the content parsed from it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        comments_journal: bool = False,
+        journal_max_size: int = 1024 * 1024,
+        journal_max_age: float = 300.0,
+        reload_interval: Optional[float] = None,
+        multi_process: bool = False,
+        multi_process_check_interval: float = 1.0,
+        snapshot: bool = False,
+        streaming_load: bool = False,
+    ):
+        if multi_process and fcntl is None:
+            raise ValueError("Multi process mode of JsonFile requires fcntl file locks")
         self.data_file_path = path
-        with open(self.data_file_path) as json_file:
-            data = json.load(json_file)
-            super().__init__(data)
+        self._data_file_signature: Optional[FileSignature] = None
+        self._data_file_hash: Optional[str] = None
+        if reload_interval is not None or multi_process:
+            self._data_file_signature = _file_signature(self.data_file_path)
+        self._compression = compression_of(self.data_file_path)
+        self._snapshot = snapshot
+        if snapshot:
+            raw_data = read_bytes(self.data_file_path, self._compression)
+            self._data_file_hash = hashlib.sha256(raw_data).hexdigest()
+            index = self._index_from(raw_data, self._data_file_hash, previous=None)
+            super().__init__(index.data, index=index)
+        else:
+            with open_text(self.data_file_path, self._compression) as json_file:
+                if streaming_load:
+                    index = load_content_index(json_file)
+                    super().__init__(index.data, index=index)
+                else:
+                    super().__init__(json.load(json_file))
         self.module_name = "json_file_db"
         self.db_name = "JsonFileDb"
 
+        self._lock_file_path = f"{self.data_file_path}.lock" if multi_process else None
+        self._check_interval = multi_process_check_interval
+        self._next_check = time.monotonic() + multi_process_check_interval
+        self._background_reload: Optional[threading.Thread] = None
+
+        self._journal: Optional[_CommentJournal] = None
+        self._journal_max_size = journal_max_size
+        self._journal_max_age = journal_max_age
+        self._compaction: Optional[threading.Timer] = None
+        self._compaction_running = False
+        if comments_journal:
+            with self._lock, self._file_lock():
+                self._journal = _CommentJournal(f"{self.data_file_path}.journal")
+                self._journal.close_incomplete_entry()
+                self._swap_index(self._journal.catch_up(self._index, from_start=True))
+                self._schedule_compaction(self._journal)
+
+        self._reload_interval = reload_interval
+        self._stop_reloading = threading.Event()
+        if reload_interval is not None:
+            self._reloader = threading.Thread(
+                target=self._watch_data_file, name=f"reload {path}", daemon=True
+            )
+            self._reloader.start()
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Generator[None, None, None]:
+        """Holds the advisory lock shared with other processes, if there may be any."""
+        if self._lock_file_path is None or fcntl is None:
+            yield
+            return
+        with open(self._lock_file_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _current_index(self) -> ContentIndex:
+        if self._lock_file_path is not None and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self._check_interval
+            # a busy lock means a write is in progress, which will refresh content anyway
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._catch_up_with_other_processes()
+                except Exception:
+                    logger.exception(f"Refreshing {self.data_file_path} failed")
+                finally:
+                    self._lock.release()
+        return self._index
+
+    def _catch_up_with_other_processes(self) -> None:
+        """Applies new journal entries, or starts reloading the data file in the background
+        if it has changed, so queries never wait for it to be parsed. Must be called
+        with the lock held.
+        """
+        if _file_signature(self.data_file_path) != self._data_file_signature:
+            if self._background_reload is None or not self._background_reload.is_alive():
+                self._background_reload = threading.Thread(
+                    target=self._reload_logging_errors,
+                    name=f"reload {self.data_file_path}",
+                    daemon=True,
+                )
+                self._background_reload.start()
+        elif self._journal is not None:
+            self._swap_index(self._journal.catch_up(self._index))
+
     def __save_file(self):
-        with open(self.data_file_path, "w") as json_file:
-            json.dump(self.data, json_file)
+        self._write_data_file(self.data)
+        self._data_file_written()
+
+    def _write_data_file(self, data: Dict[str, Any]) -> None:
+        """Replaces the data file atomically, so neither readers nor a crash see half of it."""
+        raw_data = json.dumps(data).encode("utf-8")
+        atomic_write(self.data_file_path, compress(raw_data, self._compression))
+
+    def _data_file_written(self) -> None:
+        """Marks own writes as already loaded, so that reloading doesn't parse them again."""
+        if self._data_file_signature is not None:
+            self._data_file_signature = _file_signature(self.data_file_path)
+            self._data_file_hash = None
+
+    def _load_if_changed(self) -> Optional[tuple[ContentIndex, FileSignature, str]]:
+        """Parses the data file if it has changed since it was loaded last time."""
+        signature = _file_signature(self.data_file_path)
+        if signature == self._data_file_signature:
+            return None
+        raw_data = read_bytes(self.data_file_path, self._compression)
+        data_hash = hashlib.sha256(raw_data).hexdigest()
+        if data_hash == self._data_file_hash:
+            self._data_file_signature = signature
+            return None
+
+        try:
+            index = self._index_from(raw_data, data_hash, previous=self._index)
+            return index, signature, data_hash
+        except Exception:
+            # don't retry until the file changes again, e.g. when it's still being written
+            self._data_file_signature = signature
+            raise
+
+    def _index_from(
+        self, raw_data: bytes, data_hash: str, previous: Optional[ContentIndex]
+    ) -> ContentIndex:
+        if self._snapshot and (index := _load_snapshot(self.data_file_path, data_hash)):
+            return index
+        return ContentIndex(json.loads(raw_data), previous=previous)
+
+    def _swap_loaded(self, index: ContentIndex, signature: FileSignature, data_hash: str) -> None:
+        """Replaces content with freshly loaded one. Must be called with the lock held."""
+        if self._journal is not None:
+            index = self._journal.catch_up(index, from_start=True)
+        self._swap_index(index)
+        self._data_file_signature = signature
+        self._data_file_hash = data_hash
+        logger.info(f"Reloaded {self.data_file_path}")
+
+    def _refresh(self) -> None:
+        """Applies changes made by other processes. Must be called with the lock held."""
+        if loaded := self._load_if_changed():
+            self._swap_loaded(*loaded)
+        elif self._journal is not None:
+            self._swap_index(self._journal.catch_up(self._index))
+
+    def _watch_data_file(self) -> None:
+        assert self._reload_interval is not None
+        while not self._stop_reloading.wait(self._reload_interval):
+            self._reload_logging_errors()
+
+    def _reload_logging_errors(self) -> None:
+        try:
+            self._reload_if_changed()
+        except Exception:
+            logger.exception(f"Reloading {self.data_file_path} failed")
+
+    def _reload_if_changed(self) -> bool:
+        """Reloads content if the data file has changed. Returns whether it was reloaded.
+
+        Parsing and indexing happen without the lock, so requests are served from
+        current content in the meantime.
+        """
+        loaded = self._load_if_changed()
+        if loaded is None:
+            return False
+        with self._lock:
+            if _file_signature(self.data_file_path) != loaded[1]:
+                return False
+            self._swap_loaded(*loaded)
+        return True
+
+    def _append_comment(self, post_slug, comment):
+        with self._file_lock():
+            # the data file may have been replaced since it was loaded, writes mustn't undo it
+            if self._data_file_signature is not None:
+                self._refresh()
+            super()._append_comment(post_slug, comment)
+            if self._journal is None:
+                self.__save_file()
+            else:
+                self._journal.append(post_slug, comment)
+                self._schedule_compaction(self._journal)
+
+    def _schedule_compaction(self, journal: _CommentJournal) -> None:
+        """Plans compaction of a non-empty journal. Must be called with the lock held."""
+        if not journal.offset or journal.started_at is None:
+            return
+        if journal.offset >= self._journal_max_size:
+            delay = 0.0
+        else:
+            age = time.monotonic() - journal.started_at
+            delay = max(self._journal_max_age - age, 0.0)
+
+        if self._compaction is not None:
+            if self._compaction_running or delay > 0:
+                return
+            self._compaction.cancel()
+        self._compaction = threading.Timer(delay, self._compact_journal, args=(journal,))
+        self._compaction.daemon = True
+        self._compaction.start()
+
+    def _compact_journal(self, journal: _CommentJournal) -> None:
+        """Writes current data to the data file and drops journal entries included in it.
+
+        Snapshot of data and the journal position matching it are taken together,
+        so comments posted during serialization and writing stay in the journal.
+        If other processes share the files, the whole compaction holds the locks instead.
+        """
+        with self._lock:
+            if self._compaction is not threading.current_thread():
+                return
+            self._compaction_running = True
+
+        try:
+            if self._lock_file_path is None:
+                with self._lock:
+                    if self._data_file_signature is not None:
+                        self._refresh()
+                    data = self.data
+                    compacted_size = journal.offset
+                self._write_data_file(data)
+                with self._lock:
+                    self._data_file_written()
+                    journal.drop_before(compacted_size)
+            else:
+                with self._lock, self._file_lock():
+                    self._refresh()
+                    self._write_data_file(self.data)
+                    self._data_file_written()
+                    journal.drop_before(journal.offset)
+        except Exception:
+            # next comment schedules another attempt
+            logger.exception(f"Compaction of comments journal {journal.path} failed")
+            with self._lock:
+                self._compaction = None
+                self._compaction_running = False
+            return
 
-    def add_comment(self, author_name, comment, post_slug):
-        super().add_comment(author_name, comment, post_slug)
-        self.__save_file()
+        with self._lock:
+            self._compaction = None
+            self._compaction_running = False
+            self._schedule_compaction(journal)
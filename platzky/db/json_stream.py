@@ -0,0 +1,131 @@
+import json
+from typing import IO, Any, Dict, Iterator, Optional
+
+from .json_db import ContentIndex
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """Reads JSON values one by one from a text stream, keeping only unparsed text in memory."""
+
+    def __init__(self, stream: IO[str], chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.at_end = False
+
+    def _fill(self, size: int) -> bool:
+        """Reads `size` more characters into the buffer. Returns False at the end of stream."""
+        chunk = "" if self.at_end else self.stream.read(size)
+        if not chunk:
+            self.at_end = True
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.buffer, self.position)
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character, or "" at the end of stream."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"Expecting '{char}'")
+        self.position += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            # reading at least as much as is buffered keeps retries of long values linear
+            more = max(self.chunk_size, len(self.buffer) - self.position)
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self._fill(more):
+                    continue
+                raise
+            # a number ending the buffer may go on in the next chunk
+            if end == len(self.buffer) and self._fill(more):
+                continue
+            self.position = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Yields keys of an object, the caller must read each member's value before continuing."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self.error("Expecting property name enclosed in double quotes")
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == "}":
+                self.position += 1
+                return
+            self.expect(",")
+
+    def items(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == "]":
+                self.position += 1
+                return
+            self.expect(",")
+
+
+def iter_posts(
+    stream: IO[str], data: Dict[str, Any], chunk_size: int = 64 * 1024
+) -> Iterator[Dict[str, Any]]:
+    """Parses a data file from stream into `data`, yielding posts one by one as they are parsed.
+
+    Posts are appended to `site_content.posts` of `data` as well. Everything else is parsed
+    as a whole, so `data` is complete once the iterator is exhausted.
+    """
+    reader = _Reader(stream, chunk_size)
+    for key in reader.members():
+        if key != "site_content" or reader.peek() != "{":
+            data[key] = reader.value()
+            continue
+        site_content: Dict[str, Any] = {}
+        data[key] = site_content
+        for content_key in reader.members():
+            if content_key != "posts" or reader.peek() != "[":
+                site_content[content_key] = reader.value()
+                continue
+            posts: list[Dict[str, Any]] = []
+            site_content[content_key] = posts
+            for post in reader.items():
+                posts.append(post)
+                yield post
+    if reader.peek():
+        raise reader.error("Extra data")
+
+
+def load_content_index(stream: IO[str], previous: Optional[ContentIndex] = None) -> ContentIndex:
+    """Builds index of a data file read from stream, validating posts while they are parsed.
+
+    Unlike `json.load`, this never holds the whole text of the file in memory at once,
+    so memory used while loading is close to the memory used by the loaded content.
+    `previous` is passed on to ContentIndex.
+    """
+    data: Dict[str, Any] = {}
+    return ContentIndex(data, posts=iter_posts(stream, data), previous=previous)
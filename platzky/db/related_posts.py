@@ -0,0 +1,187 @@
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+from .search_index import SearchDocument, tokenize
+
+# share of similarity coming from tags, the rest comes from texts
+TAGS_SHARE = 0.5
+# related posts kept for each post
+RELATED_COUNT = 5
+# only the highest weighted terms of each post are compared, rare words describe a post best
+MAX_TERMS = 64
+# each term relates only posts it weighs the most in, and each tag relates a post only to
+# as many posts next to it, so the number of posts compared with each post stays bounded
+MAX_POSTING = 20
+
+
+def _tf_idf(documents: list[SearchDocument]) -> Dict[str, Dict[str, float]]:
+    """Returns TF-IDF vectors of texts of documents, normalized and pruned to MAX_TERMS."""
+    frequencies = {
+        document.slug: Counter(tokenize(f"{document.title} {document.excerpt} {document.content}"))
+        for document in documents
+    }
+    document_frequencies: Counter[str] = Counter()
+    for terms in frequencies.values():
+        document_frequencies.update(terms.keys())
+
+    vectors: Dict[str, Dict[str, float]] = {}
+    for slug, terms in frequencies.items():
+        weights = {
+            term: (1 + math.log(count)) * math.log(len(documents) / document_frequencies[term])
+            for term, count in terms.items()
+        }
+        top = heapq.nlargest(MAX_TERMS, weights.items(), key=lambda item: item[1])
+        norm = math.sqrt(sum(weight * weight for _, weight in top))
+        vectors[slug] = {term: weight / norm for term, weight in top if weight} if norm else {}
+    return vectors
+
+
+def _jaccard(tags: set[str], other_tags: set[str]) -> float:
+    union = len(tags | other_tags)
+    return len(tags & other_tags) / union if union else 0.0
+
+
+def _related_in_language(documents: list[SearchDocument]) -> Dict[str, tuple[str, ...]]:
+    """Finds most similar posts for each post with sparse dot products: only posts sharing
+    a term or a tag with a post are ever compared with it, and each term and tag relates
+    at most about MAX_POSTING posts, so the cost grows linearly with the number of posts.
+    A tag relates each post to the posts next to it among documents with that tag,
+    so documents should be ordered, e.g. by date, to relate posts close to each other.
+    """
+    vectors = _tf_idf(documents)
+    postings: Dict[str, list[tuple[str, float]]] = {}
+    for slug, vector in vectors.items():
+        for term, weight in vector.items():
+            postings.setdefault(term, []).append((slug, weight))
+    tags_by_slug = {document.slug: set(document.tags) for document in documents}
+    slugs_by_tag: Dict[str, list[str]] = {}
+    for document in documents:
+        for tag in dict.fromkeys(document.tags):
+            slugs_by_tag.setdefault(tag, []).append(document.slug)
+
+    text_scores: Dict[str, Dict[str, float]] = {slug: {} for slug in vectors}
+    for posting in postings.values():
+        if len(posting) > MAX_POSTING:
+            posting = heapq.nlargest(MAX_POSTING, posting, key=lambda item: item[1])
+        for slug, weight in posting:
+            post_scores = text_scores[slug]
+            for other, other_weight in posting:
+                post_scores[other] = post_scores.get(other, 0.0) + weight * other_weight
+    candidates = {slug: set(post_scores) for slug, post_scores in text_scores.items()}
+    half = MAX_POSTING // 2
+    for slugs in slugs_by_tag.values():
+        for position, slug in enumerate(slugs):
+            candidates[slug].update(slugs[max(position - half, 0) : position + half + 1])
+
+    related: Dict[str, tuple[str, ...]] = {}
+    for slug, others in candidates.items():
+        others.discard(slug)
+        post_scores = text_scores[slug]
+        tags = tags_by_slug[slug]
+        scores = (
+            (
+                (1 - TAGS_SHARE) * post_scores.get(other, 0.0)
+                + TAGS_SHARE * _jaccard(tags, tags_by_slug[other]),
+                other,
+            )
+            for other in others
+        )
+        best = heapq.nlargest(RELATED_COUNT, (item for item in scores if item[0] > 0))
+        related[slug] = tuple(other for _, other in best)
+    return related
+
+
+class _LanguageRelatedPosts:
+    """Related posts among documents in one language, computed by a background thread."""
+
+    def __init__(self, documents: Dict[str, SearchDocument]):
+        self.documents = documents
+        self._related: Optional[Dict[str, tuple[str, ...]]] = None
+        self._start()
+
+    def _start(self) -> None:
+        self._ready = threading.Event()
+        threading.Thread(target=self._compute, name="related posts", daemon=True).start()
+
+    def _compute(self) -> None:
+        try:
+            self._related = _related_in_language(list(self.documents.values()))
+        finally:
+            self._ready.set()
+
+    def related(self) -> Optional[Dict[str, tuple[str, ...]]]:
+        """Returns related posts by slug, or None while they are still being computed."""
+        return self._related
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # pickled into snapshots of content, without the thread
+        return {"documents": self.documents, "related": self._related}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.documents = state["documents"]
+        self._related = state["related"]
+        if self._related is None:
+            self._start()
+        else:
+            self._ready = threading.Event()
+            self._ready.set()
+
+
+class RelatedPosts:
+    """Most similar posts of each post in the same language.
+
+    Similarity combines tag overlap (Jaccard index) and cosine similarity of TF-IDF
+    vectors of texts. Terms and tags shared by many posts relate each post to only some
+    of them (see MAX_POSTING), which keeps the cost linear in the number of posts.
+    Related posts of all posts in a language are computed in batch by a background thread
+    started when it's built, so neither loading content nor lookups ever compute any
+    similarity; until they are ready, no posts are related in that language.
+    Like SearchIndex, it's never modified: building it from a previous one shares
+    languages whose posts haven't changed, along with their results.
+    """
+
+    def __init__(self, languages: Dict[str, _LanguageRelatedPosts]):
+        self._languages = languages
+
+    @classmethod
+    def build(
+        cls, documents: Iterable[SearchDocument], previous: Optional["RelatedPosts"] = None
+    ) -> "RelatedPosts":
+        """Groups documents by language, reusing languages whose documents are the same
+        as in `previous`.
+        """
+        documents_by_lang: Dict[str, Dict[str, SearchDocument]] = {}
+        for document in documents:
+            documents_by_lang.setdefault(document.language, {})[document.slug] = document
+
+        languages: Dict[str, _LanguageRelatedPosts] = {}
+        for lang, language_documents in documents_by_lang.items():
+            reused = None if previous is None else previous._languages.get(lang)
+            if reused is not None and reused.documents == language_documents:
+                languages[lang] = reused
+            else:
+                languages[lang] = _LanguageRelatedPosts(language_documents)
+        return cls(languages)
+
+    def get(self, lang: str, slug: str, limit: int = 3) -> tuple[str, ...]:
+        """Returns slugs of at most `limit` posts most related to the given one, best first."""
+        language = self._languages.get(lang)
+        related = None if language is None else language.related()
+        if related is None:
+            return ()
+        return related.get(slug, ())[:limit]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until related posts in all languages are computed. Returns whether they are."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return all(
+            language.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+            for language in self._languages.values()
+        )
@@ -0,0 +1,155 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, NamedTuple, Optional
+
+# terms in titles and tags say more about a post than the same terms in its text
+TITLE_WEIGHT = 3
+TAGS_WEIGHT = 2
+# usual BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD.findall(text.casefold())
+
+
+class SearchDocument(NamedTuple):
+    slug: str
+    language: str
+    title: str
+    excerpt: str
+    tags: tuple[str, ...]
+    content: str
+
+
+class _LanguageIndex:
+    """Inverted index of documents in one language. Never modified once built."""
+
+    def __init__(
+        self,
+        postings: Dict[str, Dict[str, int]],
+        lengths: Dict[str, int],
+        terms: Dict[str, tuple[str, ...]],
+        total_length: int,
+    ):
+        self.postings = postings
+        self.lengths = lengths
+        self.terms = terms
+        self.total_length = total_length
+
+    @staticmethod
+    def _term_frequencies(document: SearchDocument) -> Counter[str]:
+        frequencies: Counter[str] = Counter()
+        for term in tokenize(document.title):
+            frequencies[term] += TITLE_WEIGHT
+        for term in tokenize(" ".join(document.tags)):
+            frequencies[term] += TAGS_WEIGHT
+        frequencies.update(tokenize(document.excerpt))
+        frequencies.update(tokenize(document.content))
+        return frequencies
+
+    def updated(self, removed: Iterable[str], added: Iterable[SearchDocument]) -> "_LanguageIndex":
+        """Returns index with given documents removed and added. Posting lists are copied
+        only for terms of those documents, the rest is shared with this index.
+        """
+        postings = dict(self.postings)
+        lengths = dict(self.lengths)
+        terms = dict(self.terms)
+        total_length = self.total_length
+        copied: set[str] = set()
+
+        def posting(term: str) -> Dict[str, int]:
+            if term not in copied:
+                copied.add(term)
+                postings[term] = dict(postings.get(term, {}))
+            return postings[term]
+
+        for slug in removed:
+            for term in terms.pop(slug, ()):
+                del posting(term)[slug]
+            total_length -= lengths.pop(slug, 0)
+        for document in added:
+            frequencies = self._term_frequencies(document)
+            for term, frequency in frequencies.items():
+                posting(term)[document.slug] = frequency
+            terms[document.slug] = tuple(frequencies)
+            lengths[document.slug] = sum(frequencies.values())
+            total_length += lengths[document.slug]
+
+        for term in copied:
+            if not postings[term]:
+                del postings[term]
+        return _LanguageIndex(postings, lengths, terms, total_length)
+
+    def search(self, query: str, limit: Optional[int]) -> list[tuple[str, float]]:
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count
+        scores: Dict[str, float] = {}
+        for term in dict.fromkeys(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for slug, frequency in posting.items():
+                norm = K1 * (1 - B + B * self.lengths[slug] / average_length)
+                score = idf * frequency * (K1 + 1) / (frequency + norm)
+                scores[slug] = scores.get(slug, 0.0) + score
+        if limit is None:
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+_EMPTY = _LanguageIndex({}, {}, {}, 0)
+
+
+class SearchIndex:
+    """Full-text index of posts per language, ranking matches with BM25.
+
+    Titles, excerpts, tags and texts of posts are indexed, with terms from titles and tags
+    weighing more. Like ContentIndex, it's never modified: `updated` returns a new index
+    which shares all unaffected posting lists with the old one.
+    """
+
+    def __init__(self, languages: Optional[Dict[str, _LanguageIndex]] = None):
+        self._languages = languages or {}
+
+    @classmethod
+    def build(cls, documents: Iterable[SearchDocument]) -> "SearchIndex":
+        return cls().updated(documents)
+
+    def updated(
+        self, added: Iterable[SearchDocument], removed: Iterable[tuple[str, str]] = ()
+    ) -> "SearchIndex":
+        """Returns index with documents given by (language, slug) removed and documents
+        from `added` indexed. A document with the same slug must be removed before
+        it's added again.
+        """
+        removed_by_lang: Dict[str, list[str]] = {}
+        for lang, slug in removed:
+            removed_by_lang.setdefault(lang, []).append(slug)
+        added_by_lang: Dict[str, list[SearchDocument]] = {}
+        for document in added:
+            added_by_lang.setdefault(document.language, []).append(document)
+
+        languages = dict(self._languages)
+        for lang in removed_by_lang.keys() | added_by_lang.keys():
+            languages[lang] = languages.get(lang, _EMPTY).updated(
+                removed_by_lang.get(lang, ()), added_by_lang.get(lang, ())
+            )
+        return SearchIndex(languages)
+
+    def search(self, lang: str, query: str, limit: Optional[int] = None) -> list[str]:
+        """Returns slugs of posts in given language matching any term of the query,
+        best matches first.
+        """
+        language = self._languages.get(lang)
+        if language is None:
+            return []
+        return [slug for slug, _ in language.search(query, limit)]
@@ -0,0 +1,410 @@
+import datetime
+import json
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+from pydantic import Field
+
+from platzky.models import MenuItem, Page, Post, PostSummary
+
+from .db import DB, DBConfig
+from .search_index import SearchDocument
+from .typeahead import TypeaheadIndex
+
+
+def db_config_type():
+    return SqliteDbConfig
+
+
+class SqliteDbConfig(DBConfig):
+    path: str = Field(alias="PATH")
+    timeout: float = Field(default=5.0, alias="TIMEOUT", ge=0)
+
+
+def get_db(config):
+    sqlite_db_config = SqliteDbConfig.model_validate(config)
+    return db_from_config(sqlite_db_config)
+
+
+def db_from_config(config: SqliteDbConfig):
+    return Sqlite(config.path, timeout=config.timeout)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plugins (
+    position INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS menu_items (
+    language TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (language, position)
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL UNIQUE,
+    language TEXT NOT NULL,
+    date TEXT NOT NULL,
+    title TEXT NOT NULL,
+    excerpt TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    cover_image TEXT NOT NULL,
+    author TEXT NOT NULL,
+    content_in_markdown TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_by_language_date ON posts (language, date DESC, id);
+CREATE TABLE IF NOT EXISTS post_tags (
+    tag TEXT NOT NULL,
+    post_id INTEGER NOT NULL REFERENCES posts (id),
+    PRIMARY KEY (tag, post_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES posts (id),
+    author TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_by_post ON comments (post_id, id);
+CREATE TABLE IF NOT EXISTS pages (
+    slug TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+TABLES = ("settings", "plugins", "menu_items", "post_tags", "comments", "posts", "pages")
+SUMMARY_COLUMNS = "id, slug, language, date, title, excerpt, tags, cover_image"
+POST_COLUMNS = f"{SUMMARY_COLUMNS}, author, content_in_markdown"
+# posts with the same date are listed in the order they were imported, like in Json
+NEWEST_FIRST = "ORDER BY date DESC, id"
+# setting changed by every import, telling readers that content has been replaced
+IMPORT_ID_KEY = "_import_id"
+
+
+def _connect(path: str, timeout: float) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=timeout)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def _create_schema(connection: sqlite3.Connection) -> None:
+    # write-ahead log lets readers in other processes work while a comment is written
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+
+
+def import_json_data(data: Dict[str, Any], path: str) -> None:
+    """Replaces content of the database at path with data in the json_file format.
+
+    Everything is imported in a single transaction, so readers see either the old
+    or the new content. When posts or pages share a slug, the first one is kept.
+    """
+    site_content = dict(data.get("site_content") or {})
+    posts = site_content.pop("posts", None) or []
+    pages = site_content.pop("pages", None) or []
+    menu_items = site_content.pop("menu_items", None) or {}
+
+    connection = _connect(path, timeout=5.0)
+    try:
+        _create_schema(connection)
+        with connection:
+            for table in TABLES:
+                connection.execute(f"DELETE FROM {table}")
+            connection.executemany(
+                "INSERT INTO settings (key, value) VALUES (?, ?)",
+                ((key, json.dumps(value)) for key, value in site_content.items()),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (IMPORT_ID_KEY, json.dumps(uuid.uuid4().hex)),
+            )
+            connection.executemany(
+                "INSERT INTO plugins (position, data) VALUES (?, ?)",
+                enumerate(json.dumps(plugin) for plugin in data.get("plugins", [])),
+            )
+            connection.executemany(
+                "INSERT INTO menu_items (language, position, name, url) VALUES (?, ?, ?, ?)",
+                (
+                    (lang, position, item.name, item.url)
+                    for lang, raw_items in menu_items.items()
+                    for position, item in enumerate(MenuItem.model_validate(x) for x in raw_items)
+                ),
+            )
+            for raw_post in posts:
+                _import_post(connection, Post.model_validate(raw_post))
+            connection.executemany(
+                "INSERT OR IGNORE INTO pages (slug, data) VALUES (?, ?)",
+                ((raw_page["slug"], json.dumps(raw_page)) for raw_page in pages),
+            )
+    finally:
+        connection.close()
+
+
+def import_json_file(json_path: str, path: str) -> None:
+    """Imports data file of the json_file backend into the database at path."""
+    with open(json_path) as json_file:
+        import_json_data(json.load(json_file), path)
+
+
+def _import_post(connection: sqlite3.Connection, post: Post) -> None:
+    cursor = connection.execute(
+        f"INSERT OR IGNORE INTO posts ({POST_COLUMNS}) VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            post.slug,
+            post.language,
+            post.date,
+            post.title,
+            post.excerpt,
+            json.dumps(post.tags),
+            post.coverImage.model_dump_json(),
+            post.author,
+            post.contentInMarkdown,
+        ),
+    )
+    if not cursor.rowcount:
+        return
+    post_id = cursor.lastrowid
+    connection.executemany(
+        "INSERT INTO post_tags (tag, post_id) VALUES (?, ?)",
+        ((tag, post_id) for tag in dict.fromkeys(post.tags)),
+    )
+    connection.executemany(
+        "INSERT INTO comments (post_id, author, comment, date) VALUES (?, ?, ?, ?)",
+        ((post_id, c.author, c.comment, c.date) for c in post.comments),
+    )
+
+
+class Sqlite(DB):
+    """Content stored in an SQLite database, queried through its indexes on every call.
+
+    Each thread uses its own connection. The database is in write-ahead log mode,
+    so any number of processes can read it while one of them adds a comment.
+    Use `import_json_file` to create the database from a json_file data file.
+
+    Search suggestions come from titles and tags read into memory on startup; when
+    the database is imported again, a background thread reads them again while
+    suggestions keep coming from the previous ones.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+        self.module_name = "sqlite_db"
+        self.db_name = "SqliteDb"
+        self._connections = threading.local()
+        _create_schema(self._connection())
+        self._typeahead = self._read_typeahead()
+        self._typeahead_rebuild: Optional[threading.Thread] = None
+        self._typeahead_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self._connections, "connection", None)
+        if connection is None:
+            connection = self._connections.connection = _connect(self.path, self.timeout)
+        return connection
+
+    def _read_typeahead(self) -> tuple[Any, TypeaheadIndex]:
+        """Returns id of the import along with titles and tags of posts imported by it."""
+        # read first, so that an import in the meantime only makes titles look outdated
+        import_id = self._setting(IMPORT_ID_KEY, None)
+        rows = self._connection().execute("SELECT slug, language, title, tags FROM posts")
+        documents = [
+            SearchDocument(
+                row["slug"], row["language"], row["title"], "", tuple(json.loads(row["tags"])), ""
+            )
+            for row in rows
+        ]
+        return import_id, TypeaheadIndex.build(documents)
+
+    def _rebuild_typeahead(self) -> None:
+        try:
+            self._typeahead = self._read_typeahead()
+        finally:
+            self._typeahead_lock.release()
+
+    def _setting(self, key: str, default: Any) -> Any:
+        row = self._connection().execute("SELECT value FROM settings WHERE key = ?", (key,))
+        found = row.fetchone()
+        return default if found is None else json.loads(found["value"])
+
+    @staticmethod
+    def _summary_fields(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "slug": row["slug"],
+            "title": row["title"],
+            "excerpt": row["excerpt"],
+            "tags": json.loads(row["tags"]),
+            "language": row["language"],
+            "coverImage": json.loads(row["cover_image"]),
+            "date": row["date"],
+        }
+
+    def _posts(self, rows: Iterable[sqlite3.Row]) -> list[Post]:
+        """Builds posts from rows of the posts table, fetching their comments in one query."""
+        rows = list(rows)
+        comments: Dict[int, list[Dict[str, str]]] = {row["id"]: [] for row in rows}
+        for start in range(0, len(rows), 500):
+            ids = [row["id"] for row in rows[start : start + 500]]
+            placeholders = ", ".join("?" * len(ids))
+            for comment in self._connection().execute(
+                "SELECT post_id, author, comment, date FROM comments "
+                f"WHERE post_id IN ({placeholders}) ORDER BY post_id, id",
+                ids,
+            ):
+                comments[comment["post_id"]].append(
+                    {
+                        "author": comment["author"],
+                        "comment": comment["comment"],
+                        "date": comment["date"],
+                    }
+                )
+        return [
+            Post.model_validate(
+                {
+                    **self._summary_fields(row),
+                    "author": row["author"],
+                    "contentInMarkdown": row["content_in_markdown"],
+                    "comments": comments[row["id"]],
+                }
+            )
+            for row in rows
+        ]
+
+    def get_app_description(self, lang):
+        return self._setting("app_description", {}).get(lang, None)
+
+    def get_all_posts(self, lang):
+        return self._posts(
+            self._connection().execute(
+                f"SELECT {POST_COLUMNS} FROM posts WHERE language = ? {NEWEST_FIRST}", (lang,)
+            )
+        )
+
+    def get_post_summaries(self, lang, offset=0, limit=None, tag=None):
+        query = f"SELECT {SUMMARY_COLUMNS} FROM posts WHERE language = ?"
+        parameters: list[Any] = [lang]
+        if tag is not None:
+            query += " AND id IN (SELECT post_id FROM post_tags WHERE tag = ?)"
+            parameters.append(tag)
+        query += f" {NEWEST_FIRST} LIMIT ? OFFSET ?"
+        parameters += [-1 if limit is None else limit, offset]
+        return [
+            PostSummary.model_validate(self._summary_fields(row))
+            for row in self._connection().execute(query, parameters)
+        ]
+
+    def get_post_summaries_between(self, lang, start, end, offset=0, limit=None):
+        # ISO dates compare as text, so the range is read from the (language, date) index
+        query = (
+            f"SELECT {SUMMARY_COLUMNS} FROM posts WHERE language = ? AND date >= ? AND date < ?"
+            f" {NEWEST_FIRST} LIMIT ? OFFSET ?"
+        )
+        parameters = (
+            lang,
+            start.isoformat(),
+            end.isoformat(),
+            -1 if limit is None else limit,
+            offset,
+        )
+        return [
+            PostSummary.model_validate(self._summary_fields(row))
+            for row in self._connection().execute(query, parameters)
+        ]
+
+    def get_search_suggestions(self, lang, prefix, limit=10):
+        import_id, typeahead = self._typeahead
+        if self._setting(IMPORT_ID_KEY, None) != import_id and self._typeahead_lock.acquire(
+            blocking=False
+        ):
+            self._typeahead_rebuild = threading.Thread(
+                target=self._rebuild_typeahead, name=f"suggestions {self.path}", daemon=True
+            )
+            self._typeahead_rebuild.start()
+        return typeahead.suggest(lang, prefix, limit)
+
+    def get_post(self, slug: str) -> Post:
+        """Returns a post matching the given slug."""
+        rows = self._connection().execute(
+            f"SELECT {POST_COLUMNS} FROM posts WHERE slug = ?", (slug,)
+        )
+        posts = self._posts(rows)
+        if not posts:
+            raise ValueError(f"Post with slug {slug} not found")
+        return posts[0]
+
+    def get_posts_by_slugs(self, slugs):
+        slugs = list(slugs)
+        rows: list[sqlite3.Row] = []
+        for start in range(0, len(slugs), 500):
+            chunk = slugs[start : start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows += self._connection().execute(
+                f"SELECT {POST_COLUMNS} FROM posts WHERE slug IN ({placeholders})", chunk
+            )
+        posts_by_slug = {post.slug: post for post in self._posts(rows)}
+        return [posts_by_slug[slug] for slug in slugs if slug in posts_by_slug]
+
+    def get_page(self, slug):
+        row = self._connection().execute("SELECT data FROM pages WHERE slug = ?", (slug,))
+        found = row.fetchone()
+        if found is None:
+            raise StopIteration(f"Page with slug {slug} not found")
+        return Page.model_validate(json.loads(found["data"]))
+
+    def get_menu_items_in_lang(self, lang) -> list[MenuItem]:
+        rows = self._connection().execute(
+            "SELECT name, url FROM menu_items WHERE language = ? ORDER BY position", (lang,)
+        )
+        return [MenuItem(name=row["name"], url=row["url"]) for row in rows]
+
+    def get_posts_by_tag(self, tag, lang):
+        rows = self._connection().execute(
+            f"SELECT {POST_COLUMNS} FROM posts WHERE language = ? "
+            f"AND id IN (SELECT post_id FROM post_tags WHERE tag = ?) {NEWEST_FIRST}",
+            (lang, tag),
+        )
+        return [post.model_dump() for post in self._posts(rows)]
+
+    def get_logo_url(self):
+        return self._setting("logo_url", "")
+
+    def get_favicon_url(self):
+        return self._setting("favicon_url", "")
+
+    def get_font(self) -> str:
+        return self._setting("font", "")
+
+    def get_primary_color(self):
+        return self._setting("primary_color", "white")
+
+    def get_secondary_color(self):
+        return self._setting("secondary_color", "navy")
+
+    def add_comment(self, author_name, comment, post_slug):
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO comments (post_id, author, comment, date) "
+                "SELECT id, ?, ?, ? FROM posts WHERE slug = ?",
+                (
+                    str(author_name),
+                    str(comment),
+                    datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+                    post_slug,
+                ),
+            )
+        if not cursor.rowcount:
+            raise StopIteration(f"Post with slug {post_slug} not found")
+
+    def get_plugins_data(self):
+        rows = self._connection().execute("SELECT data FROM plugins ORDER BY position")
+        return [json.loads(row["data"]) for row in rows]
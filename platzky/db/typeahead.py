@@ -0,0 +1,81 @@
+from bisect import bisect_left
+from typing import Dict, Iterable, NamedTuple
+
+from .search_index import SearchDocument, tokenize
+
+
+class Suggestion(NamedTuple):
+    kind: str  # "post" or "tag"
+    text: str
+    target: str  # slug of a post or name of a tag
+
+
+def _normalize(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def _keys(text: str) -> Iterable[str]:
+    """Yields normalized text starting from each of its words, so a prefix of any word
+    of a title matches it, not only a prefix of the first one.
+    """
+    normalized = _normalize(text)
+    start = 0
+    while normalized:
+        yield normalized[start:]
+        start = normalized.find(" ", start) + 1
+        if not start:
+            return
+
+
+class TypeaheadIndex:
+    """Titles and tags of posts per language, looked up by prefix.
+
+    Keys are kept in one sorted tuple per language, so a lookup is a binary search
+    followed by reading matching keys until `limit` suggestions are found, no matter
+    how many posts there are. Matches are listed in alphabetical order of their keys.
+    Never modified once built.
+    """
+
+    def __init__(
+        self,
+        keys_by_lang: Dict[str, tuple[str, ...]],
+        suggestions_by_lang: Dict[str, tuple[Suggestion, ...]],
+    ):
+        self._keys_by_lang = keys_by_lang
+        self._suggestions_by_lang = suggestions_by_lang
+
+    @classmethod
+    def build(cls, documents: Iterable[SearchDocument]) -> "TypeaheadIndex":
+        entries_by_lang: Dict[str, set[tuple[str, Suggestion]]] = {}
+        for document in documents:
+            entries = entries_by_lang.setdefault(document.language, set())
+            title = Suggestion("post", document.title, document.slug)
+            entries.update((key, title) for key in _keys(document.title))
+            for tag in document.tags:
+                entries.update((key, Suggestion("tag", tag, tag)) for key in _keys(tag))
+
+        keys_by_lang: Dict[str, tuple[str, ...]] = {}
+        suggestions_by_lang: Dict[str, tuple[Suggestion, ...]] = {}
+        for lang, entries in entries_by_lang.items():
+            ordered = sorted(entries)
+            keys_by_lang[lang] = tuple(key for key, _ in ordered)
+            suggestions_by_lang[lang] = tuple(suggestion for _, suggestion in ordered)
+        return cls(keys_by_lang, suggestions_by_lang)
+
+    def suggest(self, lang: str, prefix: str, limit: int = 10) -> list[Suggestion]:
+        """Returns at most `limit` distinct titles and tags in given language with a word
+        starting with `prefix`. Case and punctuation are ignored.
+        """
+        prefix = _normalize(prefix)
+        keys = self._keys_by_lang.get(lang, ())
+        if not prefix or limit <= 0:
+            return []
+        suggestions = self._suggestions_by_lang.get(lang, ())
+        found: Dict[Suggestion, None] = {}
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            found[suggestions[position]] = None
+            if len(found) == limit:
+                break
+        return list(found)
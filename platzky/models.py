@@ -1,4 +1,8 @@
 import datetime
+import functools
+import sys
+from dataclasses import dataclass
+from typing import Any, Optional
 
 import humanize
 from pydantic import BaseModel
@@ -22,16 +26,20 @@ class Comment(BaseModel):
     @property
     def time_delta(self) -> str:
         now = datetime.datetime.now()
-        date = datetime.datetime.strptime(self.date.split(".")[0], "%Y-%m-%dT%H:%M:%S")
-        return humanize.naturaltime(now - date)
+        return humanize.naturaltime(now - parse_comment_date(self.date))
 
 
-class Post(BaseModel):
-    author: str
+@functools.lru_cache(maxsize=4096)
+def parse_comment_date(date: str) -> datetime.datetime:
+    """Parses date of a comment. Cached, as the same comments are rendered over and over."""
+    return datetime.datetime.strptime(date.split(".")[0], "%Y-%m-%dT%H:%M:%S")
+
+
+class PostSummary(BaseModel):
+    """Fields of a post needed by list views, feeds and sitemaps."""
+
     slug: str
     title: str
-    contentInMarkdown: str
-    comments: list[Comment]
     excerpt: str
     tags: list[str]
     language: str
@@ -39,14 +47,108 @@ class Post(BaseModel):
     date: str
 
     def __lt__(self, other):
-        if isinstance(other, Post):
+        if isinstance(other, PostSummary):
             return self.date < other.date
         raise NotImplementedError("Posts can only be compared with other posts")
 
 
+class Post(PostSummary):
+    author: str
+    contentInMarkdown: str
+    comments: list[Comment]
+
+
 Page = Post
 
 
+def parse_post_date(date: str) -> Optional[datetime.datetime]:
+    """Parses date of a post, returns None if it's not an ISO date."""
+    try:
+        return datetime.datetime.fromisoformat(date.split(".")[0].removesuffix("Z"))
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class CompactComment:
+    """Read-side form of a comment, see CompactPost."""
+
+    author: str
+    comment: str
+    date: str
+
+    def to_comment(self) -> Comment:
+        return Comment.model_construct(author=self.author, comment=self.comment, date=self.date)
+
+
+@dataclass(frozen=True, slots=True)
+class CompactPost:
+    """Memory-lean, read-only form of an already validated post, for DBs keeping all posts
+    in memory.
+
+    It has no per-instance dict, strings repeated across posts (language, tags, authors)
+    are interned so that all posts share a single copy, and the date is parsed once
+    into `published` (None if it's not an ISO date). Models are built from it on demand,
+    without validating the content again.
+    """
+
+    slug: str
+    title: str
+    excerpt: str
+    tags: tuple[str, ...]
+    language: str
+    cover_url: str
+    cover_alternate_text: str
+    date: str
+    published: Optional[datetime.datetime]
+    author: str
+    content_in_markdown: str
+    comments: tuple[CompactComment, ...]
+
+    @classmethod
+    def from_post(cls, post: Post) -> "CompactPost":
+        return cls(
+            slug=post.slug,
+            title=post.title,
+            excerpt=post.excerpt,
+            tags=tuple(sys.intern(tag) for tag in post.tags),
+            language=sys.intern(post.language),
+            cover_url=post.coverImage.url,
+            cover_alternate_text=post.coverImage.alternateText,
+            date=post.date,
+            published=parse_post_date(post.date),
+            author=sys.intern(post.author),
+            content_in_markdown=post.contentInMarkdown,
+            comments=tuple(
+                CompactComment(sys.intern(c.author), c.comment, c.date) for c in post.comments
+            ),
+        )
+
+    def _summary_fields(self) -> dict[str, Any]:
+        return {
+            "slug": self.slug,
+            "title": self.title,
+            "excerpt": self.excerpt,
+            "tags": list(self.tags),
+            "language": self.language,
+            "coverImage": Image.model_construct(
+                url=self.cover_url, alternateText=self.cover_alternate_text
+            ),
+            "date": self.date,
+        }
+
+    def to_summary(self) -> PostSummary:
+        return PostSummary.model_construct(**self._summary_fields())
+
+    def to_post(self) -> Post:
+        return Post.model_construct(
+            **self._summary_fields(),
+            author=self.author,
+            contentInMarkdown=self.content_in_markdown,
+            comments=[comment.to_comment() for comment in self.comments],
+        )
+
+
 class Color(BaseModel):
     def __init__(self, r: int = 0, g: int = 0, b: int = 0, a: int = 255):
         if not (0 <= r <= 255):
@@ -0,0 +1,90 @@
+"""Compares memory taken by a ContentIndex with memory of the raw data it's built from.
+
+Run with `python tests/benchmarks/content_memory.py [number of posts ...]`.
+The baseline is the raw data alone, parsed from JSON. ContentIndex keeps that data,
+referenced from `data` and `raw_posts_by_slug`, and adds a CompactPost per post
+together with lookup tables, search, typeahead and related posts indexes, which are
+measured once related posts are computed.
+
+Measured with Python 3.11, in bytes per post:
+
+   posts    raw B  compact B  indexes B    index B  index/raw
+   10000     2905        359       2017       5281       1.82
+  100000     2910        358       2336       5604       1.93
+
+So a ContentIndex takes about twice the memory of the raw data alone: CompactPosts add
+about an eighth of it and the lookup, search, typeahead and related posts indexes
+another 70-80%.
+"""
+
+import gc
+import json
+import sys
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from platzky.db.json_db import ContentIndex
+from platzky.models import CompactPost, Post
+
+
+def raw_post(number: int) -> Dict[str, Any]:
+    return {
+        "title": f"Post number {number}",
+        "slug": f"post-{number}",
+        "author": f"Author {number % 10}",
+        "contentInMarkdown": f"# Post {number}\n\n" + "Lorem ipsum dolor sit amet. " * 40,
+        "excerpt": f"Excerpt of post {number}",
+        "comments": [
+            {"author": f"Reader {i}", "comment": f"Comment {i}", "date": "2024-01-01T10:00:00"}
+            for i in range(number % 4)
+        ],
+        "tags": ["news", f"tag-{number % 50}"],
+        "language": ("en", "pl")[number % 2],
+        "coverImage": {"url": f"/images/{number}.jpg", "alternateText": ""},
+        "date": f"2024-{number % 12 + 1:02d}-{number % 28 + 1:02d}T12:00:00",
+    }
+
+
+def measure(build: Callable[[], Any]) -> int:
+    """Returns bytes allocated by objects built and kept alive."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size
+
+
+def build_index(text: str) -> ContentIndex:
+    index = ContentIndex(json.loads(text))
+    index.related.wait()
+    return index
+
+
+def build_compact_posts(count: int) -> int:
+    raw_posts = [raw_post(number) for number in range(count)]
+    return measure(lambda: [CompactPost.from_post(Post.model_validate(r)) for r in raw_posts])
+
+
+def main(counts: list[int]) -> None:
+    print(
+        f"{'posts':>8} {'raw B':>8} {'compact B':>10} {'indexes B':>10}"
+        f" {'index B':>10} {'index/raw':>10}"
+    )
+    for count in counts:
+        text = json.dumps({"site_content": {"posts": [raw_post(n) for n in range(count)]}})
+        raw = measure(lambda: json.loads(text))
+        compact = build_compact_posts(count)
+        index = measure(lambda: build_index(text))
+        print(
+            f"{count:>8} {raw / count:>8.0f} {compact / count:>10.0f}"
+            f" {(index - raw - compact) / count:>10.0f} {index / count:>10.0f}"
+            f" {index / raw:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000])
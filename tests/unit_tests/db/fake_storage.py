@@ -0,0 +1,79 @@
+"""In-memory stand-in for google.cloud.storage, keeping every generation of each blob."""
+
+import io
+import itertools
+
+from google.api_core.exceptions import PreconditionFailed
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, generation=None):
+        self.bucket = bucket
+        self.name = name
+        self.generation = generation
+
+    @property
+    def etag(self):
+        return None if self.generation is None else f"etag-{self.generation}"
+
+    def _content(self):
+        """Returns content of the generation this blob is bound to, or of the latest one."""
+        generations = self.bucket.generations[self.name]
+        if self.generation is None:
+            self.generation = max(generations)
+        return generations[self.generation]
+
+    def download_as_text(self, client=None):
+        self.bucket.client.downloads += 1
+        return self._content()
+
+    def open(self, mode="rt", encoding="utf-8"):
+        self.bucket.client.downloads += 1
+        return io.StringIO(self._content())
+
+    def upload_from_string(self, data, content_type="text/plain", if_generation_match=None):
+        client = self.bucket.client
+        client.uploads += 1
+        if client.before_upload:
+            client.before_upload.pop(0)()
+        generations = self.bucket.generations.get(self.name)
+        latest = max(generations) if generations else 0
+        if if_generation_match is not None and if_generation_match != latest:
+            raise PreconditionFailed("generation does not match")
+        self.generation = self.bucket.put(self.name, data)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.generations = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        self.client.metadata_requests += 1
+        if not self.generations.get(name):
+            return None
+        return FakeBlob(self, name, max(self.generations[name]))
+
+    def put(self, name, text):
+        """Uploads a new generation of a blob, returns its number."""
+        generation = next(self.client.generation_numbers)
+        self.generations.setdefault(name, {})[generation] = text
+        return generation
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.buckets = {}
+        self.generation_numbers = itertools.count(1)
+        self.downloads = 0
+        self.metadata_requests = 0
+        self.uploads = 0
+        # each is called before one of the next uploads, e.g. to simulate concurrent changes
+        self.before_upload = []
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket(self, name))
@@ -1,9 +1,13 @@
+import datetime
+import threading
 from typing import Any, Callable, cast
+from unittest.mock import Mock
 
 import pytest
 
 from platzky.db.db import DB
 from platzky.db.json_db import Json
+from platzky.models import PostSummary
 
 
 def dummy_function_taking_one_argument(_: Any):
@@ -107,3 +111,110 @@ def test_db_extend_with_existing_name():
     finally:
         # Restore original setattr
         builtins.setattr = original
+
+
+@pytest.fixture
+def post():
+    return {
+        "title": "Mirrored post",
+        "slug": "post",
+        "author": "Author",
+        "contentInMarkdown": "Some content",
+        "excerpt": "Excerpt",
+        "comments": [],
+        "tags": ["mirror"],
+        "language": "en",
+        "coverImage": {"url": "/cover.jpg"},
+        "date": "2023-01-01T00:00:00",
+    }
+
+
+def test_default_search_mirrors_posts_into_search_index(post):
+    db = Json({"site_content": {"posts": [post]}})
+    get_all_posts = Mock(wraps=db.get_all_posts)
+    db.get_all_posts = get_all_posts
+
+    results = DB.search_posts(db, "en", "content")
+    assert [p.slug for p in results] == ["post"]
+    assert type(results[0]) is PostSummary
+    assert DB.search_posts(db, "en", "missing") == []
+    assert DB.search_posts(db, "pl", "content") == []
+    assert get_all_posts.call_count == 2
+
+    db.search_mirror_max_age = 0
+    DB.search_posts(db, "en", "content")
+    assert get_all_posts.call_count == 3
+
+
+def test_stale_search_mirror_is_used_while_another_thread_rebuilds_it(post):
+    db = Json({"site_content": {"posts": [post]}})
+    all_posts = db.get_all_posts("en")
+    rebuilding = threading.Event()
+    rebuilt = threading.Event()
+
+    def slow_get_all_posts(lang):
+        if get_all_posts.call_count > 1:
+            rebuilding.set()
+            rebuilt.wait(5)
+        return all_posts
+
+    get_all_posts = Mock(side_effect=slow_get_all_posts)
+    db.get_all_posts = get_all_posts
+    DB.search_posts(db, "en", "content")
+    db.search_mirror_max_age = 0
+
+    rebuild = threading.Thread(target=DB.search_posts, args=(db, "en", "content"))
+    rebuild.start()
+    assert rebuilding.wait(5)
+    assert [p.slug for p in DB.search_posts(db, "en", "content")] == ["post"]
+    rebuilt.set()
+    rebuild.join()
+
+    assert get_all_posts.call_count == 2
+
+
+def test_default_search_suggestions_come_from_search_mirror(post):
+    db = Json({"site_content": {"posts": [post]}})
+    get_all_posts = Mock(wraps=db.get_all_posts)
+    db.get_all_posts = get_all_posts
+
+    suggestions = DB.get_search_suggestions(db, "en", "mirror")
+    assert [(s.kind, s.text) for s in suggestions] == [("tag", "mirror"), ("post", "Mirrored post")]
+    DB.search_posts(db, "en", "content")
+    assert get_all_posts.call_count == 1
+
+
+def test_there_are_no_related_posts_by_default(post):
+    other_post = {**post, "slug": "other", "contentInMarkdown": "Other text"}
+    db = Json({"site_content": {"posts": [post, other_post]}})
+    get_all_posts = Mock(wraps=db.get_all_posts)
+    db.get_all_posts = get_all_posts
+
+    assert DB.get_related_posts(db, "en", "post") == []
+    get_all_posts.assert_not_called()
+
+
+def test_default_post_summaries_between_filters_all_summaries(post):
+    posts = [
+        {**post, "slug": "may", "date": "2023-05-31T23:00:00"},
+        {**post, "slug": "no-date", "date": "someday"},
+        {**post, "slug": "april", "date": "2023-04-30"},
+    ]
+    db = Json({"site_content": {"posts": posts}})
+    april = (datetime.date(2023, 4, 1), datetime.date(2023, 5, 1))
+    spring = (datetime.date(2023, 3, 1), datetime.date(2023, 6, 1))
+
+    assert [p.slug for p in DB.get_post_summaries_between(db, "en", *april)] == ["april"]
+    assert [p.slug for p in DB.get_post_summaries_between(db, "en", *spring, 1)] == ["april"]
+    assert [p.slug for p in DB.get_post_summaries_between(db, "en", *spring, 0, 1)] == ["may"]
+
+
+def test_default_get_posts_by_slugs_fetches_posts_one_by_one(post):
+    db = Json({"site_content": {"posts": [post, {**post, "slug": "other"}]}})
+    get_post = Mock(wraps=db.get_post)
+    db.get_post = get_post
+
+    posts = DB.get_posts_by_slugs(db, ["other", "missing", "post"])
+
+    assert [p.slug for p in posts] == ["other", "post"]
+    assert get_post.call_count == 3
@@ -0,0 +1,66 @@
+import os
+import stat
+
+import pytest
+
+from platzky.db.files import atomic_write
+from platzky.db.json_file_db import JsonFile
+
+
+def mode_of(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_atomic_write_keeps_mode_of_replaced_file(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("old")
+    os.chmod(path, 0o640)
+
+    atomic_write(str(path), "new")
+
+    assert path.read_text() == "new"
+    assert mode_of(path) == 0o640
+
+
+def test_atomic_write_creates_file_with_default_mode(tmp_path):
+    path = tmp_path / "data.json"
+    reference = tmp_path / "reference"
+    reference.write_text("")
+
+    atomic_write(str(path), "new")
+
+    assert mode_of(path) == mode_of(reference)
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_atomic_write_writes_to_target_of_symlink(tmp_path):
+    target = tmp_path / "real.json"
+    target.write_text("old")
+    link = tmp_path / "data.json"
+    link.symlink_to(target)
+
+    atomic_write(str(link), "new")
+
+    assert link.is_symlink()
+    assert target.read_text() == "new"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["data.json", "real.json"]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_comment_keeps_mode_and_symlink_of_data_file(tmp_path):
+    target = tmp_path / "real.json"
+    target.write_text(
+        '{"site_content": {"posts": [{"title": "Post", "slug": "post", "author": "Author",'
+        ' "contentInMarkdown": "Content", "excerpt": "Excerpt", "comments": [], "tags": [],'
+        ' "language": "en", "coverImage": {"url": "/cover.jpg"},'
+        ' "date": "2023-01-01T00:00:00"}]}}'
+    )
+    os.chmod(target, 0o644)
+    link = tmp_path / "data.json"
+    link.symlink_to(target)
+
+    JsonFile(str(link)).add_comment("Reader", "Comment", "post")
+
+    assert link.is_symlink()
+    assert mode_of(target) == 0o644
+    assert "Comment" in target.read_text()
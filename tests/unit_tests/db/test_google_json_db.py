@@ -0,0 +1,327 @@
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+
+from platzky.db import google_json_db
+from platzky.db.google_json_db import (
+    FLUSH_ATTEMPTS,
+    GoogleJsonDb,
+    GoogleJsonDbConfig,
+    db_from_config,
+)
+from tests.unit_tests.db.fake_storage import FakeStorageClient
+
+
+def make_data(title, comments=()):
+    return {
+        "site_content": {
+            "posts": [
+                {
+                    "title": title,
+                    "slug": "post",
+                    "author": "Author",
+                    "contentInMarkdown": "Content",
+                    "excerpt": "Excerpt",
+                    "comments": list(comments),
+                    "tags": ["tag"],
+                    "language": "en",
+                    "coverImage": {"url": "/cover.jpg"},
+                    "date": "2023-01-01T00:00:00",
+                }
+            ]
+        }
+    }
+
+
+@pytest.fixture
+def storage():
+    client = FakeStorageClient()
+    client.bucket("bucket").put("data.json", json.dumps(make_data("Original")))
+    with patch("platzky.db.google_json_db.Client", return_value=client):
+        yield client
+
+
+def upload(storage, data):
+    storage.bucket("bucket").put("data.json", json.dumps(data))
+
+
+def refresh_if_changed(db):
+    return db._refresh_if_changed()
+
+
+def stop_refreshing(db):
+    db._stop_refreshing.set()
+
+
+@pytest.mark.parametrize("streaming_load", [False, True])
+def test_refresh_downloads_only_changed_blob(storage, streaming_load):
+    db = GoogleJsonDb("bucket", "data.json", streaming_load=streaming_load)
+    assert storage.downloads == 1
+
+    assert refresh_if_changed(db) is False
+    assert storage.downloads == 1
+    assert storage.metadata_requests == 1
+
+    upload(storage, make_data("Changed"))
+
+    assert refresh_if_changed(db) is True
+    assert db.get_post("post").title == "Changed"
+    assert [post.slug for post in db.search_posts("en", "changed")] == ["post"]
+    assert storage.downloads == 2
+    assert refresh_if_changed(db) is False
+    assert storage.downloads == 2
+
+
+def test_refresh_downloads_checked_generation(storage):
+    db = GoogleJsonDb("bucket", "data.json")
+    upload(storage, make_data("Checked"))
+    blob = storage.bucket("bucket").get_blob("data.json")
+    upload(storage, make_data("Newer"))
+
+    with patch.object(storage.bucket("bucket"), "get_blob", return_value=blob):
+        refresh_if_changed(db)
+
+    assert db.get_post("post").title == "Checked"
+    refresh_if_changed(db)
+    assert db.get_post("post").title == "Newer"
+
+
+def test_failed_refresh_keeps_content(storage):
+    db = GoogleJsonDb("bucket", "data.json")
+    storage.bucket("bucket").put("data.json", "not json")
+
+    with pytest.raises(json.JSONDecodeError):
+        refresh_if_changed(db)
+
+    assert db.get_post("post").title == "Original"
+
+
+def test_missing_blob_keeps_content(storage):
+    db = GoogleJsonDb("bucket", "data.json")
+    storage.bucket("bucket").generations.clear()
+
+    with pytest.raises(FileNotFoundError):
+        refresh_if_changed(db)
+
+    assert db.get_post("post").title == "Original"
+
+
+def test_refreshes_in_background(storage):
+    config = GoogleJsonDbConfig.model_validate(
+        {
+            "TYPE": "google_json",
+            "BUCKET_NAME": "bucket",
+            "SOURCE_BLOB_NAME": "data.json",
+            "REFRESH_INTERVAL": 0.01,
+        }
+    )
+    db = db_from_config(config)
+    upload(storage, make_data("Changed"))
+
+    deadline = time.monotonic() + 5
+    while db.get_post("post").title != "Changed" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stop_refreshing(db)
+    assert db.get_post("post").title == "Changed"
+
+
+class TestCache:
+    def wait_for_title(self, db, title):
+        deadline = time.monotonic() + 5
+        while db.get_post("post").title != title and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return db.get_post("post").title
+
+    @pytest.mark.parametrize("streaming_load", [False, True])
+    def test_download_is_saved_to_cache(self, storage, tmp_path, streaming_load):
+        cache_path = str(tmp_path / "cache.json")
+        GoogleJsonDb("bucket", "data.json", streaming_load=streaming_load, cache_path=cache_path)
+        storage.bucket("bucket").generations.clear()
+
+        db = GoogleJsonDb(
+            "bucket", "data.json", streaming_load=streaming_load, cache_path=cache_path
+        )
+
+        assert db.get_post("post").title == "Original"
+        assert storage.downloads == 1
+
+    def test_startup_serves_stale_copy_and_revalidates(self, storage, tmp_path):
+        cache_path = str(tmp_path / "cache.json")
+        GoogleJsonDb("bucket", "data.json", cache_path=cache_path)
+        upload(storage, make_data("Changed"))
+
+        db = GoogleJsonDb("bucket", "data.json", cache_path=cache_path)
+
+        assert self.wait_for_title(db, "Changed") == "Changed"
+        assert storage.downloads == 2
+        assert GoogleJsonDb("bucket", "data.json", cache_path=cache_path).data == db.data
+
+    def test_require_fresh_checks_generation_before_startup(self, storage, tmp_path):
+        cache_path = str(tmp_path / "cache.json")
+        GoogleJsonDb("bucket", "data.json", cache_path=cache_path, require_fresh=True)
+
+        db = GoogleJsonDb("bucket", "data.json", cache_path=cache_path, require_fresh=True)
+        assert storage.downloads == 1
+        assert storage.metadata_requests == 2
+
+        upload(storage, make_data("Changed"))
+        db = GoogleJsonDb("bucket", "data.json", cache_path=cache_path, require_fresh=True)
+        assert db.get_post("post").title == "Changed"
+        assert storage.downloads == 2
+
+    def test_cache_of_other_blob_is_not_used(self, storage, tmp_path):
+        cache_path = str(tmp_path / "cache.json")
+        storage.bucket("bucket").put("other.json", json.dumps(make_data("Other")))
+        GoogleJsonDb("bucket", "other.json", cache_path=cache_path)
+
+        db = GoogleJsonDb("bucket", "data.json", cache_path=cache_path)
+
+        assert db.get_post("post").title == "Original"
+        assert storage.downloads == 2
+
+    def test_corrupted_cache_is_downloaded_again(self, storage, tmp_path):
+        cache_path = tmp_path / "cache.json"
+        cache_path.write_text("not json")
+
+        db = GoogleJsonDb("bucket", "data.json", cache_path=str(cache_path))
+
+        assert db.get_post("post").title == "Original"
+        assert GoogleJsonDb("bucket", "data.json", cache_path=str(cache_path)).data == db.data
+
+    @pytest.mark.parametrize("streaming_load", [False, True])
+    def test_invalid_blob_does_not_replace_cache(self, storage, tmp_path, streaming_load):
+        cache_path = tmp_path / "cache.json"
+        db = GoogleJsonDb(
+            "bucket", "data.json", streaming_load=streaming_load, cache_path=str(cache_path)
+        )
+        cached = cache_path.read_text()
+        storage.bucket("bucket").put("data.json", '{"site_content": {"posts": [')
+
+        with pytest.raises(json.JSONDecodeError):
+            refresh_if_changed(db)
+
+        assert cache_path.read_text() == cached
+        assert list(tmp_path.iterdir()) == [cache_path]
+
+
+def flush_comments(db):
+    db._flush_comments()
+
+
+def comments_in_blob(storage):
+    bucket = storage.bucket("bucket")
+    data = json.loads(bucket.generations["data.json"][max(bucket.generations["data.json"])])
+    return [c["comment"] for c in data["site_content"]["posts"][0]["comments"]]
+
+
+class TestCommentsWriteBehind:
+    @pytest.fixture
+    def db(self, storage):
+        return GoogleJsonDb("bucket", "data.json", comments_flush_interval=60)
+
+    def test_comment_is_kept_in_memory_until_flushed(self, storage, db):
+        requests = storage.downloads + storage.metadata_requests
+
+        db.add_comment("Reader", "First", "post")
+
+        assert [c.comment for c in db.get_post("post").comments] == ["First"]
+        assert storage.downloads + storage.metadata_requests == requests
+        assert comments_in_blob(storage) == []
+
+    def test_comments_are_saved_in_one_upload(self, storage, db):
+        db.add_comment("Reader", "First", "post")
+        db.add_comment("Reader", "Second", "post")
+
+        flush_comments(db)
+
+        assert comments_in_blob(storage) == ["First", "Second"]
+        assert storage.uploads == 1
+        assert refresh_if_changed(db) is False
+        flush_comments(db)
+        assert storage.uploads == 1
+
+    def test_comments_are_merged_into_changes_made_meanwhile(self, storage, db):
+        db.add_comment("Reader", "First", "post")
+        other_comment = {"author": "Other", "comment": "Other", "date": "2023-01-02T00:00:00"}
+        changed = make_data("Changed", comments=[other_comment])
+        storage.before_upload.append(lambda: upload(storage, changed))
+
+        flush_comments(db)
+
+        assert comments_in_blob(storage) == ["Other", "First"]
+        assert storage.uploads == 2
+        assert db.get_post("post").title == "Changed"
+        assert [c.comment for c in db.get_post("post").comments] == ["Other", "First"]
+
+    def test_comments_to_deleted_posts_are_dropped(self, storage, db):
+        db.add_comment("Reader", "First", "post")
+        upload(storage, {"site_content": {"posts": []}})
+
+        flush_comments(db)
+
+        assert storage.uploads == 1
+        assert db.get_all_posts("en") == []
+
+    def test_blob_changing_all_the_time_fails_flush(self, storage, db):
+        db.add_comment("Reader", "First", "post")
+        storage.before_upload.extend(
+            [lambda: upload(storage, make_data("Changed"))] * FLUSH_ATTEMPTS
+        )
+
+        with pytest.raises(RuntimeError):
+            flush_comments(db)
+
+        storage.before_upload.clear()
+        flush_comments(db)
+        assert comments_in_blob(storage) == ["First"]
+
+    def test_refresh_keeps_comments_not_saved_yet(self, storage, db):
+        db.add_comment("Reader", "First", "post")
+        upload(storage, make_data("Changed"))
+
+        refresh_if_changed(db)
+
+        assert db.get_post("post").title == "Changed"
+        assert [c.comment for c in db.get_post("post").comments] == ["First"]
+
+    def test_saved_comments_are_cached(self, storage, tmp_path):
+        cache_path = str(tmp_path / "cache.json")
+        db = GoogleJsonDb("bucket", "data.json", cache_path=cache_path, comments_flush_interval=60)
+        db.add_comment("Reader", "First", "post")
+        flush_comments(db)
+        storage.bucket("bucket").generations.clear()
+
+        cached = GoogleJsonDb("bucket", "data.json", cache_path=cache_path)
+
+        assert [c.comment for c in cached.get_post("post").comments] == ["First"]
+
+    def test_comments_are_flushed_in_background(self, storage):
+        db = GoogleJsonDb("bucket", "data.json", comments_flush_interval=0)
+
+        db.add_comment("Reader", "First", "post")
+
+        deadline = time.monotonic() + 5
+        while comments_in_blob(storage) != ["First"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert comments_in_blob(storage) == ["First"]
+        assert GoogleJsonDb("bucket", "data.json").data == db.data
+
+    def test_failed_flush_is_retried_in_background(self, storage, monkeypatch):
+        monkeypatch.setattr(google_json_db, "FLUSH_RETRY_DELAY", 0.01)
+        db = GoogleJsonDb("bucket", "data.json", comments_flush_interval=0)
+
+        def fail_upload():
+            raise ServiceUnavailable("try again later")
+
+        storage.before_upload.extend([fail_upload, fail_upload])
+        db.add_comment("Reader", "First", "post")
+
+        deadline = time.monotonic() + 5
+        while comments_in_blob(storage) != ["First"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert comments_in_blob(storage) == ["First"]
+        assert storage.uploads == 3
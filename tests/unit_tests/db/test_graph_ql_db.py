@@ -1,16 +1,28 @@
-from unittest.mock import Mock, patch
+import asyncio
+import copy
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import ANY, AsyncMock, Mock, patch
 
 import pytest
+from gql import Client, gql
+from gql.transport.async_transport import AsyncTransport
 from gql.transport.exceptions import TransportQueryError
+from graphql import ExecutionResult, print_ast
 
 from platzky.db.graph_ql_db import (
+    ALL_POSTS,
     GraphQL,
     GraphQlDbConfig,
+    PersistedQueryTransport,
+    PooledClient,
     db_config_type,
     db_from_config,
     get_db,
 )
-from platzky.models import Color, Post
+from platzky.models import Color, Post, PostSummary
 
 
 @pytest.fixture
@@ -21,7 +33,7 @@ def mock_client():
 
 @pytest.fixture
 def graph_ql_db(mock_client):
-    with patch("platzky.db.graph_ql_db.Client", return_value=mock_client):
+    with patch("platzky.db.graph_ql_db.PooledClient", return_value=mock_client):
         db = GraphQL("http://test.endpoint", "test_token")
         return db
 
@@ -44,7 +56,13 @@ def test_get_db():
     )
     with patch("platzky.db.graph_ql_db.GraphQL") as mock_graph_ql:
         get_db(config)
-        mock_graph_ql.assert_called_once_with("http://test.endpoint", "test_token")
+        mock_graph_ql.assert_called_once_with(
+            "http://test.endpoint",
+            "test_token",
+            persisted_queries=False,
+            max_concurrency=10,
+            timeout=10.0,
+        )
 
 
 def test_db_from_config():
@@ -53,20 +71,33 @@ def test_db_from_config():
     )
     with patch("platzky.db.graph_ql_db.GraphQL") as mock_graph_ql:
         db_from_config(config)
-        mock_graph_ql.assert_called_once_with("http://test.endpoint", "test_token")
+        mock_graph_ql.assert_called_once_with(
+            "http://test.endpoint",
+            "test_token",
+            persisted_queries=False,
+            max_concurrency=10,
+            timeout=10.0,
+        )
 
 
 def test_graph_ql_init(mock_client):
     with (
         patch("platzky.db.graph_ql_db.AIOHTTPTransport") as mock_transport,
-        patch("platzky.db.graph_ql_db.Client", return_value=mock_client) as mock_client_class,
+        patch("platzky.db.graph_ql_db.Client") as mock_client_class,
+        patch("platzky.db.graph_ql_db.PooledClient", return_value=mock_client) as mock_pooled,
     ):
-        db = GraphQL("http://test.endpoint", "test_token")
+        db = GraphQL("http://test.endpoint", "test_token", max_concurrency=3, timeout=5.0)
 
+        mock_pooled.assert_called_once_with(ANY, max_concurrency=3, timeout=5.0)
+        mock_transport.assert_not_called()
+        make_client = mock_pooled.call_args.args[0]
+        assert make_client() is mock_client_class.return_value
         mock_transport.assert_called_once_with(
             url="http://test.endpoint", headers={"Authorization": "bearer test_token"}
         )
-        mock_client_class.assert_called_once()
+        mock_client_class.assert_called_once_with(
+            transport=mock_transport.return_value, execute_timeout=None
+        )
         assert db.client == mock_client
         assert db.module_name == "graph_ql_db"
         assert db.db_name == "GraphQLDb"
@@ -106,6 +137,49 @@ def test_get_all_posts(graph_ql_db, mock_client):
     mock_client.execute.assert_called_once()
 
 
+def test_get_post_summaries(graph_ql_db, mock_client):
+    mock_client.execute.return_value = {
+        "posts": [
+            {
+                "date": "2023-01-01",
+                "title": "Test Post",
+                "excerpt": "Test excerpt",
+                "slug": "test-post",
+                "tags": ["test", "example"],
+                "language": "en",
+                "coverImage": {
+                    "alternateText": "Alt text",
+                    "image": {"url": "https://example.com/image.jpg"},
+                },
+            }
+        ]
+    }
+
+    summaries = graph_ql_db.get_post_summaries("en")
+
+    assert len(summaries) == 1
+    assert isinstance(summaries[0], PostSummary)
+    assert summaries[0].slug == "test-post"
+    assert summaries[0].coverImage.url == "https://example.com/image.jpg"
+    assert mock_client.execute.call_args[1]["variable_values"] == {
+        "where": {"language": "en"},
+        "first": None,
+        "skip": 0,
+    }
+
+
+def test_get_post_summaries_paginated_by_tag(graph_ql_db, mock_client):
+    mock_client.execute.return_value = {"posts": []}
+
+    assert graph_ql_db.get_post_summaries("en", 20, 10, tag="test") == []
+
+    assert mock_client.execute.call_args[1]["variable_values"] == {
+        "where": {"language": "en", "tags_contains_some": ["test"]},
+        "first": 10,
+        "skip": 20,
+    }
+
+
 def test_get_menu_items_in_lang_with_lang(graph_ql_db, mock_client):
     mock_response = {
         "menuItems": [{"name": "Home", "url": "/"}, {"name": "About", "url": "/about"}]
@@ -164,6 +238,39 @@ def test_get_post(graph_ql_db, mock_client):
     mock_client.execute.assert_called_once()
 
 
+def test_get_posts_by_slugs(graph_ql_db, mock_client):
+    def raw_post(slug):
+        return {
+            "author": {"name": "John Doe"},
+            "contentInRichText": {"html": "<p>Test content</p>"},
+            "comments": [],
+            "date": "2023-01-01",
+            "title": "Test Post",
+            "excerpt": "Test excerpt",
+            "slug": slug,
+            "tags": ["test"],
+            "language": "en",
+            "coverImage": {"alternateText": "Alt text", "image": {"url": "/image.jpg"}},
+        }
+
+    mock_client.execute.return_value = {"posts": [raw_post("first"), raw_post("second")]}
+
+    posts = graph_ql_db.get_posts_by_slugs(["second", "missing", "first"])
+
+    assert [post.slug for post in posts] == ["second", "first"]
+    assert all(isinstance(post, Post) for post in posts)
+    mock_client.execute.assert_called_once()
+    assert mock_client.execute.call_args[1]["variable_values"] == {
+        "slugs": ["second", "missing", "first"],
+        "first": 3,
+    }
+
+
+def test_get_posts_by_no_slugs(graph_ql_db, mock_client):
+    assert graph_ql_db.get_posts_by_slugs([]) == []
+    mock_client.execute.assert_not_called()
+
+
 def test_get_page(graph_ql_db, mock_client):
     mock_response = {
         "page": {
@@ -303,3 +410,229 @@ def test_get_plugins_data(graph_ql_db, mock_client):
     assert plugins_data[0]["name"] == "plugin1"
     assert plugins_data[0]["config"] == {"key": "value"}
     mock_client.execute.assert_called_once()
+
+
+def test_queries_are_not_parsed_again(graph_ql_db, mock_client):
+    mock_client.execute.return_value = {"posts": []}
+    with patch("platzky.db.graph_ql_db.gql") as gql:
+        graph_ql_db.get_all_posts("en")
+        graph_ql_db.get_post_summaries("en")
+    gql.assert_not_called()
+
+
+def test_persisted_queries_transport_is_used_when_enabled(mock_client):
+    config = GraphQlDbConfig.model_validate(
+        {
+            "TYPE": "graph_ql",
+            "CMS_ENDPOINT": "http://test.endpoint",
+            "CMS_TOKEN": "test_token",
+            "PERSISTED_QUERIES": True,
+        }
+    )
+    with (
+        patch("platzky.db.graph_ql_db.Client") as client_class,
+        patch("platzky.db.graph_ql_db.PooledClient", return_value=mock_client) as pooled_class,
+    ):
+        db_from_config(config)
+        make_client = pooled_class.call_args.args[0]
+        make_client()
+    assert isinstance(client_class.call_args[1]["transport"], PersistedQueryTransport)
+
+
+def result_with_errors(errors):
+    # gql returns errors the way they came from the server, as dicts
+    return ExecutionResult(errors=errors)
+
+
+class TestPersistedQueryTransport:
+    query_hash = hashlib.sha256(print_ast(ALL_POSTS).encode("utf-8")).hexdigest()
+
+    def execute(self, responses, document=ALL_POSTS):
+        transport = PersistedQueryTransport(url="http://test.endpoint")
+        with patch(
+            "gql.transport.aiohttp.AIOHTTPTransport.execute", AsyncMock(side_effect=responses)
+        ) as execute:
+            result = asyncio.run(transport.execute(document, {"lang": "en"}))
+        return result, [call.args[3] for call in execute.call_args_list]
+
+    def test_sends_only_hash_of_known_query(self):
+        result, sent = self.execute([ExecutionResult(data={"posts": []})])
+
+        assert result.data == {"posts": []}
+        assert sent == [
+            {
+                "json": {
+                    "extensions": {"persistedQuery": {"version": 1, "sha256Hash": self.query_hash}},
+                    "variables": {"lang": "en"},
+                }
+            }
+        ]
+
+    def test_sends_full_query_when_server_does_not_know_it(self):
+        not_found = result_with_errors(
+            [
+                {
+                    "message": "PersistedQueryNotFound",
+                    "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+                }
+            ]
+        )
+        result, sent = self.execute([not_found, ExecutionResult(data={"posts": []})])
+
+        assert result.data == {"posts": []}
+        assert "query" not in sent[0]["json"]
+        assert sent[1]["json"]["query"] == print_ast(ALL_POSTS)
+        assert sent[1]["json"]["extensions"] == sent[0]["json"]["extensions"]
+
+    def test_copy_of_known_query_is_sent_as_hash(self):
+        _, sent = self.execute([ExecutionResult(data={"posts": []})], copy.deepcopy(ALL_POSTS))
+
+        assert sent[0]["json"]["extensions"]["persistedQuery"]["sha256Hash"] == self.query_hash
+
+    def test_unknown_query_is_sent_in_full(self):
+        _, sent = self.execute([ExecutionResult(data={})], gql("query { logo { url } }"))
+
+        assert sent == [None]
+
+    def test_other_errors_are_returned(self):
+        error = result_with_errors([{"message": "Something else"}])
+        result, sent = self.execute([error])
+
+        assert result is error
+        assert len(sent) == 1
+
+
+class FakeTransport(AsyncTransport):
+    """Answers every query after `delay` seconds, recording connections and concurrency."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.connections = 0
+        self.closed = False
+        self.running = 0
+        self.max_running = 0
+        self.loop_threads = set()
+
+    async def connect(self):
+        self.connections += 1
+
+    async def close(self):
+        self.closed = True
+
+    async def execute(self, document, variable_values=None, operation_name=None):
+        self.loop_threads.add(threading.current_thread())
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return ExecutionResult(data=variable_values)
+
+    def subscribe(self, document, variable_values=None, operation_name=None):
+        raise NotImplementedError
+
+
+def pooled_client(transport, max_concurrency=10, timeout=10.0):
+    return PooledClient(
+        lambda: Client(transport=transport, execute_timeout=None),
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+    )
+
+
+def stop_loop(client):
+    """Stops the loop thread of a client, the way it doesn't exist in a forked process."""
+    loop = client._loop
+    assert loop is not None
+    loop.call_soon_threadsafe(loop.stop)
+    client._thread.join()
+    return loop
+
+
+class TestPooledClient:
+    def test_threads_share_one_session(self):
+        transport = FakeTransport()
+        client = pooled_client(transport)
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [
+                    executor.submit(client.execute, ALL_POSTS, {"lang": f"l{i}"}) for i in range(32)
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            client.close()
+
+        assert results == [{"lang": f"l{i}"} for i in range(32)]
+        assert transport.connections == 1
+        assert len(transport.loop_threads) == 1
+        assert transport.closed
+
+    def test_concurrent_queries_are_limited(self):
+        transport = FakeTransport(delay=0.02)
+        client = pooled_client(transport, max_concurrency=2)
+        try:
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                futures = [
+                    executor.submit(client.execute, ALL_POSTS, {"lang": "en"}) for _ in range(6)
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            client.close()
+
+        assert transport.max_running == 2
+
+    def test_slow_query_times_out(self):
+        client = pooled_client(FakeTransport(delay=1.0), timeout=0.05)
+        try:
+            with pytest.raises(TimeoutError):
+                client.execute(ALL_POSTS, variable_values={"lang": "en"})
+            assert client.execute(ALL_POSTS, variable_values={"lang": "en"}, timeout=2.0) == {
+                "lang": "en"
+            }
+        finally:
+            client.close()
+
+    def test_loop_and_client_are_created_on_first_use(self):
+        transport = FakeTransport()
+        make_client = Mock(side_effect=lambda: Client(transport=transport, execute_timeout=None))
+        client = PooledClient(make_client)
+        make_client.assert_not_called()
+        try:
+            client.execute(ALL_POSTS, variable_values={"lang": "en"})
+            client.execute(ALL_POSTS, variable_values={"lang": "en"})
+        finally:
+            client.close()
+
+        assert make_client.call_count == 1
+        assert transport.connections == 1
+
+    def test_forked_process_starts_its_own_loop(self, monkeypatch):
+        transport = FakeTransport()
+        client = pooled_client(transport)
+        client.execute(ALL_POSTS, variable_values={"lang": "en"})
+        parent_loop = stop_loop(client)
+        monkeypatch.setattr(os, "getpid", lambda: -1)
+        try:
+            assert client.execute(ALL_POSTS, variable_values={"lang": "en"}, timeout=1.0) == {
+                "lang": "en"
+            }
+        finally:
+            client.close()
+            parent_loop.close()
+
+        assert transport.connections == 2
+
+    # the query is never run by the stopped loop
+    @pytest.mark.filterwarnings("ignore:coroutine .* was never awaited:RuntimeWarning")
+    def test_caller_does_not_wait_forever_for_stopped_loop(self, monkeypatch):
+        monkeypatch.setattr("platzky.db.graph_ql_db.LOOP_TIMEOUT_MARGIN", 0.05)
+        client = pooled_client(FakeTransport())
+        client.execute(ALL_POSTS, variable_values={"lang": "en"})
+        loop = stop_loop(client)
+        try:
+            with pytest.raises(TimeoutError):
+                client.execute(ALL_POSTS, variable_values={"lang": "en"}, timeout=0.05)
+        finally:
+            loop.close()
@@ -1,10 +1,19 @@
 import datetime
+import threading
 from unittest.mock import patch
 
 import pytest
 
 from platzky.db.json_db import Json, JsonDbConfig, db_from_config, get_db
-from platzky.models import MenuItem, Post
+from platzky.models import MenuItem, Post, PostSummary
+
+
+def stored_post(db, slug):
+    return db._current_index().posts_by_slug[slug]
+
+
+def wait_for_related_posts(db):
+    return db._current_index().related.wait(5)
 
 
 class TestJsonDbConfig:
@@ -230,6 +239,170 @@ class TestJsonDb:
         assert comment["comment"] == "Great post!"
         assert comment["date"] == "2023-01-01T12:00:00"
 
+    def test_added_comment_is_visible_in_lookups(self, db):
+        db.add_comment("Test User", "Great post!", "post-1")
+
+        assert db.get_post("post-1").comments[0].comment == "Great post!"
+        assert db.get_all_posts("en")[0].comments[0].author == "Test User"
+        assert next(db.get_posts_by_tag("tag1", "en"))["comments"][0]["author"] == "Test User"
+
+    def test_posts_are_not_validated_on_reads(self, db):
+        with patch.object(Post, "model_validate", wraps=Post.model_validate) as validate:
+            db.get_all_posts("en")
+            db.get_post("post-1")
+            db.get_menu_items_in_lang("en")
+        validate.assert_not_called()
+
+    def test_add_comment_revalidates_only_commented_post(self, db):
+        other_post = stored_post(db, "post-2")
+        commented_post = stored_post(db, "post-1")
+
+        db.add_comment("Test User", "Great post!", "post-1")
+
+        assert stored_post(db, "post-2") is other_post
+        assert stored_post(db, "post-1") is not commented_post
+        assert len(db.get_post("post-1").comments) == 1
+
+    def test_add_comment_leaves_earlier_snapshot_intact(self, db, sample_data):
+        data_before = db.data
+        raw_post_before = next(db.get_posts_by_tag("tag1", "en"))
+
+        db.add_comment("Test User", "Great post!", "post-1")
+
+        assert data_before is sample_data
+        assert sample_data["site_content"]["posts"][0]["comments"] == []
+        assert raw_post_before["comments"] == []
+        assert len(db.data["site_content"]["posts"][0]["comments"]) == 1
+        assert db.data["site_content"]["posts"][1] is sample_data["site_content"]["posts"][1]
+
+    def test_concurrent_comments_are_not_lost(self, db):
+        def add_comments(thread_number):
+            for i in range(20):
+                db.add_comment(f"User {thread_number}", f"Comment {i}", "post-1")
+
+        threads = [threading.Thread(target=add_comments, args=(n,)) for n in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(db.get_post("post-1").comments) == 100
+
+    def test_get_page_is_memoized(self, db):
+        assert db.get_page("page-1") is db.get_page("page-1")
+
+    def test_posts_are_listed_newest_first(self, sample_data):
+        posts = sample_data["site_content"]["posts"]
+        posts.append({**posts[0], "slug": "post-3", "date": "2023-03-01T00:00:00"})
+        posts.append({**posts[0], "slug": "post-0", "date": "2022-12-01T00:00:00"})
+        db = Json(sample_data)
+
+        assert [p.slug for p in db.get_all_posts("en")] == ["post-3", "post-1", "post-0"]
+        assert [p["slug"] for p in db.get_posts_by_tag("tag1", "en")] == [
+            "post-3",
+            "post-1",
+            "post-0",
+        ]
+
+    def test_get_post_summaries_paginated(self, sample_data):
+        posts = sample_data["site_content"]["posts"]
+        for day in range(2, 7):
+            posts.append({**posts[0], "slug": f"post-1-{day}", "date": f"2023-01-0{day}T00:00:00"})
+        db = Json(sample_data)
+
+        assert [p.slug for p in db.get_post_summaries("en", 0, 2)] == ["post-1-6", "post-1-5"]
+        assert [p.slug for p in db.get_post_summaries("en", 4, 2)] == ["post-1-2", "post-1"]
+        assert db.get_post_summaries("en", 6, 2) == []
+        assert [p.slug for p in db.get_post_summaries("de", 0, 10, tag="tag3")] == ["post-2"]
+        assert db.get_post_summaries("fr", 0, 10) == []
+        assert db.get_post_summaries("en", 0, 10, tag="tag3") == []
+
+    def test_get_post_summaries(self, db):
+        summaries = db.get_post_summaries("en")
+        assert len(summaries) == 1
+        assert type(summaries[0]) is PostSummary
+        assert summaries[0].slug == "post-1"
+        assert summaries[0].coverImage.url == "/images/post1.jpg"
+        assert not hasattr(summaries[0], "contentInMarkdown")
+
+    def test_search_posts(self, db):
+        results = db.search_posts("en", "post 1 excerpt")
+        assert [summary.slug for summary in results] == ["post-1"]
+        assert type(results[0]) is PostSummary
+        assert db.search_posts("de", "tag3")[0].slug == "post-2"
+        assert db.search_posts("en", "tag3") == []
+        assert db.search_posts("en", "post", offset=1) == []
+
+    def test_get_search_suggestions(self, db):
+        suggestions = db.get_search_suggestions("en", "pos")
+        assert [(s.kind, s.target) for s in suggestions] == [("post", "post-1")]
+        assert [s.text for s in db.get_search_suggestions("de", "tag")] == ["tag2", "tag3"]
+        assert db.get_search_suggestions("en", "pos", limit=0) == []
+
+    def test_get_related_posts(self, sample_data):
+        post = sample_data["site_content"]["posts"][0]
+        related_post = {**post, "slug": "related", "tags": ["tag2"], "date": "2021-01-01"}
+        sample_data["site_content"]["posts"].append(related_post)
+        db = Json(sample_data)
+        assert wait_for_related_posts(db)
+
+        related = db.get_related_posts("en", "post-1")
+        assert [summary.slug for summary in related] == ["related"]
+        assert type(related[0]) is PostSummary
+        assert db.get_related_posts("en", "post-1", limit=0) == []
+        assert db.get_related_posts("de", "post-1") == []
+
+    def test_search_index_is_kept_when_comment_is_added(self, db):
+        search = db._current_index().search
+        typeahead = db._current_index().typeahead
+        related = db._current_index().related
+
+        db.add_comment("Test User", "Searchable comment", "post-1")
+
+        assert db._current_index().search is search
+        assert db._current_index().typeahead is typeahead
+        assert db._current_index().related is related
+        assert db.search_posts("en", "searchable") == []
+
+    def test_get_post_summaries_between(self, sample_data):
+        posts = sample_data["site_content"]["posts"]
+        template = posts[0]
+        posts[:] = [
+            {**template, "slug": "new-year", "date": "2024-01-01"},
+            {**template, "slug": "last-day", "date": "2023-12-31T23:59:59"},
+            {**template, "slug": "first", "date": "2023-01-01T00:00:00"},
+            {**template, "slug": "same-day", "date": "2023-06-01T10:00:00Z"},
+            {**template, "slug": "same-day-earlier", "date": "2023-06-01T08:00:00"},
+            {**template, "slug": "no-iso-date", "date": "June 2023"},
+            {**template, "slug": "previous-year", "date": "2022-12-31T23:59:59"},
+        ]
+        db = Json(sample_data)
+        year_2023 = (datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+
+        summaries = db.get_post_summaries_between("en", *year_2023)
+        assert [s.slug for s in summaries] == ["last-day", "same-day", "same-day-earlier", "first"]
+        assert type(summaries[0]) is PostSummary
+        june = (datetime.date(2023, 6, 1), datetime.date(2023, 7, 1))
+        assert [s.slug for s in db.get_post_summaries_between("en", *june, offset=1)] == [
+            "same-day-earlier"
+        ]
+        assert [s.slug for s in db.get_post_summaries_between("en", *year_2023, limit=1)] == [
+            "last-day"
+        ]
+        assert db.get_post_summaries_between("de", *year_2023) == []
+
+    def test_get_posts_by_slugs(self, db):
+        posts = db.get_posts_by_slugs(["post-2", "missing", "post-1"])
+
+        assert [post.slug for post in posts] == ["post-2", "post-1"]
+        assert all(isinstance(post, Post) for post in posts)
+        assert db.get_posts_by_slugs([]) == []
+
+    def test_post_with_repeated_tag_is_listed_once(self, sample_data):
+        sample_data["site_content"]["posts"][0]["tags"] = ["tag1", "tag1"]
+        db = Json(sample_data)
+        assert len(list(db.get_posts_by_tag("tag1", "en"))) == 1
+
     def test_add_comment_to_nonexistent_post(self, db):
         with pytest.raises(StopIteration):
             db.add_comment("Test User", "Comment", "non-existent")
@@ -0,0 +1,210 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from platzky.db.db_loader import get_db_module
+from platzky.db.json_dir_db import JsonDir, JsonDirDbConfig, db_from_config, get_db, write_json_dir
+from platzky.models import Post, PostSummary
+
+
+def make_post(slug, date, tags=(), language="en"):
+    return {
+        "title": slug.title(),
+        "slug": slug,
+        "author": "Author",
+        "contentInMarkdown": f"# {slug}",
+        "excerpt": f"{slug} excerpt",
+        "comments": [],
+        "tags": list(tags),
+        "language": language,
+        "coverImage": {"url": f"/images/{slug}.jpg"},
+        "date": date,
+    }
+
+
+@pytest.fixture
+def sample_data():
+    return {
+        "site_content": {
+            "app_description": {"en": "English description"},
+            "logo_url": "/logo.png",
+            "posts": [
+                make_post("old", "2023-01-01T00:00:00", tags=["tag1"]),
+                make_post("new", "2023-03-01T00:00:00", tags=["tag1", "tag2"]),
+                make_post("with/slash", "2023-02-01T00:00:00"),
+                make_post("polski", "2023-02-01T00:00:00", language="pl"),
+            ],
+            "pages": [make_post("about", "2023-01-01T00:00:00")],
+            "menu_items": {"en": [{"name": "Home", "url": "/"}]},
+        },
+        "plugins": [{"name": "plugin"}],
+    }
+
+
+@pytest.fixture
+def content_dir(tmp_path, sample_data):
+    write_json_dir(sample_data, str(tmp_path))
+    return tmp_path
+
+
+def wait_for_search_index(db):
+    build = db._search_build
+    assert build is not None
+    build.join(timeout=5)
+
+
+def cache_of(db):
+    return db._cache
+
+
+class TestFactoryFunctions:
+    def test_get_db(self, content_dir):
+        db = get_db({"TYPE": "json_dir", "PATH": str(content_dir), "CACHE_SIZE": 2})
+        assert isinstance(db, JsonDir)
+        assert db.cache_size == 2
+
+    def test_db_from_config(self, content_dir):
+        config = JsonDirDbConfig(TYPE="json_dir", PATH=str(content_dir))
+        db = db_from_config(config)
+        assert db.path == str(content_dir)
+        assert db.cache_size == 256
+
+    def test_loaded_by_db_loader(self):
+        assert get_db_module("json_dir").db_config_type() is not None
+
+
+class TestWriteJsonDir:
+    def test_manifest_holds_summaries_only(self, content_dir):
+        with open(content_dir / "manifest.json") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        posts = manifest["site_content"]["posts"]
+        assert [post["slug"] for post in posts] == ["old", "new", "with/slash", "polski"]
+        assert all("contentInMarkdown" not in post for post in posts)
+        assert manifest["site_content"]["pages"] == ["about"]
+        assert manifest["plugins"] == [{"name": "plugin"}]
+
+    def test_one_file_per_post_and_page(self, content_dir):
+        assert sorted(os.listdir(content_dir / "posts")) == [
+            "new.json",
+            "old.json",
+            "polski.json",
+            "with%2Fslash.json",
+        ]
+        assert os.listdir(content_dir / "pages") == ["about.json"]
+
+
+class TestJsonDir:
+    def test_startup_reads_only_manifest(self, content_dir):
+        (content_dir / "posts" / "new.json").unlink()
+        db = JsonDir(str(content_dir))
+
+        summaries = db.get_post_summaries("en")
+        assert [summary.slug for summary in summaries] == ["new", "with/slash", "old"]
+        assert all(type(summary) is PostSummary for summary in summaries)
+        assert cache_of(db) == {}
+
+    def test_get_post_is_loaded_lazily_and_cached(self, content_dir):
+        db = JsonDir(str(content_dir))
+
+        post = db.get_post("with/slash")
+        assert isinstance(post, Post)
+        assert post.contentInMarkdown == "# with/slash"
+        (content_dir / "posts" / "with%2Fslash.json").unlink()
+        assert db.get_post("with/slash") is post
+
+    def test_get_post_not_found(self, content_dir):
+        db = JsonDir(str(content_dir))
+        with pytest.raises(ValueError, match="Post with slug missing not found"):
+            db.get_post("missing")
+
+    def test_cache_drops_least_recently_used(self, content_dir):
+        db = JsonDir(str(content_dir), cache_size=2)
+
+        db.get_post("old")
+        db.get_post("new")
+        db.get_post("old")
+        db.get_post("polski")
+
+        assert list(cache_of(db)) == [("posts", "old"), ("posts", "polski")]
+
+    def test_listings(self, content_dir):
+        db = JsonDir(str(content_dir))
+
+        assert [post.slug for post in db.get_all_posts("en")] == ["new", "with/slash", "old"]
+        assert [s.slug for s in db.get_post_summaries("en", tag="tag1")] == ["new", "old"]
+        assert [s.slug for s in db.get_post_summaries("en", offset=1, limit=1)] == ["with/slash"]
+        assert [post["slug"] for post in db.get_posts_by_tag("tag2", "en")] == ["new"]
+
+    def test_search_suggestions_do_not_read_post_files(self, content_dir):
+        db = JsonDir(str(content_dir))
+        for post_file in (content_dir / "posts").iterdir():
+            post_file.unlink()
+
+        suggestions = db.get_search_suggestions("en", "ne")
+        assert [(s.kind, s.target) for s in suggestions] == [("post", "new")]
+        assert [s.text for s in db.get_search_suggestions("en", "tag")] == ["tag1", "tag2"]
+        assert db.get_search_suggestions("pl", "ne") == []
+        assert cache_of(db) == {}
+
+    def test_search_index_is_built_in_background(self, content_dir):
+        db = JsonDir(str(content_dir), cache_size=1)
+
+        assert db.search_posts("en", "slash") == []
+        wait_for_search_index(db)
+        assert [post.slug for post in db.search_posts("en", "slash")] == ["with/slash"]
+        assert [post.slug for post in db.search_posts("en", "tag2")] == ["new"]
+        assert [post.slug for post in db.search_posts("pl", "polski")] == ["polski"]
+        assert db.search_posts("en", "tag1", offset=1, limit=1)[0].slug in {"old", "new"}
+        assert cache_of(db) == {}
+
+    def test_search_index_is_built_once(self, content_dir):
+        db = JsonDir(str(content_dir))
+        db.search_posts("en", "new")
+        wait_for_search_index(db)
+        for post_file in (content_dir / "posts").iterdir():
+            post_file.unlink()
+
+        assert [post.slug for post in db.search_posts("en", "new")] == ["new"]
+
+    def test_get_post_summaries_between(self, content_dir):
+        db = JsonDir(str(content_dir))
+        start, end = datetime.date(2023, 1, 1), datetime.date(2023, 3, 1)
+
+        assert [s.slug for s in db.get_post_summaries_between("en", start, end)] == [
+            "with/slash",
+            "old",
+        ]
+        assert [s.slug for s in db.get_post_summaries_between("pl", start, end)] == ["polski"]
+
+    def test_get_page(self, content_dir):
+        db = JsonDir(str(content_dir))
+
+        assert db.get_page("about").title == "About"
+        with pytest.raises(StopIteration):
+            db.get_page("missing")
+
+    def test_settings(self, content_dir):
+        db = JsonDir(str(content_dir))
+
+        assert db.get_app_description("en") == "English description"
+        assert db.get_logo_url() == "/logo.png"
+        assert db.get_primary_color() == "white"
+        assert [item.name for item in db.get_menu_items_in_lang("en")] == ["Home"]
+        assert db.get_plugins_data() == [{"name": "plugin"}]
+
+    def test_add_comment_is_written_to_post_file(self, content_dir):
+        db = JsonDir(str(content_dir))
+        db.get_post("old")
+
+        db.add_comment("Commenter", "Nice!", "old")
+
+        assert [c.comment for c in db.get_post("old").comments] == ["Nice!"]
+        assert [c.comment for c in JsonDir(str(content_dir)).get_post("old").comments] == ["Nice!"]
+
+    def test_add_comment_to_missing_post(self, content_dir):
+        db = JsonDir(str(content_dir))
+        with pytest.raises(StopIteration):
+            db.add_comment("Commenter", "Nice!", "missing")
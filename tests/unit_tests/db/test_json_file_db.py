@@ -1,10 +1,21 @@
+import gzip
 import json
+import os
+import threading
+import time
 from datetime import datetime
 from unittest.mock import mock_open, patch
 
 import pytest
 
-from platzky.db.json_file_db import JsonFile, JsonFileDbConfig, db_from_config, get_db
+from platzky.db.json_db import ContentIndex
+from platzky.db.json_file_db import (
+    JsonFile,
+    JsonFileDbConfig,
+    build_snapshot,
+    db_from_config,
+    get_db,
+)
 
 
 class TestJsonFileDb:
@@ -52,22 +63,19 @@ class TestJsonFileDb:
             assert db.get_app_description("de") == "Deutsche Beschreibung"
             assert db.get_app_description("fr") is None
 
-    def test_add_comment_saves_file(self, sample_data, mock_file_path):
-        json_str = json.dumps(sample_data)
-        mock_file = mock_open(read_data=json_str)
+    def test_add_comment_saves_file(self, sample_data, tmp_path):
+        data_file = tmp_path / "data.json"
+        data_file.write_text(json.dumps(sample_data))
 
         test_date = datetime(2023, 2, 1, 10, 0)
-        with patch("builtins.open", mock_file), patch("datetime.datetime") as mock_datetime:
+        with patch("datetime.datetime") as mock_datetime:
             mock_datetime.now.return_value = test_date
-            db = JsonFile(mock_file_path)
+            db = JsonFile(str(data_file))
             db.add_comment("Test User", "New comment", "post-1")
 
-        # Check that the file was opened for writing
-        mock_file.assert_called_with(mock_file_path, "w")
-
-        # Instead of parsing the written data, check if write was called
-        # and verify the expected data is in the updated db object
-        assert mock_file().write.called
+        # Check that the file was replaced as a whole, without leftover temporary files
+        assert json.loads(data_file.read_text()) == db.data
+        assert os.listdir(tmp_path) == ["data.json"]
 
         # Verify the comment was added to the db's data structure
         comments = db.data["site_content"]["posts"][0]["comments"]
@@ -134,3 +142,480 @@ class TestJsonFileDb:
         with patch("builtins.open", mock_open(read_data=json_str)), pytest.raises(ValueError):
             db = JsonFile(mock_file_path)
             db.get_post("non-existent")
+
+
+def stored_post(db, slug):
+    return db._current_index().posts_by_slug[slug]
+
+
+def reload_if_changed(db):
+    return db._reload_if_changed()
+
+
+def wait_for_background_reload(db):
+    reload = db._background_reload
+    assert reload is not None
+    reload.join(timeout=5)
+
+
+def wait_for_compaction(db):
+    compaction = db._compaction
+    assert compaction is not None
+    compaction.join(timeout=5)
+
+
+class TestJsonFileCommentsJournal:
+    @pytest.fixture
+    def data_file(self, tmp_path):
+        data = {
+            "site_content": {
+                "posts": [
+                    {
+                        "title": "Post 1",
+                        "slug": "post-1",
+                        "author": "Author 1",
+                        "contentInMarkdown": "# Post 1",
+                        "excerpt": "Post 1 excerpt",
+                        "comments": [],
+                        "tags": ["tag1"],
+                        "language": "en",
+                        "coverImage": {"url": "/images/post1.jpg"},
+                        "date": "2023-01-01T00:00:00",
+                    }
+                ],
+            }
+        }
+        path = tmp_path / "data.json"
+        path.write_text(json.dumps(data))
+        return path
+
+    @staticmethod
+    def journal_of(db):
+        assert db._journal is not None
+        return db._journal
+
+    @staticmethod
+    def saved_comments(data_file):
+        return json.loads(data_file.read_text())["site_content"]["posts"][0]["comments"]
+
+    def test_comment_is_journaled_instead_of_rewriting_data_file(self, data_file):
+        data_before = data_file.read_text()
+        db = JsonFile(str(data_file), comments_journal=True)
+
+        db.add_comment("Test User", "New comment", "post-1")
+
+        assert data_file.read_text() == data_before
+        journal = (data_file.parent / "data.json.journal").read_text().splitlines()
+        assert len(journal) == 1
+        assert json.loads(journal[0])["post_slug"] == "post-1"
+        assert db.get_post("post-1").comments[0].comment == "New comment"
+
+    def test_journal_is_replayed_on_startup(self, data_file):
+        db = JsonFile(str(data_file), comments_journal=True)
+        db.add_comment("Test User", "First", "post-1")
+        db.add_comment("Test User", "Second", "post-1")
+
+        restarted_db = JsonFile(str(data_file), comments_journal=True)
+
+        comments = restarted_db.get_post("post-1").comments
+        assert [c.comment for c in comments] == ["First", "Second"]
+
+    def test_replay_skips_incomplete_and_already_compacted_entries(self, data_file):
+        comment = {"author": "A", "comment": "Compacted", "date": "2023-02-01T10:00:00"}
+        data = json.loads(data_file.read_text())
+        data["site_content"]["posts"][0]["comments"].append(comment)
+        data_file.write_text(json.dumps(data))
+        journal_path = data_file.parent / "data.json.journal"
+        journal_path.write_text(
+            json.dumps({"post_slug": "post-1", "comment": comment})
+            + "\n"
+            + json.dumps({"post_slug": "unknown", "comment": comment})
+            + '\n{"post_slug": "post-1", "comm'
+        )
+
+        db = JsonFile(str(data_file), comments_journal=True)
+        db.add_comment("Test User", "After crash", "post-1")
+
+        assert [c.comment for c in db.get_post("post-1").comments] == ["Compacted", "After crash"]
+        assert json.loads(journal_path.read_text().splitlines()[-1])["comment"]["comment"] == (
+            "After crash"
+        )
+
+    def test_journal_is_compacted_once_it_is_too_big(self, data_file):
+        db = JsonFile(str(data_file), comments_journal=True, journal_max_size=1)
+
+        db.add_comment("Test User", "New comment", "post-1")
+        wait_for_compaction(db)
+
+        assert [c["comment"] for c in self.saved_comments(data_file)] == ["New comment"]
+        assert (data_file.parent / "data.json.journal").read_text() == ""
+        assert db.get_post("post-1").comments[0].comment == "New comment"
+
+    def test_journal_is_compacted_once_it_is_too_old(self, data_file):
+        db = JsonFile(str(data_file), comments_journal=True, journal_max_age=0.05)
+
+        db.add_comment("Test User", "New comment", "post-1")
+        wait_for_compaction(db)
+
+        assert [c["comment"] for c in self.saved_comments(data_file)] == ["New comment"]
+
+    def test_compaction_keeps_entries_appended_while_it_ran(self, data_file):
+        db = JsonFile(str(data_file), comments_journal=True, journal_max_age=60)
+        db.add_comment("Test User", "Compacted", "post-1")
+        journal = self.journal_of(db)
+        compacted_size = journal.offset
+        journal.append("post-1", {"author": "B", "comment": "Late", "date": "2023-02-01T10:00:00"})
+
+        journal.drop_before(compacted_size)
+
+        entries = list(journal.entries())
+        assert [comment["comment"] for _, comment in entries] == ["Late"]
+
+
+class TestJsonFileReloading:
+    @pytest.fixture
+    def data(self):
+        return {
+            "site_content": {
+                "logo_url": "/logo.png",
+                "posts": [
+                    {
+                        "title": "Post 1",
+                        "slug": "post-1",
+                        "author": "Author 1",
+                        "contentInMarkdown": "# Post 1",
+                        "excerpt": "Post 1 excerpt",
+                        "comments": [],
+                        "tags": ["tag1"],
+                        "language": "en",
+                        "coverImage": {"url": "/images/post1.jpg"},
+                        "date": "2023-01-01T00:00:00",
+                    }
+                ],
+            }
+        }
+
+    @pytest.fixture
+    def data_file(self, tmp_path, data):
+        path = tmp_path / "data.json"
+        path.write_text(json.dumps(data))
+        return path
+
+    @staticmethod
+    def publish(data_file, data):
+        data_file.write_text(json.dumps(data))
+        # make sure the change is visible even on filesystems with coarse timestamps
+        stat = data_file.stat()
+        os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    @staticmethod
+    def reload(db):
+        return db._reload_if_changed()
+
+    def test_unchanged_file_is_not_reloaded(self, data_file):
+        db = JsonFile(str(data_file), reload_interval=60)
+        assert not self.reload(db)
+
+    def test_changed_file_is_reloaded_with_indexes(self, data_file, data):
+        db = JsonFile(str(data_file), reload_interval=60)
+        old_post = db.get_post("post-1")
+        data["site_content"]["posts"][0]["title"] = "New title"
+        data["site_content"]["logo_url"] = "/new-logo.png"
+
+        self.publish(data_file, data)
+
+        assert self.reload(db)
+        assert db.get_post("post-1").title == "New title"
+        assert db.get_all_posts("en")[0].title == "New title"
+        assert db.get_logo_url() == "/new-logo.png"
+        assert old_post.title == "Post 1"
+
+    def test_search_index_is_updated_on_reload(self, data_file, data):
+        db = JsonFile(str(data_file), reload_interval=60)
+        data["site_content"]["posts"][0]["title"] = "Reloaded title"
+
+        self.publish(data_file, data)
+
+        assert self.reload(db)
+        assert [post.slug for post in db.search_posts("en", "reloaded")] == ["post-1"]
+
+    def test_touched_file_with_same_content_is_not_parsed_again(self, data_file, data):
+        db = JsonFile(str(data_file), reload_interval=60)
+        self.publish(data_file, {**data, "plugins": []})
+        assert self.reload(db)
+
+        self.publish(data_file, {**data, "plugins": []})
+        with patch("json.loads") as loads:
+            assert not self.reload(db)
+        loads.assert_not_called()
+
+    def test_broken_file_keeps_current_content(self, data_file):
+        db = JsonFile(str(data_file), reload_interval=60)
+        data_file.write_text('{"site_content": ')
+
+        with pytest.raises(json.JSONDecodeError):
+            self.reload(db)
+
+        assert db.get_post("post-1").title == "Post 1"
+        assert not self.reload(db)
+
+    def test_own_writes_are_not_reloaded(self, data_file):
+        db = JsonFile(str(data_file), reload_interval=60)
+        db.add_comment("Test User", "New comment", "post-1")
+        assert not self.reload(db)
+
+    def test_comment_right_after_publishing_keeps_published_content(self, data_file, data):
+        db = JsonFile(str(data_file), reload_interval=60)
+        data["site_content"]["posts"][0]["title"] = "New title"
+
+        self.publish(data_file, data)
+        db.add_comment("Test User", "New comment", "post-1")
+
+        saved_post = json.loads(data_file.read_text())["site_content"]["posts"][0]
+        assert saved_post["title"] == "New title"
+        assert [c["comment"] for c in saved_post["comments"]] == ["New comment"]
+        assert db.get_post("post-1").title == "New title"
+        assert not self.reload(db)
+
+    def test_compaction_right_after_publishing_keeps_published_content(self, data_file, data):
+        db = JsonFile(
+            str(data_file), comments_journal=True, journal_max_age=0.05, reload_interval=60
+        )
+        data["site_content"]["posts"][0]["title"] = "New title"
+
+        db.add_comment("Test User", "New comment", "post-1")
+        self.publish(data_file, data)
+        wait_for_compaction(db)
+
+        saved_post = json.loads(data_file.read_text())["site_content"]["posts"][0]
+        assert saved_post["title"] == "New title"
+        assert [c["comment"] for c in saved_post["comments"]] == ["New comment"]
+
+    def test_journaled_comments_survive_reload(self, data_file, data):
+        db = JsonFile(str(data_file), comments_journal=True, reload_interval=60)
+        db.add_comment("Test User", "New comment", "post-1")
+        data["site_content"]["posts"][0]["title"] = "New title"
+
+        self.publish(data_file, data)
+
+        assert self.reload(db)
+        post = db.get_post("post-1")
+        assert post.title == "New title"
+        assert [c.comment for c in post.comments] == ["New comment"]
+
+    def test_background_thread_reloads_file(self, data_file, data):
+        db = JsonFile(str(data_file), reload_interval=0.01)
+        data["site_content"]["posts"][0]["title"] = "New title"
+
+        self.publish(data_file, data)
+
+        for _ in range(500):
+            if db.get_post("post-1").title == "New title":
+                break
+            time.sleep(0.01)
+        assert db.get_post("post-1").title == "New title"
+
+
+class TestJsonFileMultiProcess:
+    @pytest.fixture
+    def data_file(self, tmp_path):
+        post = {
+            "author": "Author 1",
+            "contentInMarkdown": "# Post",
+            "excerpt": "Post excerpt",
+            "comments": [],
+            "tags": ["tag1"],
+            "language": "en",
+            "coverImage": {"url": "/images/post.jpg"},
+            "date": "2023-01-01T00:00:00",
+        }
+        data = {
+            "site_content": {
+                "posts": [
+                    {**post, "title": "Post 1", "slug": "post-1"},
+                    {**post, "title": "Post 2", "slug": "post-2"},
+                ],
+            }
+        }
+        path = tmp_path / "data.json"
+        path.write_text(json.dumps(data))
+        return path
+
+    @staticmethod
+    def worker(data_file, **kwargs):
+        return JsonFile(
+            str(data_file), multi_process=True, multi_process_check_interval=0, **kwargs
+        )
+
+    @staticmethod
+    def comments(db, slug="post-1"):
+        return [c.comment for c in db.get_post(slug).comments]
+
+    def test_writes_are_merged_with_other_processes_writes(self, data_file):
+        first, second = self.worker(data_file), self.worker(data_file)
+
+        first.add_comment("A", "From first", "post-1")
+        second.add_comment("B", "From second", "post-1")
+
+        saved = json.loads(data_file.read_text())["site_content"]["posts"][0]["comments"]
+        assert [c["comment"] for c in saved] == ["From first", "From second"]
+        self.comments(first)
+        wait_for_background_reload(first)
+        assert self.comments(first) == ["From first", "From second"]
+        assert (data_file.parent / "data.json.lock").exists()
+
+    def test_changed_data_file_is_parsed_in_background(self, data_file):
+        first, second = self.worker(data_file), self.worker(data_file)
+
+        first.add_comment("A", "From first", "post-1")
+
+        parsing_threads = []
+
+        def content_index(*args, **kwargs):
+            parsing_threads.append(threading.current_thread())
+            return ContentIndex(*args, **kwargs)
+
+        with patch("platzky.db.json_file_db.ContentIndex", side_effect=content_index):
+            self.comments(second)
+            wait_for_background_reload(second)
+        assert self.comments(second) == ["From first"]
+        assert parsing_threads
+        assert threading.current_thread() not in parsing_threads
+
+    def test_journaled_comments_are_picked_up_without_parsing_data_file(self, data_file):
+        first = self.worker(data_file, comments_journal=True)
+        second = self.worker(data_file, comments_journal=True)
+        untouched_post = stored_post(second, "post-2")
+
+        first.add_comment("A", "From first", "post-1")
+
+        assert self.comments(second) == ["From first"]
+        assert stored_post(second, "post-2") is untouched_post
+
+        second.add_comment("B", "From second", "post-1")
+        assert self.comments(first) == ["From first", "From second"]
+
+    def test_compaction_by_other_process_does_not_duplicate_comments(self, data_file):
+        first = self.worker(data_file, comments_journal=True, journal_max_size=1)
+        second = self.worker(data_file, comments_journal=True)
+
+        first.add_comment("A", "From first", "post-1")
+        assert self.comments(second) == ["From first"]
+        wait_for_compaction(first)
+
+        assert (data_file.parent / "data.json.journal").read_text() == ""
+        assert self.comments(second) == ["From first"]
+        second.add_comment("B", "From second", "post-1")
+        assert self.comments(first) == ["From first", "From second"]
+
+    def test_staleness_is_checked_at_most_once_per_interval(self, data_file):
+        first = self.worker(data_file)
+        second = JsonFile(str(data_file), multi_process=True, multi_process_check_interval=60)
+
+        first.add_comment("A", "From first", "post-1")
+
+        assert self.comments(second) == []
+
+
+class TestJsonFileLoading:
+    @pytest.fixture
+    def data(self):
+        return {
+            "site_content": {
+                "posts": [
+                    {
+                        "title": "Post 1",
+                        "slug": "post-1",
+                        "author": "Author 1",
+                        "contentInMarkdown": "# Post 1",
+                        "excerpt": "Post 1 excerpt",
+                        "comments": [],
+                        "tags": ["tag1"],
+                        "language": "en",
+                        "coverImage": {"url": "/images/post1.jpg"},
+                        "date": "2023-01-01T00:00:00",
+                    }
+                ],
+                "pages": [{"slug": "incomplete", "title": "Incomplete page"}],
+            }
+        }
+
+    @pytest.fixture
+    def data_file(self, tmp_path, data):
+        path = tmp_path / "data.json"
+        path.write_text(json.dumps(data))
+        return path
+
+    def test_fresh_snapshot_is_loaded_without_parsing(self, data_file):
+        assert build_snapshot(str(data_file)) == f"{data_file}.snapshot"
+
+        with patch("json.loads") as loads:
+            db = JsonFile(str(data_file), snapshot=True)
+
+        loads.assert_not_called()
+        assert db.get_post("post-1").title == "Post 1"
+        assert [post.slug for post in db.get_all_posts("en")] == ["post-1"]
+
+    def test_stale_snapshot_falls_back_to_data_file(self, data_file, data):
+        build_snapshot(str(data_file))
+        data["site_content"]["posts"][0]["title"] = "New title"
+        data_file.write_text(json.dumps(data))
+
+        db = JsonFile(str(data_file), snapshot=True)
+
+        assert db.get_post("post-1").title == "New title"
+
+    def test_broken_snapshot_falls_back_to_data_file(self, data_file):
+        (data_file.parent / "data.json.snapshot").write_bytes(b"not a pickle")
+
+        db = JsonFile(str(data_file), snapshot=True)
+
+        assert db.get_post("post-1").title == "Post 1"
+
+    def test_comments_are_added_to_content_from_snapshot(self, data_file):
+        build_snapshot(str(data_file))
+        db = JsonFile(str(data_file), snapshot=True)
+
+        db.add_comment("Test User", "New comment", "post-1")
+
+        assert [c.comment for c in JsonFile(str(data_file)).get_post("post-1").comments] == [
+            "New comment"
+        ]
+
+    @pytest.mark.parametrize("name", ["data.json.gz", "data.json"])
+    def test_gzip_compressed_data_file(self, tmp_path, data, name):
+        data_file = tmp_path / name
+        data_file.write_bytes(gzip.compress(json.dumps(data).encode()))
+
+        db = JsonFile(str(data_file), streaming_load=True)
+        db.add_comment("Test User", "New comment", "post-1")
+
+        saved = json.loads(gzip.decompress(data_file.read_bytes()))
+        assert saved["site_content"]["posts"][0]["comments"][0]["comment"] == "New comment"
+        assert JsonFile(str(data_file)).get_post("post-1").comments[0].comment == "New comment"
+
+    def test_compressed_data_file_is_reloaded(self, tmp_path, data):
+        data_file = tmp_path / "data.json.gz"
+        data_file.write_bytes(gzip.compress(json.dumps(data).encode()))
+        db = JsonFile(str(data_file), reload_interval=60)
+
+        data["site_content"]["posts"][0]["title"] = "New title"
+        data_file.write_bytes(gzip.compress(json.dumps(data).encode()))
+        os.utime(data_file, ns=(0, 0))
+
+        assert reload_if_changed(db)
+        assert db.get_post("post-1").title == "New title"
+
+    def test_zstd_without_zstandard(self, tmp_path, data):
+        data_file = tmp_path / "data.json.zst"
+        data_file.write_bytes(b"\x28\xb5\x2f\xfd")
+
+        with patch("platzky.db.files.zstandard", None):
+            with pytest.raises(ValueError, match="zstandard"):
+                JsonFile(str(data_file))
+
+    def test_streaming_load(self, data_file, data):
+        db = get_db({"TYPE": "json_file", "PATH": str(data_file), "STREAMING_LOAD": True})
+
+        assert db.data == data
+        assert db.get_post("post-1").title == "Post 1"
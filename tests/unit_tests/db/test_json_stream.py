@@ -0,0 +1,92 @@
+import io
+import json
+
+import pytest
+
+from platzky.db.json_stream import iter_posts, load_content_index
+
+
+def make_post(slug, date, language="en"):
+    return {
+        "title": slug.title(),
+        "slug": slug,
+        "author": "Author",
+        "contentInMarkdown": f"# {slug} " + "long body " * 50,
+        "excerpt": f"{slug} excerpt",
+        "comments": [],
+        "tags": ["tag1"],
+        "language": language,
+        "coverImage": {"url": f"/images/{slug}.jpg"},
+        "date": date,
+    }
+
+
+@pytest.fixture
+def data():
+    return {
+        "plugins": [{"name": "plugin", "config": {"number": 12345678}}],
+        "site_content": {
+            "app_description": {"en": 'Description ż"quoted"'},
+            "posts": [
+                make_post("first", "2023-01-01T00:00:00"),
+                make_post("second", "2023-02-01T00:00:00"),
+                make_post("first", "2024-01-01T00:00:00"),
+            ],
+            "pages": [{"slug": "about"}],
+            "menu_items": {"en": [{"name": "Home", "url": "/"}]},
+        },
+        "after": [],
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_iter_posts_parses_same_data_as_json_load(data, chunk_size):
+    parsed = {}
+    stream = io.StringIO(json.dumps(data, indent=2))
+
+    posts = list(iter_posts(stream, parsed, chunk_size=chunk_size))
+
+    assert [post["slug"] for post in posts] == ["first", "second", "first"]
+    assert parsed == data
+
+
+def test_iter_posts_yields_posts_before_reading_rest_of_file(data):
+    parsed = {}
+    stream = io.StringIO(json.dumps(data))
+    posts = iter_posts(stream, parsed, chunk_size=16)
+
+    assert next(posts)["slug"] == "first"
+    assert stream.tell() < len(stream.getvalue()) / 2
+    assert "after" not in parsed
+
+
+def test_load_content_index(data):
+    index = load_content_index(io.StringIO(json.dumps(data)))
+
+    assert index.data == data
+    assert index.slugs_by_lang["en"] == ("second", "first")
+    assert index.posts_by_slug["first"].date == "2023-01-01T00:00:00"
+    assert index.raw_pages_by_slug["about"] == {"slug": "about"}
+    assert [item.name for item in index.menu_items_by_lang["en"]] == ["Home"]
+
+
+def test_site_content_without_posts():
+    index = load_content_index(io.StringIO('{"site_content": {}, "plugins": []}'))
+
+    assert index.data == {"site_content": {}, "plugins": []}
+    assert index.posts_by_slug == {}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "This is not valid JSON",
+        '{"site_content": {"posts": [{"slug": "x"',
+        '{"site_content": {}} trailing',
+        '{"site_content" {}}',
+        "{1: 2}",
+    ],
+)
+def test_malformed_data(text):
+    with pytest.raises(json.JSONDecodeError):
+        load_content_index(io.StringIO(text))
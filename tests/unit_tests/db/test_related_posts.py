@@ -0,0 +1,151 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from platzky.db import related_posts
+from platzky.db.related_posts import MAX_POSTING, RelatedPosts
+from platzky.db.search_index import SearchDocument
+
+
+def document(slug, content="", tags=(), title="", language="en"):
+    return SearchDocument(slug, language, title, "", tuple(tags), content)
+
+
+def build(documents, previous=None):
+    related = RelatedPosts.build(documents, previous=previous)
+    assert related.wait(10)
+    return related
+
+
+def test_posts_sharing_tags_and_words_are_related():
+    related = build(
+        [
+            document("python-tips", "python decorators generators", tags=["python"]),
+            document("python-news", "python release generators", tags=["python", "news"]),
+            document("python-talk", "conference about decorators"),
+            document("cooking", "pasta with tomatoes", tags=["food"]),
+            document("baking", "bread with flour", tags=["food"]),
+        ]
+    )
+
+    assert related.get("en", "python-tips") == ("python-news", "python-talk")
+    assert related.get("en", "python-tips", limit=1) == ("python-news",)
+    assert related.get("en", "cooking") == ("baking",)
+    assert related.get("en", "missing") == ()
+    assert related.get("pl", "cooking") == ()
+
+
+def test_common_words_do_not_relate_posts():
+    related = build(
+        [
+            document("first", "the post about cats"),
+            document("second", "the post about dogs"),
+            document("third", "the post about cats and kittens"),
+        ]
+    )
+
+    assert related.get("en", "first") == ("third",)
+    assert related.get("en", "second") == ()
+
+
+def test_languages_are_separate():
+    related = build(
+        [
+            document("english", "same words", tags=["tag"]),
+            document("polish", "same words", tags=["tag"], language="pl"),
+        ]
+    )
+
+    assert related.get("en", "english") == ()
+    assert related.get("pl", "polish") == ()
+
+
+def test_only_changed_languages_are_recomputed(monkeypatch):
+    documents = [
+        document("en-1", "shared words", tags=["tag"]),
+        document("en-2", "shared words", tags=["tag"]),
+        document("pl-1", "wspólne słowa", tags=["tag"], language="pl"),
+        document("pl-2", "wspólne słowa", tags=["tag"], language="pl"),
+    ]
+    previous = build(documents)
+    assert previous.get("en", "en-1") == ("en-2",)
+    related_in_language = Mock(wraps=getattr(related_posts, "_related_in_language"))
+    monkeypatch.setattr(related_posts, "_related_in_language", related_in_language)
+
+    updated = build(
+        [*documents, document("pl-3", "inne", tags=["tag"], language="pl")], previous=previous
+    )
+
+    assert updated.get("en", "en-1") == ("en-2",)
+    assert set(updated.get("pl", "pl-3")) == {"pl-1", "pl-2"}
+    assert related_in_language.call_count == 1
+    assert previous.get("pl", "pl-3") == ()
+
+
+def test_related_posts_are_computed_in_background(monkeypatch):
+    computing = threading.Event()
+    computed = threading.Event()
+    compute = getattr(related_posts, "_related_in_language")
+
+    def slow_related_in_language(documents):
+        computing.set()
+        computed.wait(5)
+        return compute(documents)
+
+    monkeypatch.setattr(related_posts, "_related_in_language", slow_related_in_language)
+    related = RelatedPosts.build([document("en-1", tags=["tag"]), document("en-2", tags=["tag"])])
+    assert computing.wait(5)
+
+    assert related.get("en", "en-1") == ()
+    assert not related.wait(0)
+    computed.set()
+    assert related.wait(5)
+    assert related.get("en", "en-1") == ("en-2",)
+
+
+def test_tags_of_many_posts_relate_posts_next_to_each_other():
+    related = build([document(f"post-{i}", f"text{i}", tags=["everywhere"]) for i in range(100)])
+
+    assert set(related.get("en", "post-50", limit=5)) <= {
+        f"post-{i}" for i in range(50 - MAX_POSTING // 2, 51 + MAX_POSTING // 2)
+    }
+    assert len(related.get("en", "post-50", limit=5)) == 5
+    assert len(related.get("en", "post-0", limit=5)) == 5
+
+
+def test_computing_related_posts_of_many_posts_is_fast():
+    words = [f"word{i}" for i in range(3000)]
+    documents = [
+        document(
+            f"post-{i}",
+            " ".join(words[(i * 17 + j * 31) % 3000] for j in range(200)),
+            tags=[f"tag{i % 50}", f"tag{i % 7}"],
+        )
+        for i in range(1000)
+    ]
+
+    start = time.perf_counter()
+    related = build(documents)
+    elapsed = time.perf_counter() - start
+
+    assert len(related.get("en", "post-0", limit=5)) == 5
+    assert elapsed < 10
+
+
+def test_cost_grows_linearly_with_posts_sharing_tags_and_words():
+    def build_time(count):
+        documents = [
+            document(
+                f"post-{i}",
+                f"common words in every post and a few rare ones: rare{i} rare{i // 2}",
+                tags=["everywhere", f"tag{i % 10}"],
+            )
+            for i in range(count)
+        ]
+        start = time.perf_counter()
+        build(documents)
+        return time.perf_counter() - start
+
+    build_time(100)  # warm up
+    # comparing every post with all others sharing a tag would take 16 times longer
+    assert build_time(4000) < 8 * build_time(1000)
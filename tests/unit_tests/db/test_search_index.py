@@ -0,0 +1,103 @@
+import time
+
+from platzky.db.search_index import SearchDocument, SearchIndex, tokenize
+
+
+def document(slug, title="", content="", tags=(), excerpt="", language="en"):
+    return SearchDocument(slug, language, title, excerpt, tuple(tags), content)
+
+
+def test_tokenize_ignores_case_and_punctuation():
+    assert tokenize("Zażółć, GĘŚLĄ jaźń! **bold** e-mail") == [
+        "zażółć",
+        "gęślą",
+        "jaźń",
+        "bold",
+        "e",
+        "mail",
+    ]
+
+
+def test_best_matches_come_first():
+    index = SearchIndex.build(
+        [
+            document("unrelated", title="Cooking", content="pasta and tomatoes"),
+            document("mention", title="Tips", content="a word about email among other words"),
+            document("title", title="Email marketing", content="how to write"),
+            document("tagged", title="Newsletter", tags=["email"]),
+        ]
+    )
+
+    results = index.search("en", "email")
+    assert set(results[:2]) == {"title", "tagged"}
+    assert results[2:] == ["mention"]
+    assert index.search("en", "EMAIL marketing", limit=1) == ["title"]
+    assert index.search("en", "nothing like that") == []
+
+
+def test_rare_terms_weigh_more_than_common_ones():
+    index = SearchIndex.build(
+        [document(f"common-{i}", content="common") for i in range(10)]
+        + [document("rare", content="rare"), document("both", content="common rare")]
+    )
+
+    assert set(index.search("en", "common rare")[:2]) == {"both", "rare"}
+
+
+def test_languages_are_separate():
+    index = SearchIndex.build(
+        [document("english", title="hello"), document("polish", title="hello", language="pl")]
+    )
+
+    assert index.search("en", "hello") == ["english"]
+    assert index.search("pl", "hello") == ["polish"]
+    assert index.search("de", "hello") == []
+
+
+def test_updated_index_leaves_original_intact():
+    index = SearchIndex.build(
+        [document("first", title="old title"), document("second", title="old")]
+    )
+
+    updated = index.updated(
+        [document("first", title="new title"), document("third", title="new")],
+        removed=[("en", "first"), ("en", "second")],
+    )
+
+    assert updated.search("en", "old") == []
+    assert set(updated.search("en", "new")) == {"first", "third"}
+    assert updated.search("en", "title") == ["first"]
+    assert set(index.search("en", "old")) == {"first", "second"}
+    assert index.search("en", "new") == []
+
+
+def test_updated_index_is_same_as_built_one():
+    documents = [
+        document(f"post-{i}", title=f"title {i}", content=f"text {i % 3}") for i in range(6)
+    ]
+    changed = document("post-2", title="changed", content="text 0")
+
+    updated = SearchIndex.build(documents).updated([changed], removed=[("en", "post-2")])
+    built = SearchIndex.build([changed if d.slug == "post-2" else d for d in documents])
+
+    for query in ["title", "text 0", "changed", "2"]:
+        assert updated.search("en", query) == built.search("en", query)
+
+
+def test_search_among_many_posts_is_fast():
+    words = [f"word{i}" for i in range(2000)]
+    index = SearchIndex.build(
+        document(
+            f"post-{i}",
+            title=f"{words[i % 2000]} {words[i * 7 % 2000]}",
+            content=" ".join(words[(i * 13 + j) % 2000] for j in range(50)),
+        )
+        for i in range(10000)
+    )
+
+    start = time.perf_counter()
+    results = index.search("en", "word1 word2 word3", limit=20)
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == 20
+    assert elapsed < 0.1
@@ -0,0 +1,217 @@
+import datetime
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from platzky.db.db_loader import get_db_module
+from platzky.db.sqlite_db import (
+    Sqlite,
+    SqliteDbConfig,
+    db_from_config,
+    get_db,
+    import_json_data,
+    import_json_file,
+)
+from platzky.models import Post, PostSummary
+
+
+def make_post(slug, date, tags=(), language="en", comments=()):
+    return {
+        "title": slug.title(),
+        "slug": slug,
+        "author": "Author",
+        "contentInMarkdown": f"# {slug}",
+        "excerpt": f"{slug} excerpt",
+        "comments": list(comments),
+        "tags": list(tags),
+        "language": language,
+        "coverImage": {"url": f"/images/{slug}.jpg"},
+        "date": date,
+    }
+
+
+@pytest.fixture
+def sample_data():
+    comment = {"author": "Reader", "comment": "First!", "date": "2023-01-02T00:00:00"}
+    return {
+        "site_content": {
+            "app_description": {"en": "English description"},
+            "logo_url": "/logo.png",
+            "primary_color": "red",
+            "posts": [
+                make_post("old", "2023-01-01T00:00:00", tags=["tag1"], comments=[comment]),
+                make_post("new", "2023-03-01T00:00:00", tags=["tag1", "tag2"]),
+                make_post("same-day-1", "2023-02-01T00:00:00"),
+                make_post("same-day-2", "2023-02-01T00:00:00"),
+                make_post("new", "2024-01-01T00:00:00"),
+                make_post("polski", "2023-02-01T00:00:00", language="pl"),
+            ],
+            "pages": [make_post("about", "2023-01-01T00:00:00")],
+            "menu_items": {"en": [{"name": "Home", "url": "/"}, {"name": "Blog", "url": "/blog"}]},
+        },
+        "plugins": [{"name": "plugin"}],
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path, sample_data):
+    path = str(tmp_path / "content.sqlite")
+    import_json_data(sample_data, path)
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    return Sqlite(db_path)
+
+
+def wait_for_suggestions(db):
+    rebuild = db._typeahead_rebuild
+    assert rebuild is not None
+    rebuild.join(timeout=5)
+
+
+class TestFactoryFunctions:
+    def test_get_db(self, db_path):
+        db = get_db({"TYPE": "sqlite", "PATH": db_path, "TIMEOUT": 1})
+        assert isinstance(db, Sqlite)
+        assert db.timeout == 1
+
+    def test_db_from_config(self, db_path):
+        db = db_from_config(SqliteDbConfig(TYPE="sqlite", PATH=db_path))
+        assert db.path == db_path
+
+    def test_loaded_by_db_loader(self):
+        assert get_db_module("sqlite").db_config_type() is not None
+
+
+class TestImport:
+    def test_import_json_file(self, tmp_path, sample_data):
+        json_path = tmp_path / "data.json"
+        json_path.write_text(json.dumps(sample_data))
+        path = str(tmp_path / "imported.sqlite")
+
+        import_json_file(str(json_path), path)
+
+        assert Sqlite(path).get_logo_url() == "/logo.png"
+
+    def test_import_replaces_content(self, db_path, db):
+        import_json_data({"site_content": {"posts": [make_post("only", "2023-01-01")]}}, db_path)
+
+        assert [post.slug for post in db.get_all_posts("en")] == ["only"]
+        assert db.get_logo_url() == ""
+        assert db.get_plugins_data() == []
+
+    def test_first_post_with_slug_wins(self, db):
+        assert db.get_post("new").date == "2023-03-01T00:00:00"
+
+    def test_uses_write_ahead_log(self, db_path):
+        connection = sqlite3.connect(db_path)
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        connection.close()
+
+
+class TestSqlite:
+    def test_empty_database(self, tmp_path):
+        db = Sqlite(str(tmp_path / "empty.sqlite"))
+
+        assert db.get_all_posts("en") == []
+        assert db.get_app_description("en") is None
+        assert db.get_secondary_color() == "navy"
+
+    def test_get_all_posts_newest_first(self, db):
+        posts = db.get_all_posts("en")
+
+        assert [post.slug for post in posts] == ["new", "same-day-1", "same-day-2", "old"]
+        assert all(isinstance(post, Post) for post in posts)
+        assert [c.comment for c in posts[-1].comments] == ["First!"]
+
+    def test_search_suggestions_come_from_titles_and_tags(self, db):
+        suggestions = db.get_search_suggestions("en", "ne")
+        assert [(s.kind, s.target) for s in suggestions] == [("post", "new")]
+        assert [s.text for s in db.get_search_suggestions("en", "tag")] == ["tag1", "tag2"]
+        assert db.get_search_suggestions("pl", "ne") == []
+
+    def test_search_suggestions_are_read_again_after_import(self, db_path, db):
+        import_json_data({"site_content": {"posts": [make_post("only", "2023-01-01")]}}, db_path)
+
+        assert [s.target for s in db.get_search_suggestions("en", "ne")] == ["new"]
+        wait_for_suggestions(db)
+        assert db.get_search_suggestions("en", "ne") == []
+        assert [s.target for s in db.get_search_suggestions("en", "on")] == ["only"]
+
+    def test_get_post_summaries(self, db):
+        summaries = db.get_post_summaries("en", offset=1, limit=2)
+
+        assert [s.slug for s in summaries] == ["same-day-1", "same-day-2"]
+        assert all(type(summary) is PostSummary for summary in summaries)
+        assert [s.slug for s in db.get_post_summaries("en", tag="tag1")] == ["new", "old"]
+        assert [s.slug for s in db.get_post_summaries("pl")] == ["polski"]
+
+    def test_get_post_summaries_between(self, db):
+        february = (datetime.date(2023, 2, 1), datetime.date(2023, 3, 1))
+
+        summaries = db.get_post_summaries_between("en", *february)
+        assert [s.slug for s in summaries] == ["same-day-1", "same-day-2"]
+        assert [s.slug for s in db.get_post_summaries_between("en", *february, offset=1)] == [
+            "same-day-2"
+        ]
+        year = (datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        assert len(db.get_post_summaries_between("en", *year, limit=3)) == 3
+        assert [s.slug for s in db.get_post_summaries_between("pl", *february)] == ["polski"]
+
+    def test_get_post(self, db):
+        post = db.get_post("old")
+
+        assert post.contentInMarkdown == "# old"
+        assert post.tags == ["tag1"]
+        assert post.coverImage.url == "/images/old.jpg"
+        with pytest.raises(ValueError, match="Post with slug missing not found"):
+            db.get_post("missing")
+
+    def test_get_posts_by_slugs(self, db):
+        posts = db.get_posts_by_slugs(["same-day-2", "missing", "old", "polski"])
+
+        assert [post.slug for post in posts] == ["same-day-2", "old", "polski"]
+        assert [c.comment for c in posts[1].comments] == ["First!"]
+        assert db.get_posts_by_slugs(iter([])) == []
+
+    def test_get_posts_by_tag(self, db):
+        assert [post["slug"] for post in db.get_posts_by_tag("tag1", "en")] == ["new", "old"]
+        assert list(db.get_posts_by_tag("tag1", "pl")) == []
+
+    def test_get_page(self, db):
+        assert db.get_page("about").title == "About"
+        with pytest.raises(StopIteration):
+            db.get_page("missing")
+
+    def test_settings(self, db):
+        assert db.get_app_description("en") == "English description"
+        assert db.get_logo_url() == "/logo.png"
+        assert db.get_primary_color() == "red"
+        assert db.get_font() == ""
+        assert [item.name for item in db.get_menu_items_in_lang("en")] == ["Home", "Blog"]
+        assert db.get_plugins_data() == [{"name": "plugin"}]
+
+    def test_add_comment(self, db_path, db):
+        db.add_comment("Commenter", "Nice!", "new")
+
+        assert [c.comment for c in Sqlite(db_path).get_post("new").comments] == ["Nice!"]
+
+    def test_add_comment_to_missing_post(self, db):
+        with pytest.raises(StopIteration):
+            db.add_comment("Commenter", "Nice!", "missing")
+
+    def test_add_comment_from_many_threads(self, db):
+        threads = [
+            threading.Thread(target=db.add_comment, args=("Commenter", str(i), "old"))
+            for i in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(db.get_post("old").comments) == 11
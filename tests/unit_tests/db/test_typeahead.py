@@ -0,0 +1,69 @@
+import time
+
+from platzky.db.search_index import SearchDocument
+from platzky.db.typeahead import Suggestion, TypeaheadIndex
+
+
+def document(slug, title, tags=(), language="en"):
+    return SearchDocument(slug, language, title, "", tuple(tags), "")
+
+
+def test_suggests_titles_and_tags_by_prefix_of_any_word():
+    index = TypeaheadIndex.build(
+        [
+            document("marketing", "Email marketing", tags=["newsletter"]),
+            document("mail", "Mail servers", tags=["email"]),
+            document("cooking", "Cooking pasta"),
+        ]
+    )
+
+    assert index.suggest("en", "EMA") == [
+        Suggestion("tag", "email", "email"),
+        Suggestion("post", "Email marketing", "marketing"),
+    ]
+    assert index.suggest("en", "ma") == [
+        Suggestion("post", "Mail servers", "mail"),
+        Suggestion("post", "Email marketing", "marketing"),
+    ]
+    assert index.suggest("en", "email  mark") == [
+        Suggestion("post", "Email marketing", "marketing")
+    ]
+    assert index.suggest("en", "news") == [Suggestion("tag", "newsletter", "newsletter")]
+    assert index.suggest("en", "xyz") == []
+
+
+def test_each_suggestion_is_listed_once():
+    index = TypeaheadIndex.build(
+        [
+            document("first", "Tips and tricks", tags=["tips"]),
+            document("second", "Other", tags=["tips"]),
+        ]
+    )
+
+    assert index.suggest("en", "t") == [
+        Suggestion("tag", "tips", "tips"),
+        Suggestion("post", "Tips and tricks", "first"),
+    ]
+    assert index.suggest("en", "t", limit=1) == [Suggestion("tag", "tips", "tips")]
+
+
+def test_no_suggestions_for_empty_prefix_or_other_language():
+    index = TypeaheadIndex.build([document("post", "Hello", language="pl")])
+
+    assert index.suggest("pl", "") == []
+    assert index.suggest("pl", " ,") == []
+    assert index.suggest("pl", "hel", limit=0) == []
+    assert index.suggest("en", "hel") == []
+
+
+def test_suggestions_among_many_posts_are_fast():
+    index = TypeaheadIndex.build(
+        document(f"post-{i}", f"title {i} of post", tags=[f"tag{i % 100}"]) for i in range(20000)
+    )
+
+    start = time.perf_counter()
+    for prefix in ["t", "ti", "title 1", "tag", "of", "p"]:
+        assert len(index.suggest("en", prefix)) == 10
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.05
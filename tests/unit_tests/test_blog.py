@@ -4,6 +4,7 @@
 # Most of those tests just check if some content is displayed and if response code is as it should
 # These should also check how data is formatted, checked for multiple elements, etc.
 
+import datetime
 from unittest.mock import MagicMock
 
 import pytest
@@ -11,6 +12,7 @@ from freezegun import freeze_time
 
 from platzky.blog import blog
 from platzky.config import Config
+from platzky.db.typeahead import Suggestion
 from platzky.models import Comment, Image, Post
 from platzky.platzky import create_engine
 
@@ -45,6 +47,8 @@ def test_app():
     db_mock.get_post.return_value = mocked_post
     db_mock.get_posts_by_tag.return_value = [mocked_post]
     db_mock.get_all_posts.return_value = [mocked_post]
+    db_mock.get_post_summaries.return_value = [mocked_post]
+    db_mock.get_related_posts.return_value = []
     config = Config.model_validate(
         {
             "BLOG_PREFIX": "/prefix",  # TODO test without prefix in config (same for seo tests)
@@ -106,6 +110,38 @@ def test_all_posts(test_app):
     assert not post_contents_on_page(response)
 
 
+def test_all_posts_without_posts(test_app):
+    test_app.application.db.get_post_summaries.return_value = []
+    response = test_app.get("/prefix/")
+    assert response.status_code == 404
+
+
+def test_all_posts_pagination(test_app):
+    db = test_app.application.db
+    db.get_post_summaries.return_value = [mocked_post] * 21
+
+    response = test_app.get("/prefix/?page=2")
+
+    assert response.status_code == 200
+    assert response.data.count(b"post title") == 20
+    assert b'href="/prefix/?page=1"' in response.data
+    assert b'href="/prefix/?page=3"' in response.data
+    db.get_post_summaries.assert_called_with("en", 20, 21)
+
+
+def test_last_page_has_no_next_link(test_app):
+    response = test_app.get("/prefix/")
+    assert response.status_code == 200
+    assert b'rel="next"' not in response.data
+    assert b'rel="prev"' not in response.data
+
+
+def test_page_past_the_end(test_app):
+    test_app.application.db.get_post_summaries.return_value = []
+    response = test_app.get("/prefix/tag/tag1?page=5")
+    assert response.status_code == 404
+
+
 def test_tag_filter(test_app):
     response = test_app.get("/prefix/tag/tag1")
     assert response.status_code == 200
@@ -114,6 +150,117 @@ def test_tag_filter(test_app):
     assert not post_contents_on_page(response)
 
 
+def test_tag_filter_pagination(test_app):
+    db = test_app.application.db
+    db.get_post_summaries.return_value = [mocked_post] * 21
+
+    response = test_app.get("/prefix/tag/tag1")
+
+    assert b'href="/prefix/tag/tag1?page=2"' in response.data
+    db.get_post_summaries.assert_called_with("en", 0, 21, tag="tag1")
+
+
+def test_empty_tag_page(test_app):
+    test_app.application.db.get_post_summaries.return_value = []
+    response = test_app.get("/prefix/tag/tag1")
+    assert response.status_code == 200
+
+
+def test_search(test_app):
+    db = test_app.application.db
+    db.search_posts.return_value = [mocked_post] * 21
+
+    response = test_app.get("/prefix/search?q=some+content&page=2")
+
+    assert response.status_code == 200
+    assert response.data.count(b"post title") == 20
+    assert b'value="some content"' in response.data
+    assert b'href="/prefix/search?q=some+content&amp;page=3"' in response.data
+    db.search_posts.assert_called_with("en", "some content", 20, 21)
+
+
+def test_search_without_results(test_app):
+    test_app.application.db.search_posts.return_value = []
+    response = test_app.get("/prefix/search?q=nothing")
+    assert response.status_code == 200
+    assert b"No posts match your search." in response.data
+
+
+def test_search_without_query(test_app):
+    response = test_app.get("/prefix/search")
+    assert response.status_code == 200
+    test_app.application.db.search_posts.assert_not_called()
+
+
+def test_search_suggestions(test_app):
+    db = test_app.application.db
+    db.get_search_suggestions.return_value = [
+        Suggestion("post", "post title", "slug"),
+        Suggestion("tag", "tag/1", "tag/1"),
+    ]
+
+    response = test_app.get("/prefix/search/suggestions?q=po&limit=100")
+
+    assert response.status_code == 200
+    assert response.json == [
+        {"type": "post", "text": "post title", "url": "/prefix/slug"},
+        {"type": "tag", "text": "tag/1", "url": "/prefix/tag/tag/1"},
+    ]
+    db.get_search_suggestions.assert_called_with("en", "po", 20)
+
+
+def test_post_with_related_posts(test_app):
+    related_post = mocked_post.model_copy(update={"slug": "related", "title": "Related title"})
+    test_app.application.db.get_related_posts.return_value = [related_post]
+
+    response = test_app.get("/prefix/slug")
+
+    assert b"Related posts" in response.data
+    assert b'<a href="/prefix/related">Related title</a>' in response.data
+    test_app.application.db.get_related_posts.assert_called_with("en", "slug")
+
+
+def test_post_without_related_posts(test_app):
+    response = test_app.get("/prefix/slug")
+    assert b"Related posts" not in response.data
+
+
+def test_archive_of_year(test_app):
+    db = test_app.application.db
+    db.get_post_summaries_between.return_value = [mocked_post] * 21
+
+    response = test_app.get("/prefix/archive/2021")
+
+    assert response.status_code == 200
+    assert b'href="/prefix/archive/2021?page=2"' in response.data
+    db.get_post_summaries_between.assert_called_with(
+        "en", datetime.date(2021, 1, 1), datetime.date(2022, 1, 1), 0, 21
+    )
+
+
+@pytest.mark.parametrize(
+    "month, start, end",
+    [
+        (2, datetime.date(2021, 2, 1), datetime.date(2021, 3, 1)),
+        (12, datetime.date(2021, 12, 1), datetime.date(2022, 1, 1)),
+    ],
+)
+def test_archive_of_month(test_app, month, start, end):
+    db = test_app.application.db
+    db.get_post_summaries_between.return_value = []
+
+    response = test_app.get(f"/prefix/archive/2021/{month}")
+
+    assert response.status_code == 200
+    db.get_post_summaries_between.assert_called_with("en", start, end, 0, 21)
+
+
+@pytest.mark.parametrize("path", ["/prefix/archive/2021/13", "/prefix/archive/0"])
+def test_archive_of_invalid_period(test_app, path):
+    assert test_app.get(path).status_code == 404
+    test_app.application.db.get_post_summaries_between.assert_not_called()
+
+
 def test_posting_new_comment(test_app):
     fresh_comment_content = "Fresh comment"
     response = test_app.post(
@@ -1,6 +1,18 @@
+import dataclasses
+import datetime
+
 import pytest
+from freezegun import freeze_time
 
-from platzky.models import Color, Image, Post
+from platzky.models import (
+    Color,
+    Comment,
+    CompactPost,
+    Image,
+    Post,
+    PostSummary,
+    parse_comment_date,
+)
 
 
 def test_posts_are_sorted_by_date():
@@ -65,3 +77,59 @@ def test_color_values():
         Color(r=0, g=0, b=0, a=256)
 
     _ = Color(r=10, g=200, b=50, a=250)
+
+
+def make_post(**overrides):
+    fields = {
+        "author": "author",
+        "slug": "slug",
+        "title": "title",
+        "contentInMarkdown": "content",
+        "comments": [{"author": "reader", "comment": "nice", "date": "2021-02-20T10:00:00.123Z"}],
+        "excerpt": "excerpt",
+        "tags": ["tag"],
+        "language": "en",
+        "coverImage": {"url": "/cover.jpg", "alternateText": "cover"},
+        "date": "2021-02-19T12:30:00",
+    }
+    return Post.model_validate({**fields, **overrides})
+
+
+def test_compact_post_round_trips_to_same_models():
+    post = make_post()
+    compact = CompactPost.from_post(post)
+
+    assert compact.to_post() == post
+    assert compact.to_summary() == PostSummary.model_validate(post.model_dump())
+    assert compact.published == datetime.datetime(2021, 2, 19, 12, 30)
+
+
+def test_compact_posts_share_repeated_strings():
+    first = CompactPost.from_post(make_post(language="".join(["e", "n"])))
+    second = CompactPost.from_post(make_post(tags=["".join(["t", "ag"])]))
+
+    assert first.language is second.language
+    assert first.tags[0] is second.tags[0]
+    assert first.comments[0].author is second.comments[0].author
+
+
+def test_compact_post_with_date_which_is_not_iso():
+    assert CompactPost.from_post(make_post(date="yesterday")).published is None
+
+
+def test_compact_post_is_read_only_and_slotted():
+    compact = CompactPost.from_post(make_post())
+
+    assert not hasattr(compact, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        compact.title = "new title"  # type: ignore[misc]
+
+
+@freeze_time("2021-02-20 12:00:00")
+def test_comment_time_delta_parses_date_once():
+    comment = Comment(author="reader", comment="nice", date="2021-02-20T10:00:00.123Z")
+    parse_comment_date.cache_clear()
+
+    assert comment.time_delta == "2 hours ago"
+    assert comment.time_delta == "2 hours ago"
+    assert parse_comment_date.cache_info().misses == 1
@@ -23,7 +23,7 @@ def test_config_creation_with_incorrect_mappings():
 
 def test_sitemap():
     db_mock = MagicMock()
-    db_mock.get_all_posts.return_value = [
+    db_mock.get_post_summaries.return_value = [
         Post(
             title="title",
             language="en",